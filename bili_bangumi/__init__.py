@@ -20,7 +20,10 @@ plugin_config = get_plugin_config(Config)
 
 # 尝试导入 htmlrender
 try:
-    from nonebot_plugin_htmlrender import html_to_pic
+    try:
+        from ..render_pool import html_to_pic
+    except ImportError:
+        from nonebot_plugin_htmlrender import html_to_pic
 except ImportError:
     html_to_pic = None
 
@@ -1,4 +1,4 @@
-from nonebot import on_command, logger, require
+from nonebot import on_command, get_driver, get_plugin_config, logger, require
 from nonebot.exception import FinishedException, MatcherException
 require("nonebot_plugin_htmlrender")
 
@@ -8,6 +8,8 @@ from nonebot.plugin import PluginMetadata
 import httpx
 import re
 from datetime import datetime
+from .browser import BrowserPool
+from .config import Config
 from .crawler import FiveEEventCrawler, FiveECrawler, PWCrawler
 from .renderer import (
     render_events_card, 
@@ -21,8 +23,12 @@ __plugin_meta__ = PluginMetadata(
     name="CS Pro & 5E Stats",
     description="查询 CS 职业选手信息、5E 平台战绩及热门赛事",
     usage="cs查询 [选手名] | cs赛事 | 5e [ID/昵称] | pw [ID/昵称] | pwlogin [手机号] [验证码]",
+    config=Config,
 )
 
+plugin_config = get_plugin_config(Config)
+driver = get_driver()
+
 # Commands
 cs_search = on_command("cs查询", aliases={"cs选手", "csplayer"}, priority=5, block=True)
 game_search = on_command("cs赛事", aliases={"赛事", "csgo赛事", "cs2赛事"}, priority=5, block=True)
@@ -31,10 +37,21 @@ pw_stats = on_command("pw", aliases={"pw战绩", "pw查询", "完美战绩"}, pr
 pw_login = on_command("pwlogin", aliases={"完美登录"}, priority=5, block=True)
 
 # Shared Crawler Instances
-event_crawler = FiveEEventCrawler()
-five_e_crawler = FiveECrawler()
+# 5E 的爬虫共用常驻浏览器，不再每次查询都启动一个新的 Chromium
+browser_pool = BrowserPool(
+    size=plugin_config.cs_pro_browser_contexts,
+    max_queue=plugin_config.cs_pro_browser_max_queue,
+    max_uses=plugin_config.cs_pro_context_max_uses,
+)
+event_crawler = FiveEEventCrawler(browser_pool)
+five_e_crawler = FiveECrawler(browser_pool)
 pw_crawler = PWCrawler()
 
+@driver.on_shutdown
+async def _close_browser():
+    await five_e_crawler.close()
+    await browser_pool.close()
+
 @cs_search.handle()
 async def handle_cs_search(args: Message = CommandArg()):
     query = args.extract_plain_text().strip()
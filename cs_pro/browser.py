@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from nonebot import logger
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
+
+try:
+    from nonebot_plugin_htmlrender import get_browser
+except ImportError:
+    get_browser = None
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+class BrowserBusy(Exception):
+    """排队中的抓取请求已达上限"""
+
+
+class _Slot:
+    def __init__(self, browser: Browser, context: BrowserContext):
+        self.browser = browser
+        self.context = context
+        self.uses = 0
+
+
+class BrowserPool:
+    """爬虫共用的常驻浏览器与一组可复用的上下文
+
+    优先复用 htmlrender 已经启动的 Chromium，没有时自行启动一个常驻实例。
+    每次抓取在空闲上下文中新开一个页面，用完关闭页面、保留上下文；
+    上下文复用 max_uses 次、抓取出错或浏览器崩溃后重建。
+    """
+
+    def __init__(self, size: int = 2, max_queue: int = 20, max_uses: int = 50):
+        self.size = max(1, size)
+        self.max_queue = max_queue
+        self.max_uses = max_uses
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._waiting = 0
+        self._idle: List[_Slot] = []
+        self._lock = asyncio.Lock()
+        self._playwright: Optional[Playwright] = None
+        self._own_browser: Optional[Browser] = None
+
+    async def _browser(self) -> Browser:
+        if get_browser is not None:
+            return await get_browser()
+        async with self._lock:
+            if self._own_browser is None or not self._own_browser.is_connected():
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                self._own_browser = await self._playwright.chromium.launch(headless=True)
+            return self._own_browser
+
+    async def _new_slot(self) -> _Slot:
+        browser = await self._browser()
+        context = await browser.new_context(user_agent=USER_AGENT)
+        return _Slot(browser, context)
+
+    async def _discard(self, slot: _Slot):
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+
+    async def _acquire(self) -> _Slot:
+        while self._idle:
+            slot = self._idle.pop()
+            if slot.browser.is_connected():
+                return slot
+            await self._discard(slot)
+        return await self._new_slot()
+
+    @asynccontextmanager
+    async def page(self):
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            raise BrowserBusy("查询人数过多，请稍后再试")
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        slot: Optional[_Slot] = None
+        ok = False
+        try:
+            slot = await self._acquire()
+            page: Page = await slot.context.new_page()
+            try:
+                yield page
+                ok = True
+            finally:
+                try:
+                    await page.close()
+                except Exception:
+                    ok = False
+        finally:
+            if slot:
+                slot.uses += 1
+                if not ok or slot.uses >= self.max_uses or not slot.browser.is_connected():
+                    await self._discard(slot)
+                else:
+                    self._idle.append(slot)
+            self._semaphore.release()
+
+    async def close(self):
+        for slot in self._idle:
+            await self._discard(slot)
+        self._idle.clear()
+        if self._own_browser is not None:
+            try:
+                await self._own_browser.close()
+            except Exception as e:
+                logger.warning(f"CS 查询：关闭浏览器失败: {e}")
+            self._own_browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
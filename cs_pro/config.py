@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+class Config(BaseModel):
+    # 爬虫使用的常驻浏览器上下文数量，同时也是最大并发抓取数
+    cs_pro_browser_contexts: int = 2
+    # 排队中的抓取请求上限，超出后直接拒绝
+    cs_pro_browser_max_queue: int = 20
+    # 单个上下文复用多少次后重建（会清空 Cookie 与缓存）
+    cs_pro_context_max_uses: int = 50
@@ -1,30 +1,107 @@
 import asyncio
 import httpx
-from playwright.async_api import async_playwright
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set
 import logging
 import urllib.parse
 import json
 import os
 from pathlib import Path
 
+from .browser import USER_AGENT, BrowserPool
+
 logger = logging.getLogger("nonebot")
 DATA_PATH = Path("data/cs_pro")
 DATA_PATH.mkdir(parents=True, exist_ok=True)
 PW_SESSION_FILE = DATA_PATH / "pw_session.json"
+# 浏览器路径中学到的 5E 接口请求模板
+FIVE_E_API_FILE = DATA_PATH / "5e_api.json"
+
+# 5E 玩家页加载的 JSON 接口：数据类别 -> URL 特征，顺序即浏览器路径中的判断顺序
+PLAYER_APIS = {
+    "career": "player_career",
+    "best_season": "player/best_season",
+    "home": "player/home",
+    "role": "role_position",
+    "matches": "player_match",
+}
+
+# 不写入接口模板的请求头：鉴权、会话相关的值属于当前浏览器，不能落盘也不能给所有人复用
+_SKIP_HEADERS = ("cookie", "content-length", "host", "user-agent", "referer")
+_SENSITIVE_HEADER_PARTS = ("auth", "token", "cookie", "session", "secret", "ticket", "sign")
+
+def _keep_header(name: str) -> bool:
+    name = name.lower()
+    if name.startswith(":") or name in _SKIP_HEADERS:
+        return False
+    return not any(part in name for part in _SENSITIVE_HEADER_PARTS)
+
+def _player_api_kind(url: str) -> Optional[str]:
+    for kind, marker in PLAYER_APIS.items():
+        if marker in url:
+            return kind
+    return None
+
+def _map_role(role_data: Dict[str, Any]) -> Dict[str, Any]:
+    # Map API keys to template keys if necessary
+    return {
+        "role_name": role_data.get("role_name") or role_data.get("name"),
+        "role_icon": role_data.get("role_icon") or role_data.get("icon"),
+        "role_desc": role_data.get("role_desc") or role_data.get("description"),
+        "role_tags": role_data.get("role_tags") or role_data.get("tags") or [],
+        "player_template_name": role_data.get("player_template_name") or role_data.get("tpl_name") or role_data.get("template_name"),
+        "score_level": role_data.get("score_level") or role_data.get("level_name") or role_data.get("level"),
+        "score": role_data.get("score"),
+        "rarity": role_data.get("rarity")
+    }
+
+def _apply_player_response(kind: str, data: Any, player_data: Dict[str, Any]) -> bool:
+    """把一个接口的返回写入 player_data，返回结构不符合预期时返回 False"""
+    if not isinstance(data, dict) or not isinstance(data.get("data"), dict):
+        return False
+    payload = data["data"]
+    stats = player_data["stats"]
+    if kind == "career":
+        stats["career"] = payload.get("career_data", {})
+        # Fallback for role data if present in career
+        role_data = payload.get("role")
+        if not stats.get("role") and isinstance(role_data, dict) and (role_data.get("role_name") or role_data.get("name")):
+            stats["role"] = _map_role(role_data)
+    elif kind == "best_season":
+        stats["best_season"] = payload
+    elif kind == "home":
+        stats["home"] = payload
+        # Fallback for role data if present in home info
+        role_data = payload.get("role")
+        if not stats.get("role") and isinstance(role_data, dict) and (role_data.get("role_name") or role_data.get("name")):
+            stats["role"] = _map_role(role_data)
+    elif kind == "role":
+        mapped_role = _map_role(payload)
+        # Only set if we have a role name
+        if mapped_role["role_name"]:
+            stats["role"] = mapped_role
+            logger.info(f"Captured role data: {mapped_role['role_name']}")
+    elif kind == "matches":
+        stats["recent_matches"] = payload.get("match_data", [])[:5]
+        # Extract nickname and avatar from inferred_info if available
+        inferred = payload.get("inferred_info", {})
+        if inferred:
+            if inferred.get("nickname"):
+                player_data["nickname"] = inferred["nickname"]
+            if inferred.get("avatar"):
+                avatar = inferred["avatar"]
+                if avatar.startswith('//'):
+                    avatar = 'https:' + avatar
+                player_data["avatar"] = avatar
+    return True
 
 class FiveEEventCrawler:
-    def __init__(self):
+    def __init__(self, pool: BrowserPool):
+        self.pool = pool
         self.events_url = "https://event.5eplay.com/csgo/events"
         self.matches_url = "https://event.5eplay.com/csgo/matches?grade=1%2C7%2C2%2C3%2C8%2C9"
 
     async def get_matches(self) -> List[Dict[str, Any]]:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
-            )
-            page = await context.new_page()
+        async with self.pool.page() as page:
             
             try:
                 await page.goto(self.matches_url, wait_until="networkidle", timeout=30000)
@@ -73,16 +150,9 @@ class FiveEEventCrawler:
             except Exception as e:
                 logger.error(f"Error crawling 5E matches: {e}")
                 return []
-            finally:
-                await browser.close()
 
     async def get_events(self) -> List[Dict[str, Any]]:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
-            )
-            page = await context.new_page()
+        async with self.pool.page() as page:
             
             try:
                 await page.goto(self.events_url, wait_until="networkidle", timeout=30000)
@@ -168,24 +238,22 @@ class FiveEEventCrawler:
             except Exception as e:
                 logger.error(f"Error crawling 5E events: {e}")
                 return []
-            finally:
-                await browser.close()
 
 class FiveECrawler:
-    def __init__(self):
+    def __init__(self, pool: BrowserPool):
+        self.pool = pool
         self.base_url = "https://arena-next.5eplaycdn.com/home/personalInfo?domain={domain}&uuid=null"
         self.search_url = "https://arena.5eplay.com/search?keywords={keywords}"
+        self._client: Optional[httpx.AsyncClient] = None
+        # 上次浏览器成功查询时页面请求过的接口类别；None 表示未知（旧格式文件），需要先走一次浏览器
+        self.api_kinds: Optional[Set[str]] = None
+        self.api_templates = self._load_api_templates()
         
     async def search_player(self, keywords: str):
         """
         Search for players by keywords and return a list of potential domains.
         """
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            )
-            page = await context.new_page()
+        async with self.pool.page() as page:
             
             url = self.search_url.format(keywords=urllib.parse.quote(keywords))
             await page.goto(url, wait_until="networkidle")
@@ -220,16 +288,121 @@ class FiveECrawler:
                 return results;
             }""")
             
-            await browser.close()
             return users
 
+    def _load_api_templates(self) -> Dict[str, Dict[str, Any]]:
+        if not FIVE_E_API_FILE.exists():
+            return {}
+        try:
+            with open(FIVE_E_API_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading 5E API templates: {e}")
+            return {}
+        if "templates" in data:
+            templates = data["templates"]
+            self.api_kinds = set(data.get("kinds") or [])
+        else:
+            templates = data
+        # 旧版本可能记下了鉴权请求头，读取时一并去掉
+        for tpl in templates.values():
+            tpl["headers"] = {k: v for k, v in (tpl.get("headers") or {}).items() if _keep_header(k)}
+        return templates
+
+    def _save_api_templates(self):
+        try:
+            tmp = FIVE_E_API_FILE.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"kinds": sorted(self.api_kinds or []), "templates": self.api_templates},
+                    f, ensure_ascii=False, indent=4,
+                )
+            tmp.replace(FIVE_E_API_FILE)
+        except Exception as e:
+            logger.error(f"Error saving 5E API templates: {e}")
+
+    def _api_ready(self) -> bool:
+        """浏览器路径拿到过的每一类数据都有模板时才走直连，否则结果会缺少部分数据"""
+        return (
+            self.api_kinds is not None
+            and "career" in self.api_templates
+            and self.api_kinds <= self.api_templates.keys()
+        )
+
+    def get_client(self) -> httpx.AsyncClient:
+        """直连接口共用一个连接池"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=5,
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+
     async def get_player_data(self, domain: str):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        """优先直接请求 JSON 接口，接口未知、失败或返回结构变化时回退到浏览器"""
+        if self._api_ready():
+            try:
+                player_data = await self._get_player_data_api(domain)
+                if player_data["stats"].get("career"):
+                    return player_data
+                logger.warning(f"5E API returned no career data for {domain}, falling back to browser")
+            except Exception as e:
+                logger.warning(f"5E API fast path failed for {domain}: {e}, falling back to browser")
+        return await self._get_player_data_browser(domain)
+
+    async def _get_player_data_api(self, domain: str) -> Dict[str, Any]:
+        client = self.get_client()
+
+        async def call(kind: str):
+            tpl = self.api_templates[kind]
+            url = tpl["url"].replace("{domain}", domain)
+            body = tpl.get("body")
+            resp = await client.request(
+                tpl["method"],
+                url,
+                headers=tpl.get("headers") or {},
+                content=body.replace("{domain}", domain).encode() if body else None,
             )
-            page = await context.new_page()
+            resp.raise_for_status()
+            return resp.json()
+
+        kinds = [kind for kind in PLAYER_APIS if kind in self.api_templates]
+        results = await asyncio.gather(*(call(kind) for kind in kinds), return_exceptions=True)
+
+        player_data = {"nickname": "Unknown", "avatar": "", "stats": {}}
+        # 按固定顺序应用，保持与浏览器路径相同的覆盖关系（role_position 优先）
+        for kind, result in zip(kinds, results):
+            if isinstance(result, Exception):
+                logger.warning(f"5E API {kind} failed for {domain}: {result}")
+                continue
+            _apply_player_response(kind, result, player_data)
+        return player_data
+
+    def _learn_api(self, kind: str, request, domain: str) -> bool:
+        """记下浏览器实际发出的请求，把玩家域名替换为占位符，供之后直接调用；模板有变化时返回 True"""
+        url = request.url
+        body = request.post_data
+        if domain not in url and not (body and domain in body):
+            return False
+        headers = {k: v for k, v in request.headers.items() if _keep_header(k)}
+        template = {
+            "method": request.method,
+            "url": url.replace(domain, "{domain}"),
+            "body": body.replace(domain, "{domain}") if body else None,
+            "headers": headers,
+        }
+        if self.api_templates.get(kind) == template:
+            return False
+        self.api_templates[kind] = template
+        return True
+
+    async def _get_player_data_browser(self, domain: str):
+        async with self.pool.page() as page:
             
             player_data = {
                 "nickname": "Unknown",
@@ -237,99 +410,25 @@ class FiveECrawler:
                 "stats": {}
             }
             
+            learned = []
+            produced = set()
+
             # Listen for API responses
             async def handle_response(response):
-                # logger.debug(f"Response: {response.url}")
-                if "player_career" in response.url:
-                    try:
-                        data = await response.json()
-                        career_data = data.get("data", {}).get("career_data", {})
-                        player_data["stats"]["career"] = career_data
-                        
-                        # Fallback for role data if present in career
-                        if not player_data["stats"].get("role") and data.get("data", {}).get("role"):
-                            role_data = data.get("data", {}).get("role")
-                            if role_data.get("role_name") or role_data.get("name"):
-                                player_data["stats"]["role"] = {
-                                    "role_name": role_data.get("role_name") or role_data.get("name"),
-                                    "role_icon": role_data.get("role_icon") or role_data.get("icon"),
-                                    "role_desc": role_data.get("role_desc") or role_data.get("description"),
-                                    "role_tags": role_data.get("role_tags") or role_data.get("tags") or [],
-                                    "player_template_name": role_data.get("player_template_name") or role_data.get("tpl_name"),
-                                    "score_level": role_data.get("score_level") or role_data.get("level_name"),
-                                    "score": role_data.get("score"),
-                                    "rarity": role_data.get("rarity")
-                                }
-                    except:
-                        pass
-                elif "player/best_season" in response.url:
-                    try:
-                        data = await response.json()
-                        player_data["stats"]["best_season"] = data.get("data", {})
-                    except:
-                        pass
-                elif "player/home" in response.url:
-                    try:
-                        data = await response.json()
-                        home_data = data.get("data", {})
-                        player_data["stats"]["home"] = home_data
-                        
-                        # Fallback for role data if present in home info
-                        if not player_data["stats"].get("role") and home_data.get("role"):
-                            role_data = home_data.get("role")
-                            if role_data.get("role_name") or role_data.get("name"):
-                                player_data["stats"]["role"] = {
-                                    "role_name": role_data.get("role_name") or role_data.get("name"),
-                                    "role_icon": role_data.get("role_icon") or role_data.get("icon"),
-                                    "role_desc": role_data.get("role_desc") or role_data.get("description"),
-                                    "role_tags": role_data.get("role_tags") or role_data.get("tags") or [],
-                                    "player_template_name": role_data.get("player_template_name") or role_data.get("tpl_name"),
-                                    "score_level": role_data.get("score_level") or role_data.get("level_name"),
-                                    "score": role_data.get("score"),
-                                    "rarity": role_data.get("rarity")
-                                }
-                    except:
-                        pass
-                elif "role_position" in response.url:
-                    try:
-                        resp_data = await response.json()
-                        role_data = resp_data.get("data")
-                        if role_data and isinstance(role_data, dict):
-                            # Map API keys to template keys if necessary
-                            mapped_role = {
-                                "role_name": role_data.get("role_name") or role_data.get("name"),
-                                "role_icon": role_data.get("role_icon") or role_data.get("icon"),
-                                "role_desc": role_data.get("role_desc") or role_data.get("description"),
-                                "role_tags": role_data.get("role_tags") or role_data.get("tags") or [],
-                                "player_template_name": role_data.get("player_template_name") or role_data.get("tpl_name") or role_data.get("template_name"),
-                                "score_level": role_data.get("score_level") or role_data.get("level_name") or role_data.get("level"),
-                                "score": role_data.get("score"),
-                                "rarity": role_data.get("rarity")
-                            }
-                            # Only set if we have a role name
-                            if mapped_role["role_name"]:
-                                player_data["stats"]["role"] = mapped_role
-                                logger.info(f"Captured role data: {mapped_role['role_name']}")
-                    except Exception as e:
-                        logger.error(f"Error parsing role_position: {e}")
-                elif "player_match" in response.url:
-                    try:
-                        data = await response.json()
-                        matches = data.get("data", {}).get("match_data", [])
-                        player_data["stats"]["recent_matches"] = matches[:5]
-                        
-                        # Extract nickname and avatar from inferred_info if available
-                        inferred = data.get("data", {}).get("inferred_info", {})
-                        if inferred:
-                            if inferred.get("nickname"):
-                                player_data["nickname"] = inferred["nickname"]
-                            if inferred.get("avatar"):
-                                avatar = inferred["avatar"]
-                                if avatar.startswith('//'):
-                                    avatar = 'https:' + avatar
-                                player_data["avatar"] = avatar
-                    except:
-                        pass
+                kind = _player_api_kind(response.url)
+                if not kind:
+                    return
+                try:
+                    data = await response.json()
+                except Exception:
+                    return
+                try:
+                    if _apply_player_response(kind, data, player_data):
+                        produced.add(kind)
+                        if self._learn_api(kind, response.request, domain):
+                            learned.append(kind)
+                except Exception as e:
+                    logger.error(f"Error parsing {kind}: {e}")
 
             page.on("response", handle_response)
             
@@ -367,8 +466,13 @@ class FiveECrawler:
                         player_data["avatar"] = src
             except:
                 pass
+
+            # 只有拿到生涯数据的那次才更新接口模板，避免把失败的请求记下来
+            if player_data["stats"].get("career") and (learned or produced != self.api_kinds):
+                self.api_kinds = produced
+                self._save_api_templates()
+                logger.info(f"Learned 5E API endpoints: {', '.join(self.api_templates)}")
                 
-            await browser.close()
             return player_data
 
 class PWCrawler:
@@ -6,7 +6,10 @@ from nonebot import require
 from typing import List, Dict, Any
 
 require("nonebot_plugin_htmlrender")
-from nonebot_plugin_htmlrender import html_to_pic
+try:
+    from ..render_pool import html_to_pic
+except ImportError:
+    from nonebot_plugin_htmlrender import html_to_pic
 
 TEMPLATE_PATH = Path(__file__).parent / "templates"
 env = Environment(loader=FileSystemLoader(TEMPLATE_PATH))
@@ -1,75 +1,104 @@
-import aiosqlite
 import json
 import time
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Any
 
-from nonebot import on_message, on_command, logger, require, get_driver
+from nonebot import on_message, on_command, logger, require, get_driver, get_plugin_config
 from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, MessageSegment, Message
 from nonebot.plugin import PluginMetadata
 from nonebot.exception import FinishedException
 
+require("nonebot_plugin_apscheduler")
 require("nonebot_plugin_htmlrender")
+from nonebot_plugin_apscheduler import scheduler
 from nonebot_plugin_htmlrender import md_to_pic
 
+from .config import Config
+from .storage import MessageStore
+from .report import PERIODS, build_period_report, build_period_html
+
+try:
+    from ..message_store import subscribe
+except ImportError:
+    subscribe = None
+
 __plugin_meta__ = PluginMetadata(
     name="群活跃报告",
     description="统计群聊活跃度并生成可视化报告",
-    usage="/活跃报告 [今日/本周]",
+    usage="/活跃报告 [今日/本周/30天/90天/365天]",
+    config=Config,
 )
 
+plugin_config = get_plugin_config(Config)
+
 # 数据库路径
-DB_PATH = Path("data/analytics.db")
+DB_PATH = Path(plugin_config.group_analytics_db_path)
 DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 # --- 数据库操作 ---
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS message_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                group_id INTEGER,
-                user_id INTEGER,
-                nickname TEXT,
-                timestamp INTEGER
-            )
-        """)
-        await db.commit()
+store = MessageStore(
+    DB_PATH,
+    batch_size=plugin_config.group_analytics_batch_size,
+    flush_interval_ms=plugin_config.group_analytics_flush_interval_ms,
+    queue_max=plugin_config.group_analytics_queue_max,
+    raw_log=subscribe is None,
+)
 
 @get_driver().on_startup
 async def _init():
-    await init_db()
+    await store.start()
+
+@get_driver().on_shutdown
+async def _close():
+    await store.stop()
 
 async def log_message(group_id: int, user_id: int, nickname: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO message_log (group_id, user_id, nickname, timestamp) VALUES (?, ?, ?, ?)",
-            (group_id, user_id, nickname, int(time.time()))
-        )
-        await db.commit()
+    await store.put(group_id, user_id, nickname)
 
 async def get_stats(group_id: int, days: int = 1) -> List[tuple]:
     start_time = int(time.time()) - (days * 24 * 3600)
-    async with aiosqlite.connect(DB_PATH) as db:
-        cursor = await db.execute("""
-            SELECT user_id, nickname, COUNT(*) as msg_count 
-            FROM message_log 
-            WHERE group_id = ? AND timestamp > ?
-            GROUP BY user_id 
-            ORDER BY msg_count DESC 
-            LIMIT 10
-        """, (group_id, start_time))
-        return await cursor.fetchall()
+    # 从小时聚合表统计，起始小时向下取整
+    start_hour = start_time - start_time % 3600
+    cursor = await store.db.execute("""
+        SELECT r.user_id, COALESCE(m.nickname, CAST(r.user_id AS TEXT)), SUM(r.msg_count) as msg_count
+        FROM rollup_hourly r
+        LEFT JOIN group_member m ON m.group_id = r.group_id AND m.user_id = r.user_id
+        WHERE r.group_id = ? AND r.hour_ts >= ?
+        GROUP BY r.user_id
+        ORDER BY msg_count DESC
+        LIMIT 10
+    """, (group_id, start_hour))
+    return await cursor.fetchall()
+
+@scheduler.scheduled_job("cron", hour=4, minute=30, id="group_analytics_retention")
+async def _purge_expired():
+    try:
+        raw, hourly = await store.purge(
+            plugin_config.group_analytics_raw_retention_days,
+            plugin_config.group_analytics_hourly_retention_days,
+        )
+        if raw or hourly:
+            logger.info(f"活跃统计：已清理 {raw} 条过期消息记录、{hourly} 条过期小时聚合")
+    except Exception as e:
+        logger.error(f"活跃统计：清理过期数据失败: {e}")
 
 # --- 处理器 ---
 
-msg_monitor = on_message(priority=10, block=False)
+if subscribe:
+    # 由消息库统一解析后分发，不再单独注册消息处理器
+    @subscribe
+    async def handle_ingested(bot: Bot, msg):
+        # 与未接入消息库时一致，不统计指令消息
+        if msg.chat_type == "group" and not msg.is_command:
+            await store.put(msg.chat_id, msg.user_id, msg.nickname, msg.time)
+else:
+    msg_monitor = on_message(priority=10, block=False)
 
-@msg_monitor.handle()
-async def handle_msg(event: GroupMessageEvent):
-    await log_message(event.group_id, event.user_id, event.sender.nickname or str(event.user_id))
+    @msg_monitor.handle()
+    async def handle_msg(event: GroupMessageEvent):
+        await log_message(event.group_id, event.user_id, event.sender.nickname or str(event.user_id))
 
 stats_cmd = on_command("活跃报告", aliases={"水群榜", "活跃榜"}, priority=5, block=True)
 
@@ -108,6 +137,45 @@ async def get_stats_from_napcat(bot: Bot, group_id: int, days: int = 1) -> List[
         logger.warning(f"从 NapCat 接口获取历史记录失败: {e}")
         return []
 
+async def render_html(html: str, width: int = 600) -> bytes:
+    try:
+        from ..render_pool import html_to_pic, PRIORITY_HIGH
+    except ImportError:
+        html_to_pic = None
+
+    if html_to_pic:
+        # 完全本地内容，使用池内常驻页面，等待字体就绪后截图
+        return await html_to_pic(html, viewport={"width": width, "height": 1000}, priority=PRIORITY_HIGH, kind="analytics")
+
+    from nonebot_plugin_htmlrender import get_new_page
+
+    async with get_new_page(viewport={"width": width, "height": 1000}) as page:
+        # 完全本地内容，使用 domcontentloaded 即可，完全不联网
+        await page.set_content(html, wait_until="domcontentloaded")
+        # 无需长时间等待，稍微给一点渲染时间即可
+        import asyncio
+        await asyncio.sleep(0.2)
+        return await page.screenshot(full_page=True)
+
+async def render_rank_with_pillow(stats: List[tuple], period_text: str, group_id: int):
+    try:
+        from ..render_pool import CardRow, RankCard, rank_card_to_pic
+    except ImportError:
+        return None
+
+    max_count = stats[0][2] or 1
+    card = RankCard(
+        title=f"{period_text}群活跃报告",
+        subtitle=f"群号: {group_id}",
+        rows=[
+            CardRow(title=str(nickname), subtitle=str(user_id), value=str(count), value_unit="条", ratio=count / max_count)
+            for user_id, nickname, count in stats
+        ],
+        footer=f"报告生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        theme="blue",
+    )
+    return await rank_card_to_pic(card)
+
 @stats_cmd.handle()
 async def handle_stats(bot: Bot, event: GroupMessageEvent):
     args = event.get_plaintext().strip().split()
@@ -117,7 +185,27 @@ async def handle_stats(bot: Bot, event: GroupMessageEvent):
     if "本周" in args or "周" in args:
         days = 7
         period_text = "本周"
-    
+    elif "本月" in args or "月" in args or "30" in args or "30天" in args:
+        days = 30
+    elif "季度" in args or "90" in args or "90天" in args:
+        days = 90
+    elif "今年" in args or "年" in args or "365" in args or "365天" in args:
+        days = 365
+
+    # 长周期报告只能由本地聚合表回答
+    if days in PERIODS:
+        try:
+            report = await build_period_report(store.db, event.group_id, days)
+            if not report["total"]:
+                await stats_cmd.finish(f"暂无近 {days} 天的活跃数据")
+            html = build_period_html(report, event.group_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            await stats_cmd.finish(MessageSegment.image(await render_html(html, width=720)))
+        except FinishedException:
+            raise
+        except Exception as e:
+            logger.error(f"活跃报告生成出错: {e}")
+            await stats_cmd.finish(f"生成报告失败了，请检查后台日志。错误: {str(e)}")
+
     # 1. 优先尝试从接口获取（NapCat 漫游消息）
     stats = await get_stats_from_napcat(bot, event.group_id, days)
     
@@ -129,6 +217,11 @@ async def handle_stats(bot: Bot, event: GroupMessageEvent):
     if not stats:
         await stats_cmd.finish(f"暂无{period_text}活跃数据（接口与本地均无记录）")
         
+    # 优先用 Pillow 直接绘制，不经过浏览器
+    pic = await render_rank_with_pillow(stats, period_text, event.group_id)
+    if pic:
+        await stats_cmd.finish(MessageSegment.image(pic))
+
     # 构建渲染用的 Markdown
     md = f"# 📊 {period_text}群活跃报告\n\n"
     md += f"**群号：** {event.group_id}\n\n"
@@ -239,16 +332,7 @@ async def handle_stats(bot: Bot, event: GroupMessageEvent):
     """
     
     try:
-        from nonebot_plugin_htmlrender import get_new_page
-        
-        async with get_new_page(viewport={"width": 600, "height": 1000}) as page:
-            # 完全本地内容，使用 domcontentloaded 即可，完全不联网
-            await page.set_content(full_html, wait_until="domcontentloaded")
-            # 无需长时间等待，稍微给一点渲染时间即可
-            import asyncio
-            await asyncio.sleep(0.2)
-            pic = await page.screenshot(full_page=True)
-            
+        pic = await render_html(full_html)
         await stats_cmd.finish(MessageSegment.image(pic))
         
     except FinishedException:
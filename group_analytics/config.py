@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+class Config(BaseModel):
+    group_analytics_db_path: str = "data/analytics.db"
+    # 批量写入：攒够 N 条或距上次写入超过 M 毫秒即落盘
+    group_analytics_batch_size: int = 200
+    group_analytics_flush_interval_ms: int = 1000
+    group_analytics_queue_max: int = 10000
+    # 原始消息保留天数，过期后只保留聚合数据；0 表示永久保留
+    group_analytics_raw_retention_days: int = 30
+    # 小时聚合保留天数，天聚合永久保留；0 表示永久保留
+    group_analytics_hourly_retention_days: int = 400
@@ -0,0 +1,252 @@
+import html
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+import aiosqlite
+
+# 长周期报告支持的天数
+PERIODS = (30, 90, 365)
+
+
+async def _fetchall(db: aiosqlite.Connection, sql: str, params: tuple) -> List[tuple]:
+    cursor = await db.execute(sql, params)
+    return await cursor.fetchall()
+
+
+async def get_heatmap(db: aiosqlite.Connection, group_id: int, start_ts: int) -> List[List[int]]:
+    """星期 × 小时 的发言热力图，返回 7×24 矩阵，行 0 为周一"""
+    # 先按整点汇总（最多 24×天数 行），再做时间换算，避免对每行调用 strftime
+    rows = await _fetchall(db, """
+        WITH h AS (
+            SELECT hour_ts, SUM(msg_count) AS cnt
+            FROM rollup_hourly
+            WHERE group_id = ? AND hour_ts >= ?
+            GROUP BY hour_ts
+        )
+        SELECT CAST(strftime('%w', hour_ts, 'unixepoch', 'localtime') AS INTEGER) AS wd,
+               CAST(strftime('%H', hour_ts, 'unixepoch', 'localtime') AS INTEGER) AS hr,
+               SUM(cnt)
+        FROM h
+        GROUP BY wd, hr
+    """, (group_id, start_ts))
+    grid = [[0] * 24 for _ in range(7)]
+    for wd, hr, count in rows:
+        # sqlite 中周日为 0，这里转为周一在前
+        grid[(wd + 6) % 7][hr] = count
+    return grid
+
+
+async def get_daily_trend(db: aiosqlite.Connection, group_id: int, start_day: str) -> List[dict]:
+    """每日发言数、发言人数，以及新/老发言人数
+
+    新发言人指在该群历史上第一次出现于当天的用户，按 group_member.first_seen
+    计算，不受报告周期和原始记录清理的影响。
+    """
+    rows = await _fetchall(db, """
+        WITH d AS (
+            SELECT day, SUM(msg_count) AS messages, COUNT(*) AS speakers
+            FROM rollup_daily
+            WHERE group_id = ? AND day >= ?
+            GROUP BY day
+        ), n AS (
+            SELECT date(first_seen, 'unixepoch', 'localtime') AS day, COUNT(*) AS new
+            FROM group_member
+            WHERE group_id = ?
+            GROUP BY 1
+        )
+        SELECT d.day, d.messages, d.speakers, COALESCE(n.new, 0)
+        FROM d LEFT JOIN n ON n.day = d.day
+        ORDER BY d.day
+    """, (group_id, start_day, group_id))
+    by_day = {row[0]: row for row in rows}
+
+    trend = []
+    cur = date.fromisoformat(start_day)
+    today = date.today()
+    while cur <= today:
+        key = cur.isoformat()
+        _, messages, speakers, new = by_day.get(key, (key, 0, 0, 0))
+        trend.append({
+            "day": key,
+            "messages": messages,
+            "speakers": speakers,
+            "new": new,
+            "returning": speakers - new,
+        })
+        cur += timedelta(days=1)
+    return trend
+
+
+async def get_top_users(db: aiosqlite.Connection, group_id: int, start_day: str, limit: int = 10) -> List[tuple]:
+    return await _fetchall(db, """
+        SELECT r.user_id, COALESCE(m.nickname, CAST(r.user_id AS TEXT)), SUM(r.msg_count) AS total,
+               COUNT(*) AS active_days
+        FROM rollup_daily r
+        LEFT JOIN group_member m ON m.group_id = r.group_id AND m.user_id = r.user_id
+        WHERE r.group_id = ? AND r.day >= ?
+        GROUP BY r.user_id
+        ORDER BY total DESC
+        LIMIT ?
+    """, (group_id, start_day, limit))
+
+
+async def get_streaks(db: aiosqlite.Connection, group_id: int, start_day: str, limit: int = 10) -> List[tuple]:
+    """连续发言天数排行，返回 (user_id, 昵称, 最长连续天数, 当前连续天数)
+
+    经典 gaps-and-islands：连续日期减去行号后得到相同的分组键。
+    当前连续指截止到今天或昨天仍未中断的那一段。
+    """
+    return await _fetchall(db, """
+        WITH d AS (
+            SELECT user_id, day,
+                   julianday(day) - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY day) AS grp
+            FROM rollup_daily
+            WHERE group_id = ? AND day >= ?
+        ), s AS (
+            SELECT user_id, COUNT(*) AS len, MAX(day) AS last_day
+            FROM d
+            GROUP BY user_id, grp
+        )
+        SELECT s.user_id, COALESCE(m.nickname, CAST(s.user_id AS TEXT)),
+               MAX(s.len) AS longest,
+               MAX(CASE WHEN s.last_day >= date('now', 'localtime', '-1 day') THEN s.len ELSE 0 END) AS current
+        FROM s
+        LEFT JOIN group_member m ON m.group_id = ? AND m.user_id = s.user_id
+        GROUP BY s.user_id
+        ORDER BY longest DESC, current DESC
+        LIMIT ?
+    """, (group_id, start_day, group_id, limit))
+
+
+async def build_period_report(db: aiosqlite.Connection, group_id: int, days: int) -> Dict:
+    start_day = (date.today() - timedelta(days=days - 1)).isoformat()
+    # 热力图按本地零点起算，与天聚合口径一致
+    start_ts = int(time.mktime(time.strptime(start_day, "%Y-%m-%d")))
+
+    trend = await get_daily_trend(db, group_id, start_day)
+    speakers = await _fetchall(db, """
+        SELECT COUNT(DISTINCT user_id) FROM rollup_daily WHERE group_id = ? AND day >= ?
+    """, (group_id, start_day))
+    return {
+        "days": days,
+        "start_day": start_day,
+        "total": sum(d["messages"] for d in trend),
+        "speakers": speakers[0][0],
+        "new_speakers": sum(d["new"] for d in trend),
+        "heatmap": await get_heatmap(db, group_id, start_ts),
+        "trend": trend,
+        "top_users": await get_top_users(db, group_id, start_day),
+        "streaks": await get_streaks(db, group_id, start_day),
+    }
+
+
+
+def build_period_html(report: Dict, group_id: int, generated_at: str) -> str:
+    """长周期报告的 HTML，热力图和趋势线均为内联 DOM/SVG，不依赖外部资源"""
+    period_text = f"近 {report['days']} 天"
+
+    # 热力图
+    grid = report["heatmap"]
+    peak = max(max(row) for row in grid) or 1
+    weekdays = ["一", "二", "三", "四", "五", "六", "日"]
+    heat_rows = "".join(
+        f'<div class="heat-row"><span class="heat-label">周{weekdays[wd]}</span>'
+        + "".join(
+            f'<span class="heat-cell" style="opacity:{0.08 + 0.92 * v / peak:.2f}" title="{v}"></span>'
+            for v in row
+        )
+        + "</div>"
+        for wd, row in enumerate(grid)
+    )
+    hour_axis = "".join(f'<span class="heat-axis">{h if h % 3 == 0 else ""}</span>' for h in range(24))
+
+    # 趋势线
+    trend = report["trend"]
+    width, height = 600, 140
+    max_msg = max((d["messages"] for d in trend), default=0) or 1
+    step = width / max(1, len(trend) - 1)
+    points = " ".join(
+        f"{i * step:.1f},{height - d['messages'] / max_msg * height:.1f}" for i, d in enumerate(trend)
+    )
+    max_speakers = max((d["speakers"] for d in trend), default=0) or 1
+    bar_w = max(1.0, width / max(1, len(trend)) - 1)
+    bars = "".join(
+        f'<rect x="{i * width / len(trend):.1f}" y="{height - d["speakers"] / max_speakers * height:.1f}" '
+        f'width="{bar_w:.1f}" height="{d["speakers"] / max_speakers * height:.1f}" fill="#e2e8f0"/>'
+        f'<rect x="{i * width / len(trend):.1f}" y="{height - d["new"] / max_speakers * height:.1f}" '
+        f'width="{bar_w:.1f}" height="{d["new"] / max_speakers * height:.1f}" fill="#fbbf24"/>'
+        for i, d in enumerate(trend)
+    )
+
+    top_rows = "".join(
+        f'<tr><td>{i}</td><td>{html.escape(str(name))}<span class="uid">{html.escape(str(uid))}</span></td><td>{total}</td><td>{active}</td></tr>'
+        for i, (uid, name, total, active) in enumerate(report["top_users"], 1)
+    )
+    streak_rows = "".join(
+        f'<tr><td>{i}</td><td>{html.escape(str(name))}<span class="uid">{html.escape(str(uid))}</span></td><td>{longest} 天</td><td>{current} 天</td></tr>'
+        for i, (uid, name, longest, current) in enumerate(report["streaks"], 1)
+    )
+
+    return f"""
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <style>
+            body {{ font-family: 'PingFang SC', 'Microsoft YaHei', sans-serif; background-color: #f1f5f9; padding: 30px; margin: 0; display: flex; justify-content: center; }}
+            .card {{ background: white; border-radius: 20px; box-shadow: 0 10px 25px -5px rgba(0,0,0,0.1); padding: 30px; width: 660px; border: 1px solid #e2e8f0; }}
+            .header {{ text-align: center; margin-bottom: 24px; }}
+            .title {{ font-size: 26px; font-weight: bold; color: #1e293b; margin-bottom: 8px; }}
+            .subtitle {{ color: #64748b; font-size: 15px; }}
+            .summary {{ display: flex; justify-content: space-around; margin-bottom: 24px; }}
+            .summary div {{ text-align: center; }}
+            .summary b {{ display: block; font-size: 22px; color: #2563eb; }}
+            .summary span {{ font-size: 12px; color: #64748b; }}
+            .section {{ font-size: 16px; font-weight: 600; color: #1e293b; margin: 24px 0 10px; }}
+            .heat-row {{ display: flex; align-items: center; gap: 2px; margin-bottom: 2px; }}
+            .heat-label, .heat-axis-pad {{ width: 36px; font-size: 12px; color: #64748b; }}
+            .heat-cell {{ width: 22px; height: 18px; border-radius: 3px; background: #2563eb; }}
+            .heat-axis {{ width: 22px; font-size: 10px; color: #94a3b8; text-align: center; }}
+            .legend {{ font-size: 12px; color: #64748b; margin-top: 6px; }}
+            .legend i {{ display: inline-block; width: 10px; height: 10px; margin: 0 4px 0 12px; }}
+            table {{ width: 100%; border-collapse: collapse; font-size: 14px; }}
+            th {{ text-align: left; color: #64748b; font-weight: normal; padding: 6px 4px; border-bottom: 1px solid #e2e8f0; }}
+            td {{ padding: 6px 4px; color: #1e293b; border-bottom: 1px solid #f1f5f9; }}
+            .uid {{ font-size: 11px; color: #94a3b8; margin-left: 6px; }}
+            .footer {{ margin-top: 30px; padding-top: 16px; border-top: 1px solid #f1f5f9; text-align: center; color: #94a3b8; font-size: 12px; }}
+        </style>
+    </head>
+    <body>
+        <div class="card">
+            <div class="header">
+                <div class="title">📊 {period_text}群活跃报告</div>
+                <div class="subtitle">群号: {group_id} · {report['start_day']} 起</div>
+            </div>
+            <div class="summary">
+                <div><b>{report['total']}</b><span>总发言</span></div>
+                <div><b>{report['speakers']}</b><span>发言人数</span></div>
+                <div><b>{report['new_speakers']}</b><span>新发言人</span></div>
+            </div>
+
+            <div class="section">🕒 活跃时段</div>
+            {heat_rows}
+            <div class="heat-row"><span class="heat-axis-pad"></span>{hour_axis}</div>
+
+            <div class="section">📈 每日趋势</div>
+            <svg width="{width}" height="{height}" viewBox="0 0 {width} {height}">
+                {bars}
+                <polyline points="{points}" fill="none" stroke="#2563eb" stroke-width="2"/>
+            </svg>
+            <div class="legend"><i style="background:#2563eb"></i>发言数<i style="background:#e2e8f0"></i>老发言人<i style="background:#fbbf24"></i>新发言人</div>
+
+            <div class="section">🏆 发言排行</div>
+            <table><tr><th>#</th><th>昵称</th><th>发言数</th><th>活跃天数</th></tr>{top_rows}</table>
+
+            <div class="section">🔥 连续发言</div>
+            <table><tr><th>#</th><th>昵称</th><th>最长连续</th><th>当前连续</th></tr>{streak_rows}</table>
+
+            <div class="footer">报告生成时间: {generated_at}</div>
+        </div>
+    </body>
+    </html>
+    """
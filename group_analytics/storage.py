@@ -0,0 +1,248 @@
+import asyncio
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiosqlite
+from nonebot import logger
+
+# (group_id, user_id, nickname, timestamp)
+Row = Tuple[int, int, str, int]
+
+# 数据库结构版本，升级时用于触发一次性迁移
+SCHEMA_VERSION = 1
+
+
+class MessageStore:
+    """持有一个长连接，并通过后台任务批量写入消息记录"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        batch_size: int = 200,
+        flush_interval_ms: int = 1000,
+        queue_max: int = 10000,
+        raw_log: bool = True,
+    ):
+        self.db_path = db_path
+        # 接入共享消息库时原始消息已由消息库保存，这里只维护聚合表
+        self.raw_log = raw_log
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_max)
+        self.db: Optional[aiosqlite.Connection] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        # 写入批次与清理共用一个连接，逐个事务执行，避免一方提交另一方做了一半的修改
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在检查点时 fsync，崩溃最多丢失最后一批
+        await self.db.execute("PRAGMA synchronous=NORMAL")
+        await self._create_schema()
+        await self.db.commit()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def _create_schema(self):
+        await self.db.execute("""
+            CREATE TABLE IF NOT EXISTS message_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER,
+                user_id INTEGER,
+                nickname TEXT,
+                timestamp INTEGER
+            )
+        """)
+        await self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_message_log_group_ts ON message_log (group_id, timestamp)"
+        )
+        await self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_message_log_ts ON message_log (timestamp)"
+        )
+        # 按小时/按天预聚合的发言数，hour_ts 为整点时间戳，day 为本地日期 YYYY-MM-DD
+        await self.db.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_hourly (
+                group_id INTEGER NOT NULL,
+                hour_ts INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                msg_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (group_id, hour_ts, user_id)
+            ) WITHOUT ROWID
+        """)
+        await self.db.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_daily (
+                group_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                msg_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (group_id, day, user_id)
+            ) WITHOUT ROWID
+        """)
+        # 连续发言统计需要按用户顺序扫描天聚合
+        await self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rollup_daily_user ON rollup_daily (group_id, user_id, day)"
+        )
+        # 原始记录清理后仍需要昵称和首次发言时间
+        await self.db.execute("""
+            CREATE TABLE IF NOT EXISTS group_member (
+                group_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                nickname TEXT,
+                first_seen INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL,
+                PRIMARY KEY (group_id, user_id)
+            ) WITHOUT ROWID
+        """)
+
+        cursor = await self.db.execute("PRAGMA user_version")
+        version = (await cursor.fetchone())[0]
+        if version < SCHEMA_VERSION:
+            await self._backfill_rollups()
+            await self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    async def _backfill_rollups(self):
+        """旧数据库升级时，从现有原始记录一次性生成聚合表"""
+        logger.info("活跃统计：正在从历史消息生成聚合表...")
+        await self.db.execute("""
+            INSERT OR REPLACE INTO rollup_hourly (group_id, hour_ts, user_id, msg_count)
+            SELECT group_id, timestamp - timestamp % 3600, user_id, COUNT(*)
+            FROM message_log GROUP BY 1, 2, 3
+        """)
+        await self.db.execute("""
+            INSERT OR REPLACE INTO rollup_daily (group_id, day, user_id, msg_count)
+            SELECT group_id, date(timestamp, 'unixepoch', 'localtime'), user_id, COUNT(*)
+            FROM message_log GROUP BY 1, 2, 3
+        """)
+        await self.db.execute("""
+            INSERT OR REPLACE INTO group_member (group_id, user_id, nickname, first_seen, last_seen)
+            SELECT m.group_id, m.user_id,
+                   (SELECT nickname FROM message_log l
+                    WHERE l.group_id = m.group_id AND l.user_id = m.user_id
+                    ORDER BY l.timestamp DESC LIMIT 1),
+                   MIN(m.timestamp), MAX(m.timestamp)
+            FROM message_log m GROUP BY m.group_id, m.user_id
+        """)
+
+    async def stop(self):
+        if self._writer_task:
+            # 用哨兵通知写入任务写完手头这一批后退出，避免在提交中途被取消
+            await self.queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+        # 关闭前把队列里剩余的消息全部写入
+        rest: List[Row] = []
+        while not self.queue.empty():
+            row = self.queue.get_nowait()
+            if row is not None:
+                rest.append(row)
+        if rest and self.db:
+            await self._flush(rest)
+        if self.db:
+            await self.db.close()
+            self.db = None
+
+    async def put(self, group_id: int, user_id: int, nickname: str, timestamp: Optional[int] = None):
+        await self.queue.put((group_id, user_id, nickname, timestamp or int(time.time())))
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self.queue.get()
+            if row is None:
+                break
+            batch: List[Row] = [row]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"活跃统计：批量写入 {len(batch)} 条消息失败: {e}")
+
+    async def _flush(self, batch: List[Row]):
+        hourly: Dict[Tuple[int, int, int], int] = defaultdict(int)
+        daily: Dict[Tuple[int, str, int], int] = defaultdict(int)
+        members: Dict[Tuple[int, int], Tuple[str, int, int]] = {}
+        for group_id, user_id, nickname, ts in batch:
+            hourly[(group_id, ts - ts % 3600, user_id)] += 1
+            daily[(group_id, time.strftime("%Y-%m-%d", time.localtime(ts)), user_id)] += 1
+            prev = members.get((group_id, user_id))
+            if prev:
+                members[(group_id, user_id)] = (nickname, min(prev[1], ts), max(prev[2], ts))
+            else:
+                members[(group_id, user_id)] = (nickname, ts, ts)
+
+        # 原始记录与聚合表在同一事务中更新，保证两者一致；任何一步失败都整体回滚
+        async with self._lock:
+            await self.db.execute("BEGIN")
+            try:
+                if self.raw_log:
+                    await self.db.executemany(
+                        "INSERT INTO message_log (group_id, user_id, nickname, timestamp) VALUES (?, ?, ?, ?)",
+                        batch
+                    )
+                await self.db.executemany("""
+                    INSERT INTO rollup_hourly (group_id, hour_ts, user_id, msg_count) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (group_id, hour_ts, user_id) DO UPDATE SET msg_count = msg_count + excluded.msg_count
+                """, [(*k, v) for k, v in hourly.items()])
+                await self.db.executemany("""
+                    INSERT INTO rollup_daily (group_id, day, user_id, msg_count) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (group_id, day, user_id) DO UPDATE SET msg_count = msg_count + excluded.msg_count
+                """, [(*k, v) for k, v in daily.items()])
+                await self.db.executemany("""
+                    INSERT INTO group_member (group_id, user_id, nickname, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (group_id, user_id) DO UPDATE SET
+                        nickname = excluded.nickname,
+                        first_seen = MIN(first_seen, excluded.first_seen),
+                        last_seen = MAX(last_seen, excluded.last_seen)
+                """, [(g, u, *v) for (g, u), v in members.items()])
+                await self.db.commit()
+            except BaseException:
+                await self.db.rollback()
+                raise
+
+    async def purge(self, raw_retention_days: int, hourly_retention_days: int, chunk: int = 5000) -> Tuple[int, int]:
+        """清理过期的原始记录和小时聚合
+
+        原始记录在写入时已计入聚合表，删除不会影响统计结果。
+        分块删除以免长时间占用写锁。天数为 0 表示不清理。
+        """
+        now = int(time.time())
+        raw_deleted = 0
+        hourly_deleted = 0
+        if raw_retention_days > 0:
+            cutoff = now - raw_retention_days * 86400
+            while True:
+                # 每块单独加锁，写入任务可以在块与块之间插入
+                async with self._lock:
+                    cursor = await self.db.execute("""
+                        DELETE FROM message_log WHERE id IN (
+                            SELECT id FROM message_log WHERE timestamp < ? LIMIT ?
+                        )
+                    """, (cutoff, chunk))
+                    await self.db.commit()
+                raw_deleted += cursor.rowcount
+                if cursor.rowcount < chunk:
+                    break
+                await asyncio.sleep(0)
+        if hourly_retention_days > 0:
+            cutoff = now - hourly_retention_days * 86400
+            async with self._lock:
+                cursor = await self.db.execute("DELETE FROM rollup_hourly WHERE hour_ts < ?", (cutoff,))
+                await self.db.commit()
+            hourly_deleted = cursor.rowcount
+        return raw_deleted, hourly_deleted
@@ -1,4 +1,3 @@
-import json
 import random
 import httpx
 import re
@@ -7,10 +6,11 @@ import time
 from pathlib import Path
 from typing import List, Dict, Optional, Any
 
-from nonebot import on_command, get_plugin_config, require
+from nonebot import on_command, on_message, get_driver, get_plugin_config, require
 from nonebot.adapters.onebot.v11 import Message, MessageSegment, GroupMessageEvent, MessageEvent, Bot
 from nonebot.exception import ActionFailed
 from nonebot.params import CommandArg
+from nonebot.rule import Rule
 from nonebot.plugin import PluginMetadata
 from nonebot.typing import T_State
 from nonebot.matcher import Matcher
@@ -19,7 +19,17 @@ from nonebot.log import logger
 require("nonebot_plugin_apscheduler")
 from nonebot_plugin_apscheduler import scheduler
 
+from .audio import AudioCache, extract_clip
 from .config import Config
+from .library import SongLibrary
+from .ncm_cache import NcmCache
+from .prefetch import RoundPrefetcher
+from .session import GameSession, SessionEngine
+
+try:
+    from ..web_console import register_memory_store
+except ImportError:
+    register_memory_store = None
 
 __plugin_meta__ = PluginMetadata(
     name="猜歌游戏",
@@ -32,31 +42,20 @@ __plugin_meta__ = PluginMetadata(
 )
 
 config = get_plugin_config(Config)
+driver = get_driver()
 DATA_PATH = config.guess_song_data_path
 CACHE_DIR = config.guess_song_cache_dir
 
-def clean_cache(all_files: bool = False):
-    """清理缓存文件
-    :param all_files: 是否清理所有文件，否则仅清理超过 1 小时的文件
-    """
-    try:
-        if not CACHE_DIR.exists():
-            return
-        now = time.time()
-        count = 0
-        for f in CACHE_DIR.glob("*.mp3"):
-            if all_files or (now - f.stat().st_mtime > 3600):
-                f.unlink()
-                count += 1
-        if count > 0:
-            logger.info(f"猜歌插件：已清理 {count} 个缓存音频文件")
-    except Exception as e:
-        logger.error(f"清理缓存出错: {e}")
+# 网易云接口的共享连接池与结果缓存
+_client: Optional[httpx.AsyncClient] = None
+ncm_cache = NcmCache(config.guess_song_ncm_cache_path)
 
-# 每日凌晨 3 点自动清理所有缓存
-@scheduler.scheduled_job("cron", hour=3, minute=0, id="guess_song_daily_clean")
-async def _():
-    clean_cache(all_files=True)
+# 整首音频与猜歌片段共用一个按字节预算淘汰的缓存
+audio_cache = AudioCache(CACHE_DIR, config.guess_song_cache_max_mb * 1024 * 1024)
+audio_cache.load()
+
+# 导入歌单时发送进度消息的最短间隔（秒）
+IMPORT_PROGRESS_INTERVAL = 5
 
 def get_headers():
     headers = {
@@ -65,68 +64,103 @@ def get_headers():
     }
     return headers
 
-def load_songs() -> List[Dict[str, str]]:
-    if not DATA_PATH.exists():
-        DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-        save_songs([])
-        return []
-    with open(DATA_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_songs(songs: List[Dict[str, str]]):
-    with open(DATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(songs, f, ensure_ascii=False, indent=2)
+# 曲库只在启动时读取一次，之后的查找和修改都在内存索引上进行
+library = SongLibrary(DATA_PATH)
+library.load()
+if register_memory_store:
+    register_memory_store("guess_song.library", lambda: library)
+
+def get_client() -> httpx.AsyncClient:
+    """所有网易云请求共用一个连接池"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=10,
+            headers=get_headers(),
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _client
+
+@driver.on_startup
+async def _start_cache():
+    await ncm_cache.start()
+
+@driver.on_shutdown
+async def _close_client():
+    await ncm_cache.stop()
+    if _client is not None:
+        await _client.aclose()
 
 async def ncm_search(keyword: str, limit: int = 5) -> List[Dict[str, Any]]:
-    """使用网易云标准接口搜索歌曲"""
+    """使用网易云标准接口搜索歌曲，结果缓存 guess_song_search_ttl 秒"""
+    results = await ncm_cache.fetch(
+        "search", f"{limit}:{keyword}", lambda: _ncm_search(keyword, limit), ttl=config.guess_song_search_ttl
+    )
+    return results or []
+
+async def _ncm_search(keyword: str, limit: int) -> Optional[List[Dict[str, Any]]]:
     url = f"https://music.163.com/api/search/get/web?s={keyword}&type=1&offset=0&total=true&limit={limit}"
-    async with httpx.AsyncClient(timeout=10, headers=get_headers()) as client:
-        try:
-            resp = await client.get(url)
-            if resp.status_code == 200:
-                data = resp.json()
-                if data.get("result") and data["result"].get("songs"):
-                    results = []
-                    for song in data["result"]["songs"]:
-                        results.append({
-                            "id": song["id"],
-                            "title": song["name"],
-                            "artist": song["artists"][0]["name"] if song.get("artists") else "未知歌手",
-                            "album": song["album"]["name"] if song.get("album") else ""
-                        })
-                    return results
-        except Exception as e:
-            logger.error(f"网易云搜索失败: {e}")
-    return []
+    try:
+        resp = await get_client().get(url)
+        if resp.status_code == 200:
+            data = resp.json()
+            # 限流和错误也返回 HTTP 200，只有 code 为 200 的结果才能缓存
+            if data.get("code") != 200:
+                logger.warning(f"网易云搜索失败: code={data.get('code')} {data.get('msg') or data.get('message') or ''}")
+                return None
+            results = []
+            if data.get("result") and data["result"].get("songs"):
+                for song in data["result"]["songs"]:
+                    results.append({
+                        "id": song["id"],
+                        "title": song["name"],
+                        "artist": song["artists"][0]["name"] if song.get("artists") else "未知歌手",
+                        "album": song["album"]["name"] if song.get("album") else ""
+                    })
+            return results
+    except Exception as e:
+        logger.error(f"网易云搜索失败: {e}")
+    return None
+
+# 过滤掉一些无意义的歌词行
+LYRIC_FILTERS = ["作词", "作曲", "编曲", "制作", "Producer", "Arrangement", "Lyricist", "Composer", "混音", "吉他", "鼓", "钢琴", "后期"]
 
 async def ncm_get_lyrics(song_id: int, full: bool = False) -> Optional[str]:
+    lyric = await ncm_cache.fetch("lyric", song_id, lambda: _ncm_get_lyric_lines(song_id))
+    if not lyric or not lyric["lines"]:
+        return None
+    if full:
+        return "\n".join(lyric["lines"])
+
+    lines = lyric["filtered"]
+    if len(lines) > 5:
+        # 随机选一段，但尽量避开最后几行（通常是重复的副歌或鸣谢）
+        max_start = max(0, len(lines) - 4)
+        start = random.randint(0, min(max_start, len(lines) // 2))
+        return "\n".join(lines[start:start+3])
+    return "\n".join(lines)
+
+async def _ncm_get_lyric_lines(song_id: int) -> Optional[Dict[str, List[str]]]:
+    """歌词按 ID 永久缓存：去掉时间标签后的全部行，以及过滤掉制作人员信息的行"""
     # url = f"https://api.viki.moe/ncm/song/{song_id}/lyric"
     url = f"https://music.163.com/api/song/lyric?os=pc&id={song_id}&lv=-1"
-    async with httpx.AsyncClient(timeout=10, headers=get_headers()) as client:
-        try:
-            resp = await client.get(url)
-            if resp.status_code == 200:
-                data = resp.json()
-                lrc = data.get("lrc", {}).get("lyric", "")
-                if lrc:
-                    # 过滤时间标签
-                    lines = re.sub(r"\[.*?\]", "", lrc).split("\n")
-                    lines = [line.strip() for line in lines if line.strip()]
-                    
-                    if full:
-                        return "\n".join(lines)
-                        
-                    # 过滤掉一些无意义的行
-                    filters = ["作词", "作曲", "编曲", "制作", "Producer", "Arrangement", "Lyricist", "Composer", "混音", "吉他", "鼓", "钢琴", "后期"]
-                    lines = [line for line in lines if not any(x.lower() in line.lower() for x in filters)]
-                    if len(lines) > 5:
-                        # 随机选一段，但尽量避开最后几行（通常是重复的副歌或鸣谢）
-                        max_start = max(0, len(lines) - 4)
-                        start = random.randint(0, min(max_start, len(lines) // 2))
-                        return "\n".join(lines[start:start+3])
-                    return "\n".join(lines)
-        except Exception as e:
-            logger.error(f"获取歌词失败 (ID: {song_id}): {e}")
+    try:
+        resp = await get_client().get(url)
+        if resp.status_code == 200:
+            data = resp.json()
+            # 歌词永久缓存，限流或错误响应（同样是 HTTP 200）绝不能当作“没有歌词”存下来
+            if data.get("code") != 200:
+                logger.warning(f"获取歌词失败 (ID: {song_id}): code={data.get('code')}")
+                return None
+            lrc = (data.get("lrc") or {}).get("lyric") or ""
+            # 过滤时间标签
+            lines = re.sub(r"\[.*?\]", "", lrc).split("\n")
+            lines = [line.strip() for line in lines if line.strip()]
+            filtered = [line for line in lines if not any(x.lower() in line.lower() for x in LYRIC_FILTERS)]
+            return {"lines": lines, "filtered": filtered}
+    except Exception as e:
+        logger.error(f"获取歌词失败 (ID: {song_id}): {e}")
     return None
 
 async def ncm_get_audio(song_id: int, br: int = 320000) -> Optional[tuple[Path, str]]:
@@ -134,12 +168,9 @@ async def ncm_get_audio(song_id: int, br: int = 320000) -> Optional[tuple[Path,
     :param song_id: 歌曲 ID
     :param br: 期望音质 (bitrate)，默认 320000 (HQ)
     """
-    if not CACHE_DIR.exists():
-        CACHE_DIR.mkdir(parents=True, exist_ok=True)
-
     # 优先检查请求的音质缓存
-    local_path = CACHE_DIR / f"{song_id}_{br}.mp3"
-    if local_path.exists() and local_path.stat().st_size > 0:
+    local_path = audio_cache.get(f"{song_id}_{br}.mp3")
+    if local_path:
         return local_path, ""
 
     # 如果请求的是 HQ 但没缓存，或者缓存失效，尝试获取
@@ -147,98 +178,144 @@ async def ncm_get_audio(song_id: int, br: int = 320000) -> Optional[tuple[Path,
     if br > 128000:
         bitrates.append(128000) # 备选音质
 
-    async with httpx.AsyncClient(timeout=15, headers=get_headers(), follow_redirects=True) as client:
-        for current_br in bitrates:
-            url = f"https://api.viki.moe/ncm/song/{song_id}/url?br={current_br}"
-            try:
-                resp = await client.get(url)
-                if resp.status_code != 200:
-                    logger.warning(f"音频接口返回异常 (ID: {song_id}, br: {current_br}): {resp.status_code}")
-                    continue
-                
-                data = resp.json()
-                audio_url = data.get("url")
-                
-                if not audio_url:
-                    logger.warning(f"音频接口未返回 URL (ID: {song_id}, br: {current_br}), 响应: {data}")
-                    continue
-                
-                # 再次检查该音质的本地缓存（防止循环中其他音质已缓存）
-                current_local_path = CACHE_DIR / f"{song_id}_{current_br}.mp3"
-                if current_local_path.exists() and current_local_path.stat().st_size > 0:
-                    return current_local_path, audio_url
-
-                # 下载音频
-                audio_resp = await client.get(audio_url)
-                if audio_resp.status_code == 200:
-                    current_local_path.write_bytes(audio_resp.content)
-                    return current_local_path, audio_url
-                else:
-                    logger.error(f"下载音频文件失败 (ID: {song_id}, URL: {audio_url}): {audio_resp.status_code}")
-                    
-            except Exception as e:
-                logger.error(f"获取音频尝试失败 (ID: {song_id}, br: {current_br}): {e}")
+    client = get_client()
+    for current_br in bitrates:
+        url = f"https://api.viki.moe/ncm/song/{song_id}/url?br={current_br}"
+        try:
+            resp = await client.get(url, timeout=15)
+            if resp.status_code != 200:
+                logger.warning(f"音频接口返回异常 (ID: {song_id}, br: {current_br}): {resp.status_code}")
+                continue
+            
+            data = resp.json()
+            audio_url = data.get("url")
+            
+            if not audio_url:
+                logger.warning(f"音频接口未返回 URL (ID: {song_id}, br: {current_br}), 响应: {data}")
+                continue
+            
+            # 再次检查该音质的本地缓存（防止循环中其他音质已缓存）
+            current_local_path = audio_cache.get(f"{song_id}_{current_br}.mp3")
+            if current_local_path:
+                return current_local_path, audio_url
+
+            # 下载音频
+            audio_resp = await client.get(audio_url, timeout=15)
+            if audio_resp.status_code == 200 and audio_resp.content:
+                current_local_path = await audio_cache.put(f"{song_id}_{current_br}.mp3", audio_resp.content)
+                return current_local_path, audio_url
+            else:
+                logger.error(f"下载音频文件失败 (ID: {song_id}, URL: {audio_url}): {audio_resp.status_code}")
                 
+        except Exception as e:
+            logger.error(f"获取音频尝试失败 (ID: {song_id}, br: {current_br}): {e}")
+            
     return None
 
+async def get_clip(song_id: int, source: Path) -> Optional[Path]:
+    """截取猜歌用的片段并缓存；每首歌有几个固定的起点，随机选用其中一个"""
+    slots = max(1, config.guess_song_clip_slots)
+    seconds = config.guess_song_clip_seconds
+    slot = random.randrange(slots)
+    name = f"{song_id}_clip{slot}_{seconds}s.mp3"
+    cached = audio_cache.get(name)
+    if cached:
+        return cached
+    # 起点分布在全曲 15% 到 75% 之间，避开前奏和结尾
+    ratio = 0.15 + 0.6 * slot / max(1, slots - 1)
+    try:
+        clip = await extract_clip(source, ratio, seconds)
+    except Exception as e:
+        logger.error(f"截取音频片段失败 (ID: {song_id}): {e}")
+        return None
+    return await audio_cache.put(name, clip) if clip else None
+
+async def get_round_audio(song_id: int) -> Optional[tuple[Path, str]]:
+    """猜歌使用的音频：128000 音质节约带宽，能截取片段时只发送片段"""
+    audio_info = await ncm_get_audio(song_id, br=128000)
+    if not audio_info:
+        return None
+    full_path, audio_url = audio_info
+    clip_path = await get_clip(song_id, full_path)
+    return clip_path or full_path, audio_url
+
 async def ncm_get_song_info(song_id: int) -> Optional[Dict[str, Any]]:
+    """歌曲信息按 ID 永久缓存"""
+    return await ncm_cache.fetch("info", song_id, lambda: _ncm_get_song_info(song_id))
+
+async def _ncm_get_song_info(song_id: int) -> Optional[Dict[str, Any]]:
     url = f"https://api.viki.moe/ncm/song/{song_id}"
-    async with httpx.AsyncClient(timeout=10, headers=get_headers()) as client:
-        try:
-            resp = await client.get(url)
-            if resp.status_code == 200:
-                data = resp.json()
-                if "name" in data:
-                    return {
-                        "title": data["name"],
-                        "artist": data["artists"][0]["name"] if data.get("artists") else "未知歌手",
-                        "id": song_id
-                    }
-        except Exception as e:
-            logger.error(f"获取歌曲详情失败 (ID: {song_id}): {e}")
+    try:
+        resp = await get_client().get(url)
+        if resp.status_code == 200:
+            data = resp.json()
+            if "name" in data:
+                return {
+                    "title": data["name"],
+                    "artist": data["artists"][0]["name"] if data.get("artists") else "未知歌手",
+                    "id": song_id
+                }
+    except Exception as e:
+        logger.error(f"获取歌曲详情失败 (ID: {song_id}): {e}")
     return None
 
-async def ncm_get_playlist_songs(playlist_id: int) -> List[Dict[str, Any]]:
+async def ncm_get_playlist_track_ids(playlist_id: int) -> Optional[List[int]]:
+    """歌单中全部歌曲的 ID，歌单不存在时返回 None"""
     detail_url = f"https://music.163.com/api/v1/playlist/detail?id={playlist_id}"
-    songs_list = []
-    async with httpx.AsyncClient(timeout=10, headers=get_headers()) as client:
+    try:
+        resp = await get_client().get(detail_url)
+        if resp.status_code == 200:
+            playlist = resp.json().get("playlist") or {}
+            track_ids = [t["id"] for t in playlist.get("trackIds") or []]
+            if not track_ids and playlist.get("tracks"):
+                # 备选方案：如果 trackIds 为空，尝试直接用 tracks
+                track_ids = [t["id"] for t in playlist["tracks"]]
+            return track_ids
+    except Exception as e:
+        logger.error(f"获取歌单失败 (ID: {playlist_id}): {e}")
+    return None
+
+async def ncm_get_song_details(song_ids: List[int]) -> Optional[List[Dict[str, Any]]]:
+    """一次获取一批歌曲的详情，失败时重试一次"""
+    ids_param = "[" + ",".join(map(str, song_ids)) + "]"
+    url = f"https://music.163.com/api/song/detail?ids={ids_param}"
+    for attempt in range(2):
         try:
-            resp = await client.get(detail_url)
+            resp = await get_client().get(url)
             if resp.status_code == 200:
-                data = resp.json()
-                playlist = data.get("playlist", {})
-                
-                # 获取所有歌曲 ID
-                track_ids = [t["id"] for t in playlist.get("trackIds", [])]
-                if not track_ids and playlist.get("tracks"):
-                    # 备选方案：如果 trackIds 为空，尝试直接用 tracks
-                    track_ids = [t["id"] for t in playlist["tracks"]]
-                
-                if not track_ids:
-                    return []
-                
-                # 限制获取数量，防止请求过大
-                track_ids = track_ids[:300]
-                
-                # 分批获取歌曲详情 (每批 50 个 ID)
-                for i in range(0, len(track_ids), 50):
-                    batch_ids = track_ids[i:i+50]
-                    ids_str = ",".join(map(str, batch_ids))
-                    ids_param = "[" + ",".join(map(str, batch_ids)) + "]"
-                    song_url = f"https://music.163.com/api/song/detail?ids={ids_param}"
-                    
-                    song_resp = await client.get(song_url)
-                    if song_resp.status_code == 200:
-                        song_data = song_resp.json()
-                        for track in song_data.get("songs", []):
-                            songs_list.append({
-                                "title": track["name"],
-                                "artist": track["artists"][0]["name"],
-                                "id": track["id"]
-                            })
+                return [
+                    {
+                        "title": track["name"],
+                        "artist": track["artists"][0]["name"] if track.get("artists") else "未知歌手",
+                        "id": track["id"],
+                    }
+                    for track in resp.json().get("songs") or []
+                    if track.get("name")
+                ]
+            logger.warning(f"获取歌曲详情返回异常 ({len(song_ids)} 首): {resp.status_code}")
         except Exception as e:
-            print(f"导入歌单出错: {e}")
-    return songs_list
+            logger.error(f"批量获取歌曲详情失败 ({len(song_ids)} 首, 第 {attempt + 1} 次): {e}")
+    return None
+
+async def ncm_iter_playlist_songs(track_ids: List[int], batch_size: int = 50):
+    """并发获取歌曲详情，按歌单顺序逐批产出；失败的批次产出空列表"""
+    semaphore = asyncio.Semaphore(max(1, config.guess_song_import_concurrency))
+
+    async def fetch(batch: List[int]) -> Optional[List[Dict[str, Any]]]:
+        async with semaphore:
+            return await ncm_get_song_details(batch)
+
+    tasks = [
+        asyncio.ensure_future(fetch(track_ids[i:i + batch_size]))
+        for i in range(0, len(track_ids), batch_size)
+    ]
+    try:
+        # 所有批次同时进行（受信号量限制），按顺序等待即可保持歌单顺序
+        for task in tasks:
+            yield await task or []
+    finally:
+        for task in tasks:
+            task.cancel()
 
 # 命令注册
 guess_song = on_command("猜歌", priority=5, block=True)
@@ -270,7 +347,7 @@ async def _():
         "• 导入歌曲 <链接/ID> - 从网易云导入歌曲/歌单\n"
         "• 删除歌曲 <歌名> - 从库中移除歌曲\n\n"
         "📖 游戏说明：\n"
-        "系统会随机给出一段歌词或语音，你可以回复【选项序号】或【歌名关键字】来回答。回答错误或格式不对将结束本轮游戏。"
+        "系统会随机给出一段歌词或语音，群内所有人都可以回复【选项序号】或【歌名】来回答（不区分大小写、全半角和标点）。每人每局只有一次机会，答对或超时后本局结束。"
     )
     await guess_help.finish(help_msg)
 
@@ -292,7 +369,6 @@ async def handle_import(matcher: Matcher, text: str):
         else:
             await matcher.finish("无法解析链接，请确保是网易云音乐的歌曲或歌单链接")
 
-    songs = load_songs()
     added_count = 0
     
     if song_id:
@@ -300,34 +376,38 @@ async def handle_import(matcher: Matcher, text: str):
         if not info:
             await matcher.finish(f"未找到 ID 为 {song_id} 的歌曲信息")
         
-        if any(s.get("id") == song_id or s["title"] == info["title"] for s in songs):
+        if not library.add(info):
             await matcher.finish(f"歌曲《{info['title']}》已在库中")
         
-        songs.append(info)
         added_count = 1
         msg = f"成功导入歌曲：《{info['title']}》- {info['artist']} (ID: {song_id})"
     else:
-        # 导入歌单
-        new_songs = await ncm_get_playlist_songs(playlist_id)
-        if not new_songs:
+        # 导入歌单：分批并发获取，每批到达后直接写入曲库索引，最后保存一次
+        track_ids = await ncm_get_playlist_track_ids(playlist_id)
+        if not track_ids:
             await matcher.finish(f"未找到 ID 为 {playlist_id} 的歌单或歌单为空")
-        
-        # 限制单次导入上限为 200 首
-        if len(new_songs) > 200:
-            new_songs = new_songs[:200]
-            await matcher.send("⚠️ 歌单歌曲较多，为保证稳定性，本次仅尝试导入前 200 首。")
-        
-        current_ids = {s.get("id") for s in songs if s.get("id")}
-        current_titles = {s["title"] for s in songs}
-        
-        for s in new_songs:
-            if s.get("id") not in current_ids and s["title"] not in current_titles:
-                songs.append(s)
-                added_count += 1
+
+        total = len(track_ids)
+        if total > 200:
+            await matcher.send(f"歌单共 {total} 首歌曲，正在导入...")
+        fetched = 0
+        last_report = time.monotonic()
+        try:
+            async for songs in ncm_iter_playlist_songs(track_ids):
+                fetched += len(songs)
+                added_count += library.add_many(songs, save=False)
+                if time.monotonic() - last_report >= IMPORT_PROGRESS_INTERVAL and fetched < total:
+                    last_report = time.monotonic()
+                    await matcher.send(f"导入中：已获取 {fetched}/{total} 首，新增 {added_count} 首")
+        finally:
+            if added_count:
+                library.save()
+
         msg = f"成功从歌单导入 {added_count} 首新歌曲！"
+        if fetched < total:
+            msg += f"\n有 {total - fetched} 首歌曲获取详情失败，可稍后重新导入"
 
     if added_count > 0:
-        save_songs(songs)
         await matcher.finish(msg)
     else:
         await matcher.finish("未发现新歌曲（可能已全部在库中）")
@@ -341,7 +421,7 @@ async def _(matcher: Matcher, args: Message = CommandArg()):
 
 @list_songs.handle()
 async def _(bot: Bot, event: MessageEvent, args: Message = CommandArg()):
-    songs = load_songs()
+    songs = library.songs()
     if not songs:
         await list_songs.finish("歌曲库为空")
     
@@ -438,12 +518,9 @@ async def _(bot: Bot, matcher: Matcher, event: MessageEvent, args: Message = Com
         song_id = int(keyword)
     else:
         # 2. 尝试从本地库匹配
-        songs = load_songs()
-        for s in songs:
-            if keyword.lower() in s["title"].lower() or keyword.lower() in s["artist"].lower():
-                song_id = s.get("id")
-                song_title = f"{s['title']} - {s['artist']}"
-                break
+        for s in library.search(keyword, limit=1):
+            song_id = s.get("id")
+            song_title = f"{s['title']} - {s['artist']}"
         
         # 3. 如果没匹配到或本地没 ID，去网易云搜
         if not song_id:
@@ -639,8 +716,7 @@ async def _(matcher: Matcher, args: Message = CommandArg()):
         await add_song.finish("使用方法: 添加歌曲 <歌名> <歌手> 或 <网易云链接>")
     
     title, artist = parts[0].strip(), parts[1].strip()
-    songs = load_songs()
-    if any(s["title"] == title for s in songs):
+    if library.contains(title):
         await add_song.finish(f"歌曲《{title}》已在库中")
     
     # 尝试搜索并保存 ID
@@ -651,8 +727,8 @@ async def _(matcher: Matcher, args: Message = CommandArg()):
     if song_id:
         song_entry["id"] = song_id
         
-    songs.append(song_entry)
-    save_songs(songs)
+    if not library.add(song_entry):
+        await add_song.finish(f"歌曲《{title}》已在库中（ID: {song_id}）")
     
     msg = f"成功添加歌曲《{title}》- {artist}"
     if song_id:
@@ -668,39 +744,116 @@ async def _(args: Message = CommandArg()):
     if not title:
         await del_song.finish("使用方法: 删除歌曲 <歌名>")
     
-    songs = load_songs()
-    new_songs = [s for s in songs if s["title"] != title]
-    if len(songs) == len(new_songs):
+    if not library.remove(title):
         await del_song.finish(f"未找到歌曲《{title}》")
     
-    save_songs(new_songs)
     await del_song.finish(f"成功删除歌曲《{title}》")
 
-@guess_song.handle()
-async def _(matcher: Matcher, state: T_State, args: Message = CommandArg()):
-    mode_arg = args.extract_plain_text().strip()
-    
-    songs = load_songs()
-    if len(songs) < 4:
-        await guess_song.finish("歌曲库数量不足（至少需要4首），请先添加歌曲")
-    
-    # 随机选一首歌
-    target_song = random.choice(songs)
-    state["target"] = target_song
-    
-    # 优先使用 JSON 中记录性 ID
-    song_id = target_song.get("id")
+async def resolve_song_id(song: Dict[str, Any]) -> Optional[int]:
+    """优先使用曲库中记录的 ID，没有时搜索网易云并写回曲库"""
+    song_id = song.get("id")
     if not song_id:
-        # 获取网易云 ID
-        keyword = f"{target_song['title']} {target_song['artist']}"
+        keyword = f"{song['title']} {song['artist']}"
         search_results = await ncm_search(keyword, limit=1)
         song_id = search_results[0]["id"] if search_results else None
+        if song_id:
+            library.set_id(song, song_id)
+    return song_id
+
+async def prepare_round() -> Optional[Dict[str, Any]]:
+    """预先准备一局：选歌、截取歌词、下载音频并截取片段"""
+    song = library.random_song()
+    if not song:
+        return None
+    song_id = await resolve_song_id(song)
+    if not song_id:
+        return None
+    lyric, audio = await asyncio.gather(ncm_get_lyrics(song_id), get_round_audio(song_id))
+    return {"song": song, "song_id": song_id, "lyric": lyric, "audio": audio}
+
+def _round_valid(prepared: Dict[str, Any]) -> bool:
+    # 歌曲可能已被删除，音频文件可能已被清理
+    if library.get_by_title(prepared["song"]["title"]) is not prepared["song"]:
+        return False
+    return prepared["audio"] is None or prepared["audio"][0].exists()
+
+prefetcher = RoundPrefetcher(
+    prepare_round,
+    size=config.guess_song_prefetch_size,
+    max_age=config.guess_song_prefetch_max_age,
+)
+
+@driver.on_shutdown
+async def _stop_prefetch():
+    await prefetcher.stop()
+
+@scheduler.scheduled_job("interval", minutes=30, id="guess_song_prefetch_cleanup")
+async def _():
+    prefetcher.cleanup()
+
+def session_key(event: MessageEvent) -> str:
+    if isinstance(event, GroupMessageEvent):
+        return f"group_{event.group_id}"
+    return f"private_{event.user_id}"
+
+def format_options(options: List[str]) -> str:
+    option_str = "\n".join([f"{i+1}. {opt}" for i, opt in enumerate(options)])
+    return f"【猜歌名 - 选项提示】\n{option_str}\n\n请输入歌名或选项序号进行回答！"
+
+async def _on_timeout(session: GameSession):
+    target = session.target
+    msg = f"⏰ 时间到！正确答案是《{target['title']}》- {target['artist']}"
+    if session.group_id is not None:
+        await session.bot.send_group_msg(group_id=session.group_id, message=msg)
+    else:
+        await session.bot.send_private_msg(user_id=session.user_id, message=msg)
+
+# 进行中的游戏保存在内存里，由一个时间轮统一处理超时
+sessions = SessionEngine(config.guess_song_session_path, config.guess_song_timeout, _on_timeout)
+sessions.load()
+
+@driver.on_startup
+async def _start_sessions():
+    sessions.wheel.start()
+
+@driver.on_shutdown
+async def _stop_sessions():
+    await sessions.wheel.stop()
+
+@guess_song.handle()
+async def _(bot: Bot, matcher: Matcher, event: MessageEvent, args: Message = CommandArg()):
+    mode_arg = args.extract_plain_text().strip()
+    key = session_key(event)
+
+    current = sessions.get(key)
+    if current:
+        await guess_song.finish(f"当前已有一局猜歌正在进行\n\n{format_options(current.options)}")
+    if len(library) < 4:
+        await guess_song.finish("歌曲库数量不足（至少需要4首），请先添加歌曲")
+    if not sessions.reserve(key):
+        await guess_song.finish("正在准备题目，请稍候")
+    try:
+        await start_round(bot, matcher, event, key, mode_arg)
+    finally:
+        sessions.release(key)
+
+async def start_round(bot: Bot, matcher: Matcher, event: MessageEvent, key: str, mode_arg: str):
+    # 群聊优先使用后台预先准备好的一局，并在开局后补充下一局
+    prepared = None
+    if isinstance(event, GroupMessageEvent):
+        prepared = prefetcher.take(event.group_id, valid=_round_valid)
+        prefetcher.refill(event.group_id)
+    
+    if prepared:
+        target_song, song_id = prepared["song"], prepared["song_id"]
+    else:
+        # 随机选一首歌
+        target_song = library.random_song()
+        song_id = await resolve_song_id(target_song)
     
     if not song_id:
         await guess_song.finish(f"网易云中未搜索到歌曲《{target_song['title']}》")
     
-    state["song_id"] = song_id
-    
     # 选择游戏模式: 歌词或语音
     if mode_arg in ["歌词", "lyric"]:
         mode = "lyric"
@@ -708,27 +861,23 @@ async def _(matcher: Matcher, state: T_State, args: Message = CommandArg()):
         mode = "voice"
     else:
         mode = random.choice(["lyric", "voice"])
-    state["mode"] = mode
     
     msg = Message()
+    audio_url = ""
     if mode == "lyric":
-        lyric = await ncm_get_lyrics(song_id)
+        lyric = prepared["lyric"] if prepared else await ncm_get_lyrics(song_id)
         if not lyric:
             lyric = "（无法获取歌词，请尝试猜歌名）"
         msg.append(f"【猜歌名 - 歌词模式】\n歌词片段：\n{lyric}")
     else:
-        # 语音模式 (猜歌游戏使用 128000 节约带宽)
-        clean_cache()
-        audio_info = await ncm_get_audio(song_id, br=128000)
+        # 语音模式 (只发送截取的片段)
+        audio_info = prepared["audio"] if prepared else await get_round_audio(song_id)
         if audio_info:
             audio_path, audio_url = audio_info
-            state["audio_path"] = str(audio_path)
-            state["audio_url"] = audio_url
             msg.append(MessageSegment.record(audio_path.absolute().as_uri()))
             msg.append("\n【猜歌名 - 语音模式】")
         else:
             mode = "lyric"
-            state["mode"] = mode
             lyric = await ncm_get_lyrics(song_id)
             if not lyric:
                 lyric = "（无法获取音频和歌词，请直接根据选项猜歌）"
@@ -736,24 +885,33 @@ async def _(matcher: Matcher, state: T_State, args: Message = CommandArg()):
     
     # 生成选项
     options = [target_song["title"]]
-    other_songs = [s["title"] for s in songs if s["title"] != target_song["title"]]
-    options.extend(random.sample(other_songs, min(3, len(other_songs))))
+    options.extend(library.random_titles(3, exclude=target_song["title"]))
     random.shuffle(options)
-    
-    state["options"] = options
-    option_str = "\n".join([f"{i+1}. {opt}" for i, opt in enumerate(options)])
+    option_msg = format_options(options)
+
+    # 题目发出前就开始计时并接受回答
+    sessions.start(GameSession(
+        key=key,
+        bot=bot,
+        group_id=event.group_id if isinstance(event, GroupMessageEvent) else None,
+        user_id=event.user_id,
+        target=target_song,
+        song_id=song_id,
+        mode=mode,
+        options=options,
+        deadline=sessions.new_deadline(),
+    ))
     
     if mode == "voice":
         try:
             await matcher.send(msg)
-            await matcher.send(f"【猜歌名 - 选项提示】\n{option_str}\n\n请输入歌名或选项序号进行回答！")
+            await matcher.send(option_msg)
         except ActionFailed:
             # 语音发送失败回退
-            audio_url = state.get("audio_url")
             try:
                 # 尝试使用 URL 直接发送
                 await matcher.send(MessageSegment.record(audio_url) + "\n【猜歌名 - 语音模式(URL回退)】")
-                await matcher.send(f"【猜歌名 - 选项提示】\n{option_str}\n\n请输入歌名或选项序号进行回答！")
+                await matcher.send(option_msg)
             except Exception:
                 # 最终回退到歌词
                 lyric = await ncm_get_lyrics(song_id)
@@ -764,29 +922,44 @@ async def _(matcher: Matcher, state: T_State, args: Message = CommandArg()):
                     fallback_msg += "，请直接根据选项猜歌名。"
                 
                 await matcher.send(fallback_msg)
-                await matcher.send(f"【猜歌名 - 选项提示】\n{option_str}\n\n请输入歌名或选项序号进行回答！")
+                await matcher.send(option_msg)
     else:
         # 歌词模式直接发送
         await matcher.send(msg)
-        await matcher.send(f"【猜歌名 - 选项提示】\n{option_str}\n\n请输入歌名或选项序号进行回答！")
-
-@guess_song.receive()
+        await matcher.send(option_msg)
+
+async def _answer_rule(event: MessageEvent, state: T_State) -> bool:
+    """只有进行中的游戏里、是选项序号或某个选项歌名的消息才算回答"""
+    session = sessions.get(session_key(event))
+    if session is None or event.user_id in session.tried:
+        return False
+    result = session.check(event.get_plaintext())
+    if result is None:
+        return False
+    state["session"] = session
+    state["correct"] = result
+    return True
+
+guess_answer = on_message(rule=Rule(_answer_rule), priority=4, block=True)
+
+@guess_answer.handle()
 async def _(matcher: Matcher, event: MessageEvent, state: T_State):
-    answer = event.get_plaintext().strip()
-    target = state["target"]
-    options = state["options"]
-    
-    # 检查序号
-    is_correct = False
-    if answer.isdigit():
-        idx = int(answer) - 1
-        if 0 <= idx < len(options):
-            if options[idx] == target["title"]:
-                is_correct = True
-    elif answer == target["title"] or target["title"] in answer:
-        is_correct = True
-        
-    if is_correct:
-        await matcher.finish(f"恭喜你答对了！这首歌正是《{target['title']}》- {target['artist']}")
-    else:
-        await matcher.finish(f"很遗憾，答错了。正确答案是《{target['title']}》- {target['artist']}")
+    session: GameSession = state["session"]
+    target = session.target
+    if state["correct"]:
+        # 同时答对时只认第一个
+        if not sessions.end(session, winner=event.user_id):
+            return
+        wins = sessions.wins(session.key, event.user_id)
+        await matcher.finish(
+            f"恭喜你答对了！这首歌正是《{target['title']}》- {target['artist']}\n（累计猜对 {wins} 首）",
+            reply_message=True,
+        )
+
+    session.tried.add(event.user_id)
+    # 私聊只有一次机会；群里每人一次机会，答错的人本局不能再回答
+    if session.group_id is None:
+        if sessions.end(session):
+            await matcher.finish(f"很遗憾，答错了。正确答案是《{target['title']}》- {target['artist']}")
+        return
+    await matcher.finish("很遗憾，答错了，本局你不能再回答了", reply_message=True)
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from nonebot.log import logger
+
+# MPEG Layer III 比特率表（kbps），分别对应 MPEG-1 与 MPEG-2/2.5
+_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0),
+}
+# 版本位 -> 采样率表：3 为 MPEG-1，2 为 MPEG-2，0 为 MPEG-2.5
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+# (偏移, 长度, 时长秒)
+Frame = Tuple[int, int, float]
+
+
+def _frame_at(data: bytes, pos: int) -> Optional[Frame]:
+    """解析 pos 处的 Layer III 帧头，不是合法帧头时返回 None"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[pos + 1] >> 3) & 3
+    layer = (data[pos + 1] >> 1) & 3
+    bitrate_index = data[pos + 2] >> 4
+    sample_index = (data[pos + 2] >> 2) & 3
+    padding = (data[pos + 2] >> 1) & 1
+    if version == 1 or layer != 1 or not 0 < bitrate_index < 15 or sample_index == 3:
+        return None
+    sample_rate = _SAMPLE_RATES[version][sample_index]
+    if version == 3:
+        bitrate = _BITRATES[1][bitrate_index] * 1000
+        length, samples = 144 * bitrate // sample_rate + padding, 1152
+    else:
+        bitrate = _BITRATES[2][bitrate_index] * 1000
+        length, samples = 72 * bitrate // sample_rate + padding, 576
+    return pos, length, samples / sample_rate
+
+
+def _id3_size(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+    # 标志位 0x10 表示带有 10 字节的尾部
+    return size + (20 if data[5] & 0x10 else 10)
+
+
+def parse_frames(data: bytes) -> List[Frame]:
+    """逐帧解析 MP3，跳过开头的 ID3 标签和无法识别的字节"""
+    frames: List[Frame] = []
+    pos = _id3_size(data)
+    end = len(data)
+    synced = False
+    while pos + 4 <= end:
+        frame = _frame_at(data, pos)
+        # 失步后重新同步时，要求下一帧也能对上，避免把数据中的 0xFF 当成帧头
+        if frame and (synced or pos + frame[1] >= end or _frame_at(data, pos + frame[1])):
+            if pos + frame[1] > end:
+                break
+            frames.append(frame)
+            pos += frame[1]
+            synced = True
+            continue
+        synced = False
+        nxt = data.find(b"\xff", pos + 1)
+        if nxt == -1:
+            break
+        pos = nxt
+    return frames
+
+
+def cut_clip(data: bytes, start: float, duration: float) -> Optional[bytes]:
+    """按帧边界截取 [start, start + duration) 的片段，start 超出时向前对齐到结尾"""
+    frames = parse_frames(data)
+    if len(frames) < 10:
+        return None
+    total = sum(f[2] for f in frames)
+    start = max(0.0, min(start, total - duration))
+    parts = []
+    elapsed = 0.0
+    for offset, length, seconds in frames:
+        if elapsed >= start + duration:
+            break
+        if elapsed >= start:
+            parts.append(data[offset:offset + length])
+        elapsed += seconds
+    return b"".join(parts) or None
+
+
+def mp3_duration(data: bytes) -> float:
+    return sum(f[2] for f in parse_frames(data))
+
+
+class AudioCache:
+    """按字节预算管理的音频缓存（整首与片段共用），超出时淘汰最久未使用的文件
+
+    访问时间记录在文件的 mtime 上，重启后按 mtime 恢复使用顺序。
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # 文件名 -> 大小，按最近使用顺序排列
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        # 写入与淘汰在线程中进行，串行执行，避免刚写入的同名文件被另一次淘汰删掉
+        self._io_lock = asyncio.Lock()
+
+    def load(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.cache_dir.glob("*.mp3"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        for tmp in self.cache_dir.glob("*.tmp"):
+            tmp.unlink(missing_ok=True)
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self.total_bytes += size
+        self.evict()
+
+    def get(self, name: str) -> Optional[Path]:
+        """命中时刷新访问时间并返回路径"""
+        if name not in self._files:
+            return None
+        path = self.cache_dir / name
+        try:
+            os.utime(path)
+        except OSError:
+            self._forget(name)
+            return None
+        self._files.move_to_end(name)
+        return path
+
+    async def put(self, name: str, data: bytes) -> Path:
+        """写入文件与删除被淘汰的文件都在线程中进行，索引只在事件循环中修改"""
+        path = self.cache_dir / name
+        async with self._io_lock:
+            await asyncio.to_thread(_write_atomic, path, data)
+            self._forget(name)
+            self._files[name] = len(data)
+            self.total_bytes += len(data)
+            victims = self._take_victims(keep=name)
+            if victims:
+                await asyncio.to_thread(self._unlink, victims)
+        return path
+
+    def _forget(self, name: str):
+        size = self._files.pop(name, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def _take_victims(self, keep: Optional[str] = None) -> List[str]:
+        """从索引中移除超出预算的最久未使用文件，返回待删除的文件名"""
+        victims = []
+        for name in list(self._files):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            self._forget(name)
+            victims.append(name)
+        return victims
+
+    def _unlink(self, names: List[str]):
+        for name in names:
+            (self.cache_dir / name).unlink(missing_ok=True)
+        logger.info(f"猜歌插件：音频缓存超出上限，已淘汰 {len(names)} 个最久未使用的文件")
+
+    def evict(self, keep: Optional[str] = None):
+        victims = self._take_victims(keep)
+        if victims:
+            self._unlink(victims)
+
+
+def _write_atomic(path: Path, data: bytes):
+    # 同名文件可能被并发写入，临时文件名各不相同
+    tmp = path.with_name(f"{path.stem}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+async def _ffmpeg_clip(source: Path, start: float, duration: float) -> Optional[bytes]:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            ffmpeg, "-v", "error", "-ss", f"{start:.3f}", "-t", f"{duration:.3f}", "-i", str(source),
+            "-vn", "-c:a", "copy", "-f", "mp3", "pipe:1",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), 30)
+        except asyncio.TimeoutError:
+            proc.kill()
+            raise
+    except Exception as e:
+        logger.warning(f"猜歌插件：ffmpeg 截取片段失败: {e}")
+        return None
+    if proc.returncode != 0 or not out:
+        logger.warning(f"猜歌插件：ffmpeg 截取片段失败: {err.decode(errors='ignore').strip()}")
+        return None
+    return out
+
+
+async def extract_clip(source: Path, start_ratio: float, duration: float) -> Optional[bytes]:
+    """从整首 MP3 中截取片段，起点为全曲时长的 start_ratio 处
+
+    有 ffmpeg 时用它截取，否则（或失败时）直接按帧切分。
+    """
+    data = await asyncio.to_thread(source.read_bytes)
+    total = await asyncio.to_thread(mp3_duration, data)
+    if total <= 0:
+        return None
+    start = max(0.0, min(total * start_ratio, total - duration))
+    clip = await _ffmpeg_clip(source, start, duration)
+    if clip is None:
+        clip = await asyncio.to_thread(cut_clip, data, start, duration)
+    return clip
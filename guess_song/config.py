@@ -3,7 +3,20 @@ from pathlib import Path
 
 class Config(BaseModel):
     guess_song_data_path: Path = Path(__file__).parent / "data" / "songs.json"
+    # 每个群的猜歌战绩，只在每局结束时写入
     guess_song_session_path: Path = Path(__file__).parent / "data" / "session.json"
     guess_song_cache_dir: Path = Path(__file__).parent / "cache"
-    guess_song_timeout: int = 60
+    guess_song_timeout: int = 60  # 每局限时（秒）
     guess_song_cookie: str = ""  # 备用 MUSIC_U Cookie
+    # 网易云歌词、歌曲信息与搜索结果缓存
+    guess_song_ncm_cache_path: Path = Path(__file__).parent / "data" / "ncm_cache.db"
+    guess_song_search_ttl: int = 86400  # 搜索结果缓存秒数
+    # 每个活跃的群预先准备好的局数（0 为关闭），以及准备好的局的有效期（秒）
+    guess_song_prefetch_size: int = 2
+    guess_song_prefetch_max_age: int = 1800
+    # 音频缓存上限（MB），超出时淘汰最久未使用的文件；猜歌片段长度（秒）与每首歌的片段起点数
+    guess_song_cache_max_mb: int = 1024
+    guess_song_clip_seconds: int = 15
+    guess_song_clip_slots: int = 4
+    # 导入歌单时同时进行的歌曲详情请求数（每批 50 首）
+    guess_song_import_concurrency: int = 4
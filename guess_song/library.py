@@ -0,0 +1,179 @@
+import json
+import random
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from nonebot.log import logger
+
+
+def _grams(text: str, n: int) -> Set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SongLibrary:
+    """常驻内存的曲库，启动时从 songs.json 读取一次
+
+    - 歌名、歌曲 ID 唯一索引，查重和查找都是 O(1)（旧曲库里已有的同名歌曲
+      读取时原样保留，之后添加的歌曲不允许重复）；
+    - 歌名和歌手建立单字与二字 n-gram 倒排索引，用于模糊查找；
+    - 随机抽歌与抽取干扰项为 O(1)，不需要遍历整个曲库。
+    歌曲在 songs.json 中保持添加顺序，歌曲列表按此顺序显示。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        # 序号 -> 歌曲，序号按添加顺序递增
+        self._songs: Dict[int, Dict] = {}
+        self._next_seq = 0
+        self._by_title: Dict[str, List[int]] = {}
+        self._by_id: Dict[int, int] = {}
+        # 用于 O(1) 随机抽样：序号数组，删除时与末尾交换
+        self._keys: List[int] = []
+        self._pos: Dict[int, int] = {}
+        self._grams: Dict[str, Set[int]] = {}
+
+    def load(self):
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.save()
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            songs = json.load(f)
+        duplicates = sum(1 for song in songs if self._add(song, allow_duplicate=True) is None)
+        if duplicates:
+            logger.warning(f"猜歌插件：曲库中有 {duplicates} 首歌曲与其他歌曲同名或 ID 相同")
+
+    def save(self):
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(self._songs.values()), f, ensure_ascii=False, indent=2)
+        tmp.replace(self.path)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def songs(self) -> List[Dict]:
+        """按添加顺序返回全部歌曲"""
+        return list(self._songs.values())
+
+    def contains(self, title: str, song_id: Optional[int] = None) -> bool:
+        return title in self._by_title or (song_id is not None and song_id in self._by_id)
+
+    def get_by_id(self, song_id: int) -> Optional[Dict]:
+        seq = self._by_id.get(song_id)
+        return self._songs[seq] if seq is not None else None
+
+    def get_by_title(self, title: str) -> Optional[Dict]:
+        seqs = self._by_title.get(title)
+        return self._songs[seqs[0]] if seqs else None
+
+    def _index_text(self, song: Dict) -> str:
+        return f"{song['title']}\n{song.get('artist', '')}".lower()
+
+    def _add(self, song: Dict, allow_duplicate: bool = False) -> Optional[int]:
+        """添加到索引，返回序号；重复时返回 None，allow_duplicate 为真时仍然加入"""
+        title = song["title"]
+        song_id = song.get("id")
+        duplicate = self.contains(title, song_id)
+        if duplicate and not allow_duplicate:
+            return None
+        seq = self._next_seq
+        self._next_seq += 1
+        self._songs[seq] = song
+        self._by_title.setdefault(title, []).append(seq)
+        if song_id is not None:
+            self._by_id.setdefault(song_id, seq)
+        self._pos[seq] = len(self._keys)
+        self._keys.append(seq)
+        text = self._index_text(song)
+        for gram in _grams(text, 1) | _grams(text, 2):
+            self._grams.setdefault(gram, set()).add(seq)
+        return None if duplicate else seq
+
+    def add(self, song: Dict, save: bool = True) -> bool:
+        """添加歌曲，歌名或 ID 已存在时返回 False"""
+        if self._add(song) is None:
+            return False
+        if save:
+            self.save()
+        return True
+
+    def add_many(self, songs: Iterable[Dict], save: bool = True) -> int:
+        """批量添加并只保存一次，返回新增数量；save 为假时由调用方稍后保存"""
+        added = sum(1 for song in songs if self._add(song) is not None)
+        if added and save:
+            self.save()
+        return added
+
+    def set_id(self, song: Dict, song_id: int):
+        """记下搜索到的歌曲 ID，之后开局不必再搜索"""
+        seqs = self._by_title.get(song["title"], ())
+        seq = next((q for q in seqs if self._songs[q] is song), None)
+        if seq is None or song.get("id") is not None or song_id in self._by_id:
+            return
+        song["id"] = song_id
+        self._by_id[song_id] = seq
+        self.save()
+
+    def remove(self, title: str) -> bool:
+        """删除该歌名的所有歌曲"""
+        seqs = self._by_title.pop(title, None)
+        if not seqs:
+            return False
+        for seq in seqs:
+            self._remove_seq(seq)
+        self.save()
+        return True
+
+    def _remove_seq(self, seq: int):
+        song = self._songs.pop(seq)
+        if self._by_id.get(song.get("id")) == seq:
+            del self._by_id[song["id"]]
+        # 与末尾交换后弹出，保持随机抽样数组紧凑
+        pos = self._pos.pop(seq)
+        last = self._keys.pop()
+        if last != seq:
+            self._keys[pos] = last
+            self._pos[last] = pos
+        text = self._index_text(song)
+        for gram in _grams(text, 1) | _grams(text, 2):
+            bucket = self._grams.get(gram)
+            if bucket is not None:
+                bucket.discard(seq)
+                if not bucket:
+                    del self._grams[gram]
+
+    def search(self, keyword: str, limit: int = 10) -> List[Dict]:
+        """歌名或歌手包含关键字的歌曲，按添加顺序返回"""
+        keyword = keyword.strip().lower()
+        if not keyword:
+            return []
+        grams = _grams(keyword, 2) if len(keyword) >= 2 else {keyword}
+        buckets = sorted((self._grams.get(g, set()) for g in grams), key=len)
+        if not buckets or not buckets[0]:
+            return []
+        candidates = set(buckets[0]).intersection(*buckets[1:])
+        results = []
+        # n-gram 只是必要条件，最后用子串确认
+        for seq in sorted(candidates):
+            song = self._songs[seq]
+            if keyword in song["title"].lower() or keyword in song.get("artist", "").lower():
+                results.append(song)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def random_song(self) -> Optional[Dict]:
+        if not self._keys:
+            return None
+        return self._songs[random.choice(self._keys)]
+
+    def random_titles(self, k: int, exclude: str) -> List[str]:
+        """随机抽取 k 个不同的歌名作为干扰项，不含 exclude"""
+        k = min(k, len(self._by_title) - (1 if exclude in self._by_title else 0))
+        picked: Dict[str, None] = {}
+        while len(picked) < k:
+            title = self._songs[random.choice(self._keys)]["title"]
+            if title != exclude:
+                picked[title] = None
+        return list(picked)
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import aiosqlite
+from nonebot.log import logger
+
+
+class NcmCache:
+    """网易云接口结果的本地缓存（SQLite）
+
+    按 (类别, 键) 保存 JSON，ttl 为 None 的条目永久有效（歌词、歌曲信息），
+    搜索结果带过期时间。相同的并发请求只会真正请求一次，其余等待同一个结果。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.db: Optional[aiosqlite.Connection] = None
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    async def start(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = await aiosqlite.connect(self.path)
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                time REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+        """)
+        await self.db.commit()
+
+    async def stop(self):
+        if self.db:
+            await self.db.close()
+            self.db = None
+
+    async def get(self, kind: str, key: str, ttl: Optional[float] = None) -> Optional[Any]:
+        if not self.db:
+            return None
+        cursor = await self.db.execute("SELECT value, time FROM cache WHERE kind = ? AND key = ?", (kind, key))
+        row = await cursor.fetchone()
+        if row is None or (ttl is not None and time.time() - row[1] > ttl):
+            return None
+        return json.loads(row[0])
+
+    async def set(self, kind: str, key: str, value: Any):
+        if not self.db:
+            return
+        await self.db.execute(
+            "INSERT OR REPLACE INTO cache (kind, key, value, time) VALUES (?, ?, ?, ?)",
+            (kind, key, json.dumps(value, ensure_ascii=False), time.time()),
+        )
+        await self.db.commit()
+
+    async def fetch(
+        self,
+        kind: str,
+        key: Any,
+        loader: Callable[[], Awaitable[Optional[Any]]],
+        ttl: Optional[float] = None,
+    ) -> Optional[Any]:
+        """先查缓存，未命中时调用 loader；loader 返回 None 表示请求失败，不缓存"""
+        key = str(key)
+        try:
+            value = await self.get(kind, key, ttl)
+        except Exception as e:
+            logger.error(f"猜歌插件：读取缓存失败 ({kind}/{key}): {e}")
+            value = None
+        if value is not None:
+            return value
+
+        task = self._inflight.get((kind, key))
+        if task is None:
+            task = asyncio.ensure_future(self._load(kind, key, loader))
+            self._inflight[(kind, key)] = task
+            task.add_done_callback(lambda _: self._inflight.pop((kind, key), None))
+        return await asyncio.shield(task)
+
+    async def _load(self, kind: str, key: str, loader: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        value = await loader()
+        if value is not None:
+            try:
+                await self.set(kind, key, value)
+            except Exception as e:
+                logger.error(f"猜歌插件：写入缓存失败 ({kind}/{key}): {e}")
+        return value
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from nonebot.log import logger
+
+# 准备一局游戏：选歌、截取歌词、下载音频，失败返回 None
+Preparer = Callable[[], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class RoundPrefetcher:
+    """为活跃的群预先准备好接下来几局游戏
+
+    每个群维护一个小队列，开局时直接取出，同时在后台补满。
+    队列中放置超过 max_age 秒的局视为过期（音频缓存可能已被清理）。
+    超过 idle_timeout 秒没有开局的群不再补充，队列随之丢弃。
+    """
+
+    def __init__(self, prepare: Preparer, size: int = 2, max_age: float = 1800, idle_timeout: float = 3600):
+        self.prepare = prepare
+        self.size = max(0, size)
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self._queues: Dict[int, Deque[Dict[str, Any]]] = {}
+        self._last_active: Dict[int, float] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def take(self, group_id: int, valid: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Optional[Dict[str, Any]]:
+        """取出一局准备好的游戏，没有时返回 None；valid 用于排除已失效的局"""
+        self._last_active[group_id] = time.time()
+        queue = self._queues.get(group_id)
+        while queue:
+            prepared = queue.popleft()
+            if time.time() - prepared["prepared_at"] <= self.max_age and (valid is None or valid(prepared)):
+                return prepared
+        return None
+
+    def refill(self, group_id: int):
+        """在后台把该群的队列补满，不等待"""
+        if self.size <= 0:
+            return
+        self._last_active[group_id] = time.time()
+        task = self._tasks.get(group_id)
+        if task is None or task.done():
+            self._tasks[group_id] = asyncio.create_task(self._refill(group_id))
+
+    async def _refill(self, group_id: int):
+        queue = self._queues.setdefault(group_id, deque())
+        failures = 0
+        while len(queue) < self.size and failures < 3:
+            if time.time() - self._last_active.get(group_id, 0) > self.idle_timeout:
+                break
+            try:
+                prepared = await self.prepare()
+            except Exception as e:
+                logger.error(f"猜歌插件：预取失败 (群 {group_id}): {e}")
+                prepared = None
+            if prepared is None:
+                failures += 1
+                continue
+            # 避免同一首歌在队列里出现两次
+            if any(p["song_id"] == prepared["song_id"] for p in queue):
+                failures += 1
+                continue
+            prepared["prepared_at"] = time.time()
+            queue.append(prepared)
+
+    def cleanup(self):
+        """丢弃长时间不活跃的群的队列"""
+        now = time.time()
+        for group_id, last in list(self._last_active.items()):
+            if now - last > self.idle_timeout:
+                self._last_active.pop(group_id, None)
+                self._queues.pop(group_id, None)
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import math
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from nonebot.log import logger
+
+# 歌名中的附注：(Live)、（翻自 xxx）、【伴奏】、《》等
+_BRACKETS = re.compile(r"[(\[（【「『《<].*?[)\]）】」』》>]")
+
+
+def normalize(text: str) -> str:
+    """全半角统一（NFKC）、忽略大小写，并去掉标点、符号和空白"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] in "LMN")
+
+
+def title_variants(title: str) -> Set[str]:
+    """歌名可接受的写法：原名、去掉括号附注、去掉 " - " 之后的副标题"""
+    variants = {title, _BRACKETS.sub("", title), title.split(" - ")[0]}
+    return {v for v in map(normalize, variants) if v}
+
+
+@dataclass
+class GameSession:
+    key: str
+    bot: Any
+    group_id: Optional[int]
+    user_id: int
+    target: Dict[str, Any]
+    song_id: int
+    mode: str
+    options: List[str]
+    deadline: float
+    started_at: float = field(default_factory=time.time)
+    # 归一化后的回答 -> 选项下标，包含选项序号和每个选项歌名的各种写法
+    answers: Dict[str, int] = field(default_factory=dict)
+    answer_index: int = 0
+    # 本局已经答错过的用户
+    tried: Set[int] = field(default_factory=set)
+
+    def __post_init__(self):
+        self.answer_index = self.options.index(self.target["title"])
+        for i in range(len(self.options)):
+            self.answers[str(i + 1)] = i
+        # 先放正确答案，其他选项的写法与之冲突时以正确答案为准
+        order = [self.answer_index] + [i for i in range(len(self.options)) if i != self.answer_index]
+        for i in order:
+            for variant in title_variants(self.options[i]):
+                self.answers.setdefault(variant, i)
+
+    def check(self, text: str) -> Optional[bool]:
+        """判断回答是否正确；不是选项序号也不是任何选项的歌名时返回 None"""
+        index = self.answers.get(normalize(text))
+        if index is None:
+            return None
+        return index == self.answer_index
+
+
+class TimerWheel:
+    """由一个后台任务驱动的时间轮，每 tick 秒推进一格，到期的键交给 on_expire
+
+    取消只删除截止时间，格子里残留的键被访问到时直接跳过；
+    超过一圈的截止时间在被访问到时重新放入对应的格子。
+    """
+
+    def __init__(self, on_expire: Callable[[str], Awaitable[None]], tick: float = 1.0, slots: int = 64):
+        self.on_expire = on_expire
+        self.tick = tick
+        self._slots: List[Set[str]] = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._deadlines: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, key: str, deadline: float):
+        self._deadlines[key] = deadline
+        ticks = max(1, math.ceil((deadline - time.time()) / self.tick))
+        ticks = min(ticks, len(self._slots) - 1)
+        self._slots[(self._cursor + ticks) % len(self._slots)].add(key)
+
+    def cancel(self, key: str):
+        self._deadlines.pop(key, None)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            bucket, self._slots[self._cursor] = self._slots[self._cursor], set()
+            now = time.time()
+            expired = []
+            for key in bucket:
+                deadline = self._deadlines.get(key)
+                if deadline is None:
+                    continue
+                if deadline > now:
+                    self.schedule(key, deadline)
+                    continue
+                del self._deadlines[key]
+                expired.append(key)
+            if expired:
+                await asyncio.gather(*(self._fire(key) for key in expired))
+
+    async def _fire(self, key: str):
+        try:
+            await self.on_expire(key)
+        except Exception as e:
+            logger.error(f"猜歌插件：处理超时失败 ({key}): {e}")
+
+
+class SessionEngine:
+    """按群（私聊按用户）保存进行中的猜歌游戏，全部在内存中
+
+    每局结束（答对或超时）时才把战绩写入 session.json。
+    """
+
+    def __init__(self, path: Path, timeout: float, on_timeout: Callable[[GameSession], Awaitable[None]]):
+        self.path = path
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.sessions: Dict[str, GameSession] = {}
+        # 正在准备（下载音频等）的会话，防止同一个群同时开两局
+        self._reserved: Set[str] = set()
+        self.wheel = TimerWheel(self._expire)
+        # 会话键 -> {"played": 局数, "correct": 答对局数, "users": {QQ: 答对次数}}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self.stats = {k: v for k, v in data.items() if isinstance(v, dict)}
+        except Exception as e:
+            logger.error(f"猜歌插件：读取战绩失败: {e}")
+
+    def save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.stats, f, ensure_ascii=False)
+            tmp.replace(self.path)
+        except Exception as e:
+            logger.error(f"猜歌插件：保存战绩失败: {e}")
+
+    def get(self, key: str) -> Optional[GameSession]:
+        return self.sessions.get(key)
+
+    def reserve(self, key: str) -> bool:
+        if key in self.sessions or key in self._reserved:
+            return False
+        self._reserved.add(key)
+        return True
+
+    def release(self, key: str):
+        self._reserved.discard(key)
+
+    def new_deadline(self) -> float:
+        return time.time() + self.timeout
+
+    def start(self, session: GameSession):
+        self._reserved.discard(session.key)
+        self.sessions[session.key] = session
+        self.wheel.schedule(session.key, session.deadline)
+
+    def end(self, session: GameSession, winner: Optional[int] = None) -> bool:
+        """结束一局并记录战绩；该局已经结束（被别人答对或已超时）时返回 False"""
+        if self.sessions.get(session.key) is not session:
+            return False
+        del self.sessions[session.key]
+        self.wheel.cancel(session.key)
+        stats = self.stats.setdefault(session.key, {"played": 0, "correct": 0, "users": {}})
+        stats["played"] += 1
+        if winner is not None:
+            stats["correct"] += 1
+            users = stats["users"]
+            users[str(winner)] = users.get(str(winner), 0) + 1
+        self.save()
+        return True
+
+    def wins(self, key: str, user_id: int) -> int:
+        return self.stats.get(key, {}).get("users", {}).get(str(user_id), 0)
+
+    async def _expire(self, key: str):
+        session = self.sessions.get(key)
+        if session is None or session.deadline > time.time():
+            return
+        if self.end(session):
+            await self.on_timeout(session)
@@ -0,0 +1,11 @@
+from nonebot.plugin import PluginMetadata
+
+from .repair import JsonRepairer, loads_json, repair_chunks, repair_json, repair_stream
+
+__plugin_meta__ = PluginMetadata(
+    name="JSON 修复",
+    description="流式修复大模型输出的 JSON：截断补全、尾逗号、Python 字面量、漏写的逗号冒号等",
+    usage="无指令，其他插件通过 loads_json / repair_json / repair_stream 调用",
+)
+
+__all__ = ["JsonRepairer", "loads_json", "repair_chunks", "repair_json", "repair_stream"]
@@ -0,0 +1,262 @@
+"""大模型输出 JSON 的流式修复
+
+逐块喂入文本（可以直接接流式补全的增量），单次线性扫描完成以下修复：
+  - 跳过第一个起始括号之前的说明文字和 ```json 标记；
+  - 顶层对象闭合后忽略其余内容；
+  - 丢弃多余的逗号（尾逗号、连续逗号）和不匹配的闭合括号；
+  - 字符串中的换行、制表符等控制字符转义；
+  - 截断时丢弃不完整的键值对，补全未闭合的字符串和括号。
+
+字符串内容按片段整体复制，不逐字符拼接，总耗时与输入长度成正比。
+"""
+import json
+import re
+from typing import Any, AsyncIterable, Iterable, List, Optional
+
+_STRING_SPECIAL = re.compile(r'["\\\x00-\x1f]')
+_VALID_BARE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+_PARTIAL_UNICODE = re.compile(r"(\\+)u[0-9a-fA-F]{0,3}$")
+# 模型偶尔会写出 Python 风格的字面量
+_BARE_FIXES = {"True": "true", "False": "false", "None": "null", "NaN": "null", "Infinity": "null", "-Infinity": "null"}
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_CLOSERS = {"{": "}", "[": "]"}
+# 字符串外的下一个记号：结构字符或一段连续的裸值，前导空白一并跳过
+_TOKEN = re.compile(r'[ \t\r\n]*(?:([{}\[\]":,])|([^ \t\r\n{}\[\]":,]+))?')
+
+# 容器内的期待状态
+KEY, COLON, VALUE, COMMA = "key", "colon", "value", "comma"
+
+
+def _drop_partial_unicode_escape(text: str) -> str:
+    """丢弃末尾被截断的 \\uXXXX 转义"""
+    m = _PARTIAL_UNICODE.search(text)
+    if m and len(m.group(1)) % 2 == 1:
+        return text[:m.start() + len(m.group(1)) - 1]
+    return text
+
+
+class JsonRepairer:
+    """流式 JSON 修复器：多次调用 feed，最后调用 finish 取得修复后的文本"""
+
+    def __init__(self, start_chars: str = "{"):
+        self.start_chars = start_chars
+        self.done = False
+        self._started = False
+        self._out: List[str] = []
+        self._length = 0
+        # 每层容器：[闭合括号, 期待状态, 最后一个完整成员结束时的输出长度]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._string_is_key = False
+        self._escaped = False
+        # 裸值可能被分块切开，先缓冲，遇到分隔符后再输出
+        self._bare_parts: List[str] = []
+        self._pending_comma = False
+
+    def _emit(self, text: str):
+        self._out.append(text)
+        self._length += len(text)
+
+    def _begin_value(self):
+        """开始一个新成员前补上被延后的逗号，以及模型漏写的逗号或冒号"""
+        if self._pending_comma:
+            self._emit(",")
+            self._pending_comma = False
+            return
+        if not self._stack:
+            return
+        level = self._stack[-1]
+        if level[1] == COMMA:
+            level[2] = self._length
+            self._emit(",")
+            level[1] = KEY if level[0] == "}" else VALUE
+        elif level[1] == COLON:
+            self._emit(":")
+            level[1] = VALUE
+
+    def _take_bare(self) -> Optional[str]:
+        """取出缓冲的裸值，修正常见写法，无法识别时返回 None"""
+        token = "".join(self._bare_parts)
+        self._bare_parts = []
+        token = _BARE_FIXES.get(token, token)
+        return token if _VALID_BARE.fullmatch(token) else None
+
+    def _end_bare(self):
+        # 裸值中途出现无法识别的内容时用 null 占位，保证结构完整
+        self._emit(self._take_bare() or "null")
+        if self._stack:
+            self._stack[-1][1] = COMMA
+
+    def feed(self, chunk: str) -> bool:
+        """喂入一段文本，顶层结构已完整时返回 True，之后的输入会被忽略"""
+        if self.done or not chunk:
+            return self.done
+        i = 0
+        n = len(chunk)
+        while i < n:
+            if not self._started:
+                pos = min((p for p in (chunk.find(c, i) for c in self.start_chars) if p != -1), default=-1)
+                if pos == -1:
+                    return False
+                self._started = True
+                i = pos
+                continue
+
+            if self._in_string:
+                i = self._scan_string(chunk, i)
+                continue
+
+            m = _TOKEN.match(chunk, i)
+            ch, bare = m.group(1), m.group(2)
+            if self._bare_parts and not (bare is not None and m.start(2) == i):
+                self._end_bare()
+            if bare is not None:
+                # 数字、true/false/null 等裸值
+                if not self._bare_parts:
+                    self._begin_value()
+                self._bare_parts.append(bare)
+                i = m.end()
+                if i < n:
+                    self._end_bare()
+                continue
+            if ch is None:
+                # 这一块只剩空白
+                break
+            i = m.end()
+
+            if ch == "{" or ch == "[":
+                self._begin_value()
+                self._emit(ch)
+                self._stack.append([_CLOSERS[ch], KEY if ch == "{" else VALUE, self._length])
+            elif ch == "}" or ch == "]":
+                if not any(level[0] == ch for level in self._stack):
+                    # 不匹配任何未闭合容器的括号直接跳过
+                    continue
+                self._pending_comma = False
+                # 内层缺少闭合括号时一并补上
+                while self._stack:
+                    closer = self._stack.pop()[0]
+                    self._emit(closer)
+                    if closer == ch:
+                        break
+                if not self._stack:
+                    self.done = True
+                    return True
+                self._stack[-1][1] = COMMA
+            elif ch == '"':
+                self._begin_value()
+                self._string_is_key = bool(self._stack) and self._stack[-1][0] == "}" and self._stack[-1][1] == KEY
+                self._in_string = True
+                self._emit('"')
+            elif ch == ":":
+                if self._stack and self._stack[-1][1] == COLON:
+                    self._emit(":")
+                    self._stack[-1][1] = VALUE
+            elif ch == ",":
+                if self._stack and self._stack[-1][1] == COMMA:
+                    level = self._stack[-1]
+                    level[2] = self._length
+                    level[1] = KEY if level[0] == "}" else VALUE
+                    self._pending_comma = True
+        return self.done
+
+    def _scan_string(self, chunk: str, i: int) -> int:
+        n = len(chunk)
+        if self._escaped:
+            self._escaped = False
+            self._emit(chunk[i])
+            return i + 1
+        m = _STRING_SPECIAL.search(chunk, i)
+        if m is None:
+            self._emit(chunk[i:])
+            return n
+        j = m.start()
+        if j > i:
+            self._emit(chunk[i:j])
+        ch = chunk[j]
+        if ch == '"':
+            self._emit('"')
+            self._in_string = False
+            if self._stack:
+                self._stack[-1][1] = COLON if self._string_is_key else COMMA
+        elif ch == "\\":
+            self._emit("\\")
+            self._escaped = True
+        else:
+            self._emit(_CONTROL_ESCAPES.get(ch, f"\\u{ord(ch):04x}"))
+        return j + 1
+
+    def finish(self) -> str:
+        """结束输入，返回修复后的 JSON 文本；从未遇到起始括号时返回空字符串"""
+        if not self._started:
+            return ""
+        text = "".join(self._out)
+        if self.done:
+            return text
+
+        level = self._stack[-1] if self._stack else None
+        truncate = False
+        if self._in_string:
+            if self._string_is_key:
+                truncate = True
+            else:
+                if self._escaped:
+                    # 丢弃末尾孤立的反斜杠
+                    text = text[:-1]
+                text = _drop_partial_unicode_escape(text) + '"'
+                if level:
+                    level[1] = COMMA
+        elif self._bare_parts:
+            # 截断的裸值（如 tru、1.）直接丢弃整个成员
+            token = self._take_bare()
+            if token is None:
+                truncate = True
+            else:
+                text += token
+                if level:
+                    level[1] = COMMA
+
+        if level:
+            if level[0] == "}" and level[1] in (COLON, VALUE):
+                # 只有键没有值
+                truncate = True
+            if truncate:
+                text = text[:level[2]]
+
+        return text + "".join(lv[0] for lv in reversed(self._stack))
+
+
+def repair_json(text: str, start_chars: str = "{") -> str:
+    repairer = JsonRepairer(start_chars)
+    repairer.feed(text)
+    return repairer.finish()
+
+
+async def repair_stream(chunks: AsyncIterable[str], start_chars: str = "{") -> str:
+    """从流式补全中读取文本，顶层结构完整后立即停止读取"""
+    repairer = JsonRepairer(start_chars)
+    async for chunk in chunks:
+        if repairer.feed(chunk):
+            break
+    return repairer.finish()
+
+
+def repair_chunks(chunks: Iterable[str], start_chars: str = "{") -> str:
+    repairer = JsonRepairer(start_chars)
+    for chunk in chunks:
+        if repairer.feed(chunk):
+            break
+    return repairer.finish()
+
+
+def loads_json(text: str, default: Any = None, start_chars: str = "{") -> Any:
+    """宽松解析大模型返回的 JSON，先尝试原文，失败后修复再解析，仍失败返回 default"""
+    try:
+        return json.loads(text)
+    except (ValueError, TypeError):
+        pass
+    try:
+        repaired = repair_json(text or "", start_chars)
+        return json.loads(repaired) if repaired else default
+    except ValueError:
+        return default
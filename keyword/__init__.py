@@ -1,4 +1,7 @@
+import asyncio
+
 from nonebot import get_plugin_config, on_message, on_command, get_driver, logger
+from nonebot.permission import SUPERUSER
 from nonebot.plugin import PluginMetadata
 from nonebot.exception import FinishedException
 from nonebot.adapters.onebot.v11 import Message, MessageSegment, MessageEvent, Bot, GroupMessageEvent, PrivateMessageEvent
@@ -7,17 +10,57 @@ import uuid
 
 from .config import Config
 from .models import KeywordRule, MatchType, ReplyType, Reply
-from .utils import load_keywords, save_keywords
+from .utils import load_keywords, save_keywords, get_matcher
+from .matcher import regex_worker, validate_regex
+from .images import apply_localized, download_image, download_images, image_segment, remote_image_urls, remove_orphans
+
+MATCH_TYPE_NAMES = {
+    MatchType.EXACT: "精确",
+    MatchType.FUZZY: "模糊",
+    MatchType.REGEX: "正则",
+}
 
 __plugin_meta__ = PluginMetadata(
     name="关键词回复",
-    description="支持精确和模糊匹配的关键词回复插件",
+    description="支持精确、模糊和正则匹配的关键词回复插件",
     usage="使用 JSON 存储关键词及回复内容",
     config=Config,
 )
 
 config = get_plugin_config(Config)
-superusers = get_driver().config.superusers
+driver = get_driver()
+superusers = driver.config.superusers
+# 串行化对 keywords.json 的读-改-写，避免迁移与添加/删除互相覆盖
+_rules_lock = asyncio.Lock()
+
+
+async def migrate_images() -> tuple:
+    """把旧规则中的远程图片 URL 下载到本地存储
+
+    下载期间不持有锁，之后重新读取规则再替换，期间新增或删除的规则不会被覆盖。
+    """
+    urls = remote_image_urls(load_keywords())
+    results = await download_images(urls, config.keyword_image_migrate_concurrency)
+    ok = failed = 0
+    if results:
+        async with _rules_lock:
+            rules = load_keywords()
+            ok, failed = apply_localized(rules, results)
+            if ok:
+                save_keywords(rules)
+    if ok or failed:
+        logger.info(f"关键词图片迁移完成: 成功 {ok} 个，失败 {failed} 个")
+    return ok, failed
+
+
+@driver.on_shutdown
+async def _stop_regex_worker():
+    await regex_worker.stop()
+
+@driver.on_startup
+async def _startup_migrate():
+    if config.keyword_image_migrate_on_startup:
+        asyncio.create_task(migrate_images())
 
 # 关键词匹配器
 keywords_matcher = on_message(priority=99, block=False)
@@ -28,33 +71,25 @@ async def handle_keywords(bot: Bot, event: MessageEvent):
     if not msg:
         return
 
-    rules = load_keywords()
-    
-    for rule in rules:
-        matched = False
-        if rule.match_type == MatchType.EXACT:
-            if msg in rule.keywords:
-                matched = True
-        elif rule.match_type == MatchType.FUZZY:
-            if any(kw in msg for kw in rule.keywords):
-                matched = True
+    # 命中多条规则时的优先级见 matcher.py
+    rule = await get_matcher(config.keyword_regex_timeout, config.keyword_regex_max_input).match(msg)
+    if rule:
+        reply_msg = Message()
+        for reply in rule.replies:
+            if reply.type == ReplyType.TEXT:
+                reply_msg += MessageSegment.text(reply.data)
+            elif reply.type == ReplyType.IMAGE:
+                reply_msg += await image_segment(reply.data, config.keyword_image_send_base64)
+            elif reply.type == ReplyType.FACE:
+                reply_msg += MessageSegment.face(int(reply.data))
         
-        if matched:
-            reply_msg = Message()
-            for reply in rule.replies:
-                if reply.type == ReplyType.TEXT:
-                    reply_msg += MessageSegment.text(reply.data)
-                elif reply.type == ReplyType.IMAGE:
-                    reply_msg += MessageSegment.image(reply.data)
-                elif reply.type == ReplyType.FACE:
-                    reply_msg += MessageSegment.face(int(reply.data))
-            
-            await keywords_matcher.finish(reply_msg)
+        await keywords_matcher.finish(reply_msg)
 
 # 管理命令
 add_kw = on_command("添加关键词", priority=5, block=True)
 list_kw = on_command("查看关键词", priority=5, block=True)
 del_kw = on_command("删除关键词", priority=5, block=True)
+migrate_kw = on_command("迁移关键词图片", permission=SUPERUSER, priority=5, block=True)
 
 @add_kw.handle()
 async def handle_add(bot: Bot, event: MessageEvent, args: Message = CommandArg()):
@@ -65,23 +100,30 @@ async def handle_add(bot: Bot, event: MessageEvent, args: Message = CommandArg()
     # 我们需要找到第一个 text 段并从中提取
     msg_list = list(args)
     if not msg_list or msg_list[0].type != "text":
-        await add_kw.finish("用法: 添加关键词 [类型:精确/模糊] [关键词] [回复内容(可含图片表情)]")
+        await add_kw.finish("用法: 添加关键词 [类型:精确/模糊/正则] [关键词] [回复内容(可含图片表情)]")
         return
     
     first_text = msg_list[0].data["text"].strip()
     parts = first_text.split(maxsplit=2)
     
     if len(parts) < 2:
-        await add_kw.finish("参数不足。用法: 添加关键词 [类型:精确/模糊] [关键词] [回复内容]")
+        await add_kw.finish("参数不足。用法: 添加关键词 [类型:精确/模糊/正则] [关键词] [回复内容]")
         return
     
     m_type_str = parts[0]
     kw = parts[1]
     
-    if m_type_str not in ["精确", "模糊"]:
-        await add_kw.finish("类型错误。请使用: 精确 或 模糊")
+    name_to_type = {v: k for k, v in MATCH_TYPE_NAMES.items()}
+    if m_type_str not in name_to_type:
+        await add_kw.finish("类型错误。请使用: 精确、模糊 或 正则")
         return
-    m_type = MatchType.EXACT if m_type_str == "精确" else MatchType.FUZZY
+    m_type = name_to_type[m_type_str]
+    
+    if m_type == MatchType.REGEX:
+        error = validate_regex(kw)
+        if error:
+            await add_kw.finish(f"正则表达式不可用: {error}")
+            return
     
     # 构造回复内容
     replies = []
@@ -100,6 +142,8 @@ async def handle_add(bot: Bot, event: MessageEvent, args: Message = CommandArg()
             # 优先使用 url，如果没有则尝试 file (可能是本地路径或 Base64)
             data = seg.data.get("url") or seg.data.get("file")
             if data:
+                # QQ 图片链接会过期，添加时就下载到本地；下载失败时保留原链接，之后可再迁移
+                data = await download_image(data) or data
                 replies.append(Reply(type=ReplyType.IMAGE, data=data))
         elif seg.type == "face":
             replies.append(Reply(type=ReplyType.FACE, data=str(seg.data["id"])))
@@ -115,9 +159,10 @@ async def handle_add(bot: Bot, event: MessageEvent, args: Message = CommandArg()
         replies=replies
     )
     
-    rules = load_keywords()
-    rules.append(new_rule)
-    save_keywords(rules)
+    async with _rules_lock:
+        rules = load_keywords()
+        rules.append(new_rule)
+        save_keywords(rules)
     
     await add_kw.finish(f"已添加关键词: {kw} ({m_type_str})，包含 {len(replies)} 个回复分段")
 
@@ -148,7 +193,7 @@ async def handle_list(bot: Bot, event: MessageEvent):
     })
     
     for rule in display_rules:
-        m_type_display = "精确" if rule.match_type == MatchType.EXACT else "模糊"
+        m_type_display = MATCH_TYPE_NAMES.get(rule.match_type, "模糊")
         header = f"ID: {rule.id[:8]}\n类型: {m_type_display}\n关键词: {','.join(rule.keywords)}\n回复内容: "
         
         reply_msg = Message()
@@ -159,7 +204,7 @@ async def handle_list(bot: Bot, event: MessageEvent):
                 # 关键修复：NapCat 在合并转发中处理图片 URL 容易超时或 400
                 # 如果是 URL，可以尝试直接作为文本展示或保持原样
                 # 这里我们保持原样，但在发送失败时提供回退方案
-                reply_msg += MessageSegment.image(reply.data)
+                reply_msg += await image_segment(reply.data, config.keyword_image_send_base64)
             elif reply.type == ReplyType.FACE:
                 reply_msg += MessageSegment.face(int(reply.data))
         
@@ -184,7 +229,7 @@ async def handle_list(bot: Bot, event: MessageEvent):
         logger.error(f"合并转发失败，尝试纯文本回退: {e}")
         text_list = []
         for rule in display_rules:
-            m_type_display = "精确" if rule.match_type == MatchType.EXACT else "模糊"
+            m_type_display = MATCH_TYPE_NAMES.get(rule.match_type, "模糊")
             kws = ",".join(rule.keywords)
             # 缩短关键词显示长度
             if len(kws) > 20: kws = kws[:17] + "..."
@@ -207,13 +252,26 @@ async def handle_del(bot: Bot, event: MessageEvent, args: Message = CommandArg()
         await del_kw.finish("用法: 删除关键词 [ID前8位]")
         return
     
-    rules = load_keywords()
-    new_rules = [r for r in rules if not r.id.startswith(kw_id)]
+    async with _rules_lock:
+        rules = load_keywords()
+        new_rules = [r for r in rules if not r.id.startswith(kw_id)]
+        if len(rules) != len(new_rules):
+            save_keywords(new_rules)
+            # 图片可能被多条规则共用，只清理已无引用的文件
+            remove_orphans(new_rules)
     
     if len(rules) == len(new_rules):
         await del_kw.finish("未找到匹配的关键词 ID。")
     else:
-        save_keywords(new_rules)
         await del_kw.finish(f"已删除 {len(rules) - len(new_rules)} 个关键词。")
 
+@migrate_kw.handle()
+async def handle_migrate():
+    await migrate_kw.send("开始迁移关键词图片，请稍候...")
+    ok, failed = await migrate_images()
+    msg = f"迁移完成：本地化 {ok} 张图片"
+    if failed:
+        msg += f"，{failed} 张下载失败（链接可能已过期）"
+    await migrate_kw.finish(msg)
+
 
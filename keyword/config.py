@@ -3,3 +3,13 @@ from pydantic import BaseModel
 
 class Config(BaseModel):
     """Plugin Config Here"""
+    # 正则规则单次匹配的超时（秒），超时后结束匹配子进程
+    keyword_regex_timeout: float = 0.5
+    # 正则规则只匹配消息的前 N 个字符
+    keyword_regex_max_input: int = 500
+    # 启动时把旧规则中的远程图片下载到本地
+    keyword_image_migrate_on_startup: bool = True
+    # 迁移图片时的最大并发下载数
+    keyword_image_migrate_concurrency: int = 4
+    # 以 base64 发送本地图片，适用于协议端与 Bot 不在同一台机器的情况
+    keyword_image_send_base64: bool = False
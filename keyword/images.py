@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+from nonebot import logger
+from nonebot.adapters.onebot.v11 import MessageSegment
+
+from .models import KeywordRule, ReplyType
+
+# 回复图片按内容哈希存放，相同图片只保存一份
+IMAGE_DIR = Path(__file__).parent / "data" / "images"
+# Reply.data 中以此前缀表示本地存储的图片，后接文件名
+LOCAL_PREFIX = "store:"
+# 添加关键词时先下载图片、后写规则，清理孤立图片时跳过这段时间内写入的文件
+ORPHAN_GRACE_SECONDS = 600
+
+_MAGIC = [
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"RIFF", "webp"),
+    (b"BM", "bmp"),
+]
+
+
+def _guess_ext(data: bytes) -> str:
+    for magic, ext in _MAGIC:
+        if data.startswith(magic):
+            return ext
+    return "img"
+
+
+def is_local(data: str) -> bool:
+    return data.startswith(LOCAL_PREFIX)
+
+
+def local_path(data: str) -> Path:
+    return IMAGE_DIR / data[len(LOCAL_PREFIX):]
+
+
+def save_image_bytes(content: bytes) -> str:
+    """写入内容寻址存储，返回 Reply.data 使用的引用"""
+    name = f"{hashlib.sha256(content).hexdigest()}.{_guess_ext(content)}"
+    path = IMAGE_DIR / name
+    if path.exists():
+        # 刷新修改时间，避免规则写入前被当作孤立图片清理
+        path.touch()
+    else:
+        IMAGE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(content)
+        tmp.replace(path)
+    return LOCAL_PREFIX + name
+
+
+async def download_image(url: str, client: Optional[httpx.AsyncClient] = None) -> Optional[str]:
+    """下载图片并存入本地，失败返回 None"""
+    if not url.startswith("http"):
+        return None
+    try:
+        if client:
+            resp = await client.get(url, timeout=15.0, follow_redirects=True)
+        else:
+            async with httpx.AsyncClient() as c:
+                resp = await c.get(url, timeout=15.0, follow_redirects=True)
+        if resp.status_code != 200 or not resp.content:
+            logger.warning(f"关键词图片下载失败: HTTP {resp.status_code} {url[:80]}")
+            return None
+        return await asyncio.to_thread(save_image_bytes, resp.content)
+    except Exception as e:
+        logger.warning(f"关键词图片下载失败: {e}")
+        return None
+
+
+def _read_local(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+async def image_segment(data: str, as_base64: bool = False) -> MessageSegment:
+    """把 Reply.data 转为图片消息段，本地图片按文件或 base64 发送，文件丢失时以文字代替"""
+    if not is_local(data):
+        return MessageSegment.image(data)
+    path = local_path(data)
+    if as_base64:
+        content = await asyncio.to_thread(_read_local, path)
+        if content is not None:
+            return MessageSegment.image(content)
+    elif await asyncio.to_thread(path.exists):
+        return MessageSegment.image(path)
+    logger.warning(f"关键词图片文件不存在: {path.name}")
+    return MessageSegment.text("[图片已丢失]")
+
+
+def remote_image_urls(rules: Iterable[KeywordRule]) -> Set[str]:
+    """规则中仍是远程 URL 的图片回复"""
+    return {
+        reply.data
+        for rule in rules for reply in rule.replies
+        if reply.type == ReplyType.IMAGE and not is_local(reply.data) and reply.data.startswith("http")
+    }
+
+
+async def download_images(urls: Iterable[str], concurrency: int = 4) -> Dict[str, Optional[str]]:
+    """并发下载一批图片到本地，返回 URL -> 本地引用（失败为 None）；同一 URL 只下载一次"""
+    urls = set(urls)
+    if not urls:
+        return {}
+    sem = asyncio.Semaphore(max(1, concurrency))
+    results: Dict[str, Optional[str]] = {}
+
+    async with httpx.AsyncClient() as client:
+        async def _one(url: str):
+            async with sem:
+                results[url] = await download_image(url, client)
+
+        await asyncio.gather(*(_one(url) for url in urls))
+    return results
+
+
+def apply_localized(rules: List[KeywordRule], results: Dict[str, Optional[str]]) -> Tuple[int, int]:
+    """用下载结果替换规则中的图片 URL，返回 (成功数, 失败数)。会原地修改 rules。"""
+    ok = failed = 0
+    for rule in rules:
+        for reply in rule.replies:
+            if reply.type != ReplyType.IMAGE or reply.data not in results:
+                continue
+            ref = results[reply.data]
+            if ref:
+                reply.data = ref
+                ok += 1
+            else:
+                failed += 1
+    return ok, failed
+
+
+def referenced_files(rules: Iterable[KeywordRule]) -> Set[str]:
+    return {
+        reply.data[len(LOCAL_PREFIX):]
+        for rule in rules for reply in rule.replies
+        if reply.type == ReplyType.IMAGE and is_local(reply.data)
+    }
+
+
+def remove_orphans(rules: Iterable[KeywordRule], grace: float = ORPHAN_GRACE_SECONDS) -> int:
+    """删除不再被任何规则引用的本地图片
+
+    正在写入的 .tmp 文件和 grace 秒内写入的文件可能属于尚未保存的规则，不会被删除。
+    """
+    if not IMAGE_DIR.exists():
+        return 0
+    keep = referenced_files(rules)
+    cutoff = time.time() - grace
+    removed = 0
+    for path in IMAGE_DIR.iterdir():
+        if not path.is_file() or path.name in keep or path.suffix == ".tmp":
+            continue
+        try:
+            if path.stat().st_mtime > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        path.unlink(missing_ok=True)
+        removed += 1
+    return removed
@@ -0,0 +1,372 @@
+"""关键词规则的编译匹配器
+
+命中多条规则时的优先级：
+  1. 精确匹配 > 模糊匹配 > 正则匹配；
+  2. 精确与模糊规则中，先添加（在 keywords.json 中靠前）的规则优先；
+  3. 正则规则中，匹配位置最靠前的优先，位置相同时先添加的优先。
+
+精确规则放在哈希表中 O(1) 查找；模糊规则的所有关键词编译进一个
+Aho-Corasick 自动机，单次扫描消息即可找出全部命中，耗时只与消息长度
+和命中数有关，与规则数量无关。正则规则合并成一个带命名分组的大正则，
+每条消息只搜索一次；搜索在独立的子进程中进行，超时直接结束子进程，
+不会卡住事件循环。
+"""
+import asyncio
+import json
+import re
+import sys
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from nonebot import logger
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from .models import KeywordRule, MatchType
+
+
+class AhoCorasick:
+    """纯 Python 实现的 Aho-Corasick 自动机，输出为命中的规则序号"""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # 每个状态上能确定命中的最小规则序号（含 fail 链传递），-1 表示无
+        self.best: List[int] = [-1]
+
+    def add(self, word: str, value: int):
+        state = 0
+        for ch in word:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.best.append(-1)
+            state = nxt
+        if self.best[state] == -1 or value < self.best[state]:
+            self.best[state] = value
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                inherited = self.best[self.fail[nxt]]
+                if inherited != -1 and (self.best[nxt] == -1 or inherited < self.best[nxt]):
+                    self.best[nxt] = inherited
+
+    def search_min(self, text: str) -> int:
+        """返回文本中命中的最小规则序号，无命中返回 -1"""
+        goto, fail, best = self.goto, self.fail, self.best
+        state = 0
+        found = -1
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = best[state]
+            if hit != -1 and (found == -1 or hit < found):
+                found = hit
+                if found == 0:
+                    break
+        return found
+
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) + (
+    (sre_parse.POSSESSIVE_REPEAT,) if hasattr(sre_parse, "POSSESSIVE_REPEAT") else ()
+)
+
+
+_ZERO_WIDTH = (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT)
+_CHAR_OPS = (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.ANY, sre_parse.IN)
+_CATEGORIES = {
+    "DIGIT": re.compile(r"\d"),
+    "SPACE": re.compile(r"\s"),
+    "WORD": re.compile(r"\w"),
+    "LINEBREAK": re.compile(r"\n"),
+}
+# 判断两个字符集合是否相交时使用的代表字符，另外加上两边出现的字面字符和区间端点
+_SAMPLES = "aZ0_ \t\n!.-中é"
+
+
+def _first(items) -> Tuple[list, bool]:
+    """序列可能匹配的第一个字符（sre 的字符操作列表）以及能否匹配空串"""
+    chars = []
+    for op, av in items:
+        if op in _CHAR_OPS:
+            chars.append((op, av))
+            return chars, False
+        if op in _ZERO_WIDTH:
+            continue
+        if op == sre_parse.SUBPATTERN:
+            sub, nullable = _first(av[-1])
+        elif op == sre_parse.BRANCH:
+            sub, nullable = [], False
+            for branch in av[1]:
+                b_chars, b_nullable = _first(branch)
+                sub += b_chars
+                nullable = nullable or b_nullable
+        elif op in _REPEATS:
+            sub, nullable = _first(av[2])
+            nullable = nullable or av[0] == 0
+        else:
+            # 无法分析的结构按“可能匹配任何字符”处理
+            sub, nullable = [(sre_parse.ANY, None)], True
+        chars += sub
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def _char_matches(op, av, ch: str) -> bool:
+    if op == sre_parse.LITERAL:
+        return ord(ch) == av
+    if op == sre_parse.NOT_LITERAL:
+        return ord(ch) != av
+    if op == sre_parse.RANGE:
+        return av[0] <= ord(ch) <= av[1]
+    if op == sre_parse.CATEGORY:
+        name = str(av).replace("CATEGORY_", "")
+        negate = name.startswith("NOT_")
+        base = _CATEGORIES.get(name.replace("NOT_", "").replace("UNI_", "").replace("LOC_", ""))
+        if base is None:
+            return True
+        return bool(base.match(ch)) != negate
+    if op == sre_parse.IN:
+        negate = bool(av) and av[0][0] == sre_parse.NEGATE
+        items = av[1:] if negate else av
+        return any(_char_matches(i_op, i_av, ch) for i_op, i_av in items) != negate
+    # ANY 以及忽略大小写等变体，保守地认为匹配
+    return True
+
+
+def _sample_chars(chars: list) -> set:
+    samples = set(_SAMPLES)
+    for op, av in chars:
+        ops = av if op == sre_parse.IN else [(op, av)]
+        for i_op, i_av in ops:
+            if i_op in (sre_parse.LITERAL, sre_parse.NOT_LITERAL):
+                samples.add(chr(i_av))
+            elif i_op == sre_parse.RANGE:
+                samples.update((chr(i_av[0]), chr(i_av[1])))
+    return samples
+
+
+def _overlaps(a: list, b: list) -> bool:
+    for ch in _sample_chars(a + b):
+        if any(_char_matches(op, av, ch) for op, av in a) and any(_char_matches(op, av, ch) for op, av in b):
+            return True
+    return False
+
+
+def _ambiguous_branch(branches) -> bool:
+    """重复内的分支：任意两支可能以同一字符开头，或有一支能匹配空串"""
+    firsts = []
+    for branch in branches:
+        chars, nullable = _first(branch)
+        if nullable:
+            return True
+        if any(_overlaps(chars, other) for other in firsts):
+            return True
+        firsts.append(chars)
+    return False
+
+
+def _walk(items, in_repeat: bool) -> Optional[str]:
+    for op, av in items:
+        if op == sre_parse.GROUPREF or op == sre_parse.GROUPREF_EXISTS:
+            return "不支持反向引用"
+        if op in _REPEATS:
+            lo, hi, body = av
+            variable = hi == sre_parse.MAXREPEAT or hi > 1
+            if variable and in_repeat:
+                return "存在嵌套量词（如 (a+)+），可能导致灾难性回溯"
+            err = _walk(body, in_repeat or variable)
+            if err:
+                return err
+        elif op == sre_parse.SUBPATTERN:
+            err = _walk(av[-1], in_repeat)
+            if err:
+                return err
+        elif op == sre_parse.BRANCH:
+            # sre 会提取各分支的公共前缀，(a|ab)* 在这里表现为含空分支的 a(?:|b)
+            if in_repeat and _ambiguous_branch(av[1]):
+                return "重复内的分支可能匹配相同的开头（如 (a|ab)*），可能导致灾难性回溯"
+            for branch in av[1]:
+                err = _walk(branch, in_repeat)
+                if err:
+                    return err
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            err = _walk(av[1], in_repeat)
+            if err:
+                return err
+    return None
+
+
+def validate_regex(pattern: str) -> Optional[str]:
+    """添加规则时检查正则，返回错误说明，合法时返回 None"""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as e:
+        return f"正则语法错误: {e}"
+    if parsed.state.groupdict:
+        return "不支持命名分组"
+    err = _walk(parsed, False)
+    if err:
+        return err
+    try:
+        # 合并后也必须能编译（例如行内全局标志只能出现在开头）
+        re.compile(f"(?P<_r0>(?:{pattern}))")
+    except re.error as e:
+        return f"正则无法合并编译: {e}"
+    return None
+
+
+WORKER_SCRIPT = Path(__file__).parent / "regex_worker.py"
+
+
+class RegexWorker:
+    """在独立进程中执行正则搜索
+
+    标准库 re 在 C 代码中回溯时不会释放 GIL，放到线程里同样会卡住事件循环，
+    因此交给子进程执行；超过 timeout 没有结果时直接结束子进程，下次使用时重启。
+    """
+
+    def __init__(self):
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._pattern: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure(self):
+        if self._proc is None or self._proc.returncode is not None:
+            self._proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-I", str(WORKER_SCRIPT),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+            )
+            self._pattern = None
+
+    async def _call(self, request: dict, timeout: float) -> dict:
+        self._proc.stdin.write((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        await self._proc.stdin.drain()
+        line = await asyncio.wait_for(self._proc.stdout.readline(), timeout)
+        if not line:
+            raise RuntimeError("匹配进程已退出")
+        return json.loads(line)
+
+    def _kill(self):
+        if self._proc is not None and self._proc.returncode is None:
+            try:
+                self._proc.kill()
+            except ProcessLookupError:
+                pass
+        self._proc = None
+        self._pattern = None
+
+    async def search(self, pattern: str, text: str, timeout: float) -> int:
+        """返回命中的规则序号，无命中、超时或出错返回 -1"""
+        async with self._lock:
+            try:
+                await self._ensure()
+                if self._pattern != pattern:
+                    # 编译不计入匹配超时
+                    reply = await self._call({"p": pattern}, 10)
+                    if "error" in reply:
+                        logger.error(f"关键词正则编译失败: {reply['error']}")
+                        return -1
+                    self._pattern = pattern
+                return (await self._call({"t": text}, timeout))["i"]
+            except asyncio.TimeoutError:
+                logger.warning(f"关键词正则匹配超过 {timeout} 秒，已结束匹配进程")
+                self._kill()
+                return -1
+            except asyncio.CancelledError:
+                # 请求与回复已经错位，只能重启
+                self._kill()
+                raise
+            except Exception as e:
+                logger.error(f"关键词正则匹配失败: {e}")
+                self._kill()
+                return -1
+
+    async def stop(self):
+        proc = self._proc
+        self._kill()
+        if proc is not None:
+            await proc.wait()
+
+
+regex_worker = RegexWorker()
+
+
+class RegexSet:
+    """把多条正则合并成一个模式，每条消息只搜索一次"""
+
+    def __init__(self, patterns: List[str], timeout: float = 0.5, max_input: int = 500):
+        self.timeout = timeout
+        self.max_input = max_input
+        self.pattern: Optional[str] = None
+        if patterns:
+            self.pattern = "|".join(f"(?P<_r{i}>(?:{p}))" for i, p in enumerate(patterns))
+
+    async def search(self, text: str) -> int:
+        """返回命中的规则序号，无命中或超时返回 -1"""
+        if self.pattern is None:
+            return -1
+        # 截断过长的输入，限制最坏情况下的回溯规模
+        return await regex_worker.search(self.pattern, text[:self.max_input], self.timeout)
+
+
+class KeywordMatcher:
+    def __init__(self, rules: List[KeywordRule], regex_timeout: float = 0.5, regex_max_input: int = 500):
+        self.rules = rules
+        self.exact: Dict[str, KeywordRule] = {}
+        self._fuzzy_rules: List[KeywordRule] = []
+        self._automaton = AhoCorasick()
+        self._regex_rules: List[KeywordRule] = []
+        regex_patterns: List[str] = []
+
+        for rule in rules:
+            if rule.match_type == MatchType.EXACT:
+                for kw in rule.keywords:
+                    # 先添加的规则优先，不覆盖
+                    self.exact.setdefault(kw, rule)
+            elif rule.match_type == MatchType.FUZZY:
+                idx = len(self._fuzzy_rules)
+                self._fuzzy_rules.append(rule)
+                for kw in rule.keywords:
+                    if kw:
+                        self._automaton.add(kw, idx)
+            elif rule.match_type == MatchType.REGEX:
+                for kw in rule.keywords:
+                    # 旧数据或手动编辑的规则也要过一遍检查，不合格的直接跳过
+                    if validate_regex(kw) is None:
+                        self._regex_rules.append(rule)
+                        regex_patterns.append(kw)
+        self._automaton.build()
+        self._regex = RegexSet(regex_patterns, regex_timeout, regex_max_input)
+
+    async def match(self, msg: str) -> Optional[KeywordRule]:
+        rule = self.exact.get(msg)
+        if rule:
+            return rule
+        if self._fuzzy_rules:
+            idx = self._automaton.search_min(msg)
+            if idx != -1:
+                return self._fuzzy_rules[idx]
+        idx = await self._regex.search(msg)
+        if idx != -1:
+            return self._regex_rules[idx]
+        return None
@@ -5,6 +5,7 @@ from pydantic import BaseModel
 class MatchType(str, Enum):
     EXACT = "exact"
     FUZZY = "fuzzy"
+    REGEX = "regex"
 
 class ReplyType(str, Enum):
     TEXT = "text"
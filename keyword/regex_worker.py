@@ -0,0 +1,39 @@
+"""关键词正则匹配子进程
+
+由 matcher.RegexWorker 以独立进程启动，从 stdin 逐行读取 JSON 请求并把结果写回 stdout：
+  {"p": 合并后的正则}  ->  {"ok": true} 或 {"error": 说明}
+  {"t": 消息文本}      ->  {"i": 命中的规则序号，无命中为 -1}
+只依赖标准库。匹配超时时父进程直接结束本进程，再按需重启。
+"""
+import json
+import re
+import sys
+
+
+def main():
+    pattern = None
+    for line in sys.stdin:
+        request = json.loads(line)
+        if "p" in request:
+            try:
+                pattern = re.compile(request["p"])
+                reply = {"ok": True}
+            except re.error as e:
+                pattern = None
+                reply = {"error": str(e)}
+        else:
+            index = -1
+            m = pattern.search(request["t"]) if pattern else None
+            if m:
+                # 用户正则里的捕获分组会影响 lastgroup，这里按规则的命名分组判断
+                for name, value in m.groupdict().items():
+                    if value is not None:
+                        index = int(name[2:])
+                        break
+            reply = {"i": index}
+        sys.stdout.write(json.dumps(reply) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 import json
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from .models import KeywordRule
+from .matcher import KeywordMatcher
 
 DATA_PATH = Path(__file__).parent / "data" / "keywords.json"
 
+# 编译好的匹配器及其对应的文件修改时间
+_matcher: Optional[KeywordMatcher] = None
+_matcher_mtime: Optional[float] = None
+
 def load_keywords() -> List[KeywordRule]:
     if not DATA_PATH.exists():
         DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -33,3 +38,21 @@ def save_keywords(keywords: List[KeywordRule]):
             else:
                 res.append(kw.dict())
         json.dump(res, f, ensure_ascii=False, indent=2)
+    # 同一秒内多次修改时 mtime 可能不变，这里显式失效
+    invalidate_matcher()
+
+def get_matcher(regex_timeout: float = 0.5, regex_max_input: int = 500) -> KeywordMatcher:
+    """返回缓存的匹配器，仅在规则文件变化（添加/删除或手动修改）后重新编译"""
+    global _matcher, _matcher_mtime
+    try:
+        mtime = DATA_PATH.stat().st_mtime
+    except FileNotFoundError:
+        mtime = None
+    if _matcher is None or mtime != _matcher_mtime:
+        _matcher = KeywordMatcher(load_keywords(), regex_timeout, regex_max_input)
+        _matcher_mtime = mtime
+    return _matcher
+
+def invalidate_matcher():
+    global _matcher
+    _matcher = None
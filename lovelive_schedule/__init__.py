@@ -22,7 +22,10 @@ __plugin_meta__ = PluginMetadata(
 require("nonebot_plugin_apscheduler")
 require("nonebot_plugin_htmlrender")
 from nonebot_plugin_apscheduler import scheduler
-from nonebot_plugin_htmlrender import html_to_pic
+try:
+    from ..render_pool import html_to_pic
+except ImportError:
+    from nonebot_plugin_htmlrender import html_to_pic
 
 # 路径定义
 TEMPLATES_PATH = Path(__file__).parent / "templates"
@@ -0,0 +1,189 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from nonebot import get_driver, get_plugin_config, logger, on_message, require
+from nonebot.adapters import Bot as BaseBot
+from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, Message, MessageEvent
+from nonebot.plugin import PluginMetadata
+
+require("nonebot_plugin_apscheduler")
+from nonebot_plugin_apscheduler import scheduler
+
+from .config import Config
+from .models import StoredMessage, normalise_segments, plain_text
+from .storage import SharedMessageStore
+
+__plugin_meta__ = PluginMetadata(
+    name="消息库",
+    description="统一接收并解析消息，写入共享的 SQLite 消息库（含全文索引），供其他插件订阅和查询",
+    usage="无指令，其他插件通过 subscribe 订阅新消息，或通过查询函数读取历史",
+    config=Config,
+)
+
+plugin_config = get_plugin_config(Config)
+driver = get_driver()
+store = SharedMessageStore(
+    Path(plugin_config.message_store_db_path),
+    batch_size=plugin_config.message_store_batch_size,
+    flush_interval_ms=plugin_config.message_store_flush_interval_ms,
+    queue_max=plugin_config.message_store_queue_max,
+)
+
+# 订阅者：每条收到的消息解析一次后依次分发
+Subscriber = Callable[[Bot, StoredMessage], Awaitable[Any]]
+_subscribers: List[Subscriber] = []
+
+
+def subscribe(func: Subscriber) -> Subscriber:
+    """注册新消息订阅者（装饰器），只会收到别人发来的消息，不含机器人自己发出的"""
+    _subscribers.append(func)
+    return func
+
+
+@driver.on_startup
+async def _start():
+    await store.start()
+
+
+@driver.on_shutdown
+async def _stop():
+    await store.stop()
+
+
+def _is_command(plain: str) -> bool:
+    starts = getattr(driver.config, "command_start", {"/", ""})
+    return any(plain.startswith(s) for s in starts if s)
+
+
+ingest_matcher = on_message(priority=1, block=False)
+
+
+@ingest_matcher.handle()
+async def handle_ingest(bot: Bot, event: MessageEvent):
+    # original_message 保留了 @机器人 和回复段，plain 与各插件原先的 get_plaintext 保持一致
+    segments = normalise_segments(event.original_message)
+    plain = event.get_plaintext().strip()
+    is_group = isinstance(event, GroupMessageEvent)
+    msg = StoredMessage(
+        chat_type="group" if is_group else "private",
+        chat_id=event.group_id if is_group else event.user_id,
+        user_id=event.user_id,
+        nickname=event.sender.nickname or str(event.user_id),
+        time=event.time,
+        plain=plain,
+        segments=segments,
+        message_id=event.message_id,
+        is_command=_is_command(plain),
+    )
+    store.put(msg)
+    if _subscribers:
+        await asyncio.gather(*(_dispatch(func, bot, msg) for func in _subscribers))
+
+
+async def _dispatch(func: Subscriber, bot: Bot, msg: StoredMessage):
+    try:
+        await func(bot, msg)
+    except Exception as e:
+        logger.error(f"消息库：订阅者 {getattr(func, '__module__', '')}.{getattr(func, '__name__', func)} 处理失败: {e}")
+
+
+@BaseBot.on_called_api
+async def _record_sent(bot: BaseBot, exception: Optional[Exception], api: str, data: Dict[str, Any], result: Any):
+    """记录机器人发出的消息，使本地历史与协议端的历史记录一致"""
+    if exception or not plugin_config.message_store_record_self or not isinstance(bot, Bot):
+        return
+    if api not in ("send_msg", "send_group_msg", "send_private_msg"):
+        return
+    group_id = data.get("group_id")
+    if api == "send_private_msg" or (api == "send_msg" and data.get("message_type") == "private") or not group_id:
+        chat_type, chat_id = "private", data.get("user_id")
+    else:
+        chat_type, chat_id = "group", group_id
+    if not chat_id:
+        return
+    try:
+        segments = normalise_segments(Message(data.get("message", "")))
+    except Exception:
+        return
+    store.put(StoredMessage(
+        chat_type=chat_type,
+        chat_id=int(chat_id),
+        user_id=int(bot.self_id),
+        nickname=next(iter(driver.config.nickname), "") or bot.self_id,
+        time=int(time.time()),
+        plain=plain_text(segments),
+        segments=segments,
+        message_id=result.get("message_id") if isinstance(result, dict) else None,
+        is_self=True,
+    ))
+
+
+@scheduler.scheduled_job("cron", hour=4, minute=40, id="message_store_retention")
+async def _purge_expired():
+    try:
+        deleted = await store.purge(plugin_config.message_store_retention_days)
+        if deleted:
+            logger.info(f"消息库：已清理 {deleted} 条过期消息")
+    except Exception as e:
+        logger.error(f"消息库：清理过期消息失败: {e}")
+
+
+# --- 查询接口 ---
+# 写入是批量异步的，最近约 1 秒内的消息可能还查不到。
+
+async def recent_messages(chat_type: str, chat_id: int, limit: int = 100, **kwargs) -> List[StoredMessage]:
+    if not store.db:
+        return []
+    return await store.recent(chat_type, chat_id, limit, **kwargs)
+
+
+async def messages_after(chat_type: str, chat_id: int, after_id: int, limit: int = 1000) -> List[StoredMessage]:
+    if not store.db:
+        return []
+    return await store.after(chat_type, chat_id, after_id, limit)
+
+
+async def user_messages(user_id: int, limit: int = 100, **kwargs) -> List[StoredMessage]:
+    if not store.db:
+        return []
+    return await store.by_user(user_id, limit, **kwargs)
+
+
+async def search_messages(keyword: str, chat_type: Optional[str] = None, chat_id: Optional[int] = None, limit: int = 50) -> List[StoredMessage]:
+    if not store.db:
+        return []
+    return await store.search(keyword, chat_type, chat_id, limit)
+
+
+async def group_history(bot: Bot, group_id: int, count: int = 100) -> List[Dict[str, Any]]:
+    """与 get_group_msg_history 返回的 messages 结构相同
+
+    本地记录足够时直接使用，否则向协议端请求，两者取较多的一份。
+    """
+    local = await recent_messages("group", group_id, count)
+    if len(local) >= count:
+        return [m.to_onebot() for m in local]
+    remote: List[Dict[str, Any]] = []
+    try:
+        res = await bot.call_api("get_group_msg_history", group_id=group_id, count=count)
+        if isinstance(res, dict):
+            remote = res.get("messages") or []
+        elif isinstance(res, list):
+            remote = res
+    except Exception as e:
+        logger.debug(f"消息库：协议端历史记录获取失败: {e}")
+    if len(remote) > len(local):
+        return remote
+    return [m.to_onebot() for m in local]
+
+
+# 放在模块末尾：web_console 也会导入本插件，此时本插件的接口都已定义好
+try:
+    from ..web_console import register_memory_store
+except ImportError:
+    register_memory_store = None
+
+if register_memory_store:
+    register_memory_store("message_store.write_queue", lambda: store.queue)
@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+
+class Config(BaseModel):
+    message_store_db_path: str = "data/messages.db"
+    # 批量写入：攒够 N 条或距上次写入超过 M 毫秒即落盘
+    message_store_batch_size: int = 200
+    message_store_flush_interval_ms: int = 1000
+    # 待写入队列上限，写满后丢弃新消息（只影响落盘，不影响订阅者）
+    message_store_queue_max: int = 10000
+    # 消息保留天数；0 表示永久保留
+    message_store_retention_days: int = 90
+    # 记录机器人自己发出的消息
+    message_store_record_self: bool = True
@@ -0,0 +1,77 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+# 消息段统一为 {"type": ..., "data": {...}}，只保留各插件用得到的字段
+KEEP_FIELDS = {
+    "text": ("text",),
+    "image": ("url", "file", "path", "summary"),
+    "mface": ("url", "summary"),
+    "face": ("id",),
+    "at": ("qq",),
+    "reply": ("id",),
+}
+
+
+def normalise_segments(message: Iterable) -> List[Dict[str, Any]]:
+    """把 Message、MessageSegment 列表或 OneBot 字典列表统一为精简的字典列表"""
+    segments = []
+    for seg in message:
+        seg_type = seg["type"] if isinstance(seg, dict) else seg.type
+        seg_data = (seg["data"] if isinstance(seg, dict) else seg.data) or {}
+        keys = KEEP_FIELDS.get(seg_type, ())
+        segments.append({
+            "type": seg_type,
+            "data": {k: seg_data[k] for k in keys if seg_data.get(k) is not None},
+        })
+    return segments
+
+
+def plain_text(segments: List[Dict[str, Any]]) -> str:
+    return "".join(s["data"].get("text", "") for s in segments if s["type"] == "text").strip()
+
+
+@dataclass
+class StoredMessage:
+    chat_type: str          # "group" / "private"
+    chat_id: int            # 群号或私聊对方 QQ
+    user_id: int
+    nickname: str
+    time: int
+    plain: str
+    segments: List[Dict[str, Any]] = field(default_factory=list)
+    message_id: Optional[int] = None
+    is_command: bool = False
+    is_self: bool = False
+    id: Optional[int] = None  # 数据库行号，写入后才有
+
+    @property
+    def group_id(self) -> Optional[int]:
+        return self.chat_id if self.chat_type == "group" else None
+
+    def to_row(self) -> tuple:
+        return (
+            self.message_id, self.chat_type, self.chat_id, self.user_id, self.nickname,
+            self.time, self.plain, json.dumps(self.segments, ensure_ascii=False),
+            int(self.is_command), int(self.is_self),
+        )
+
+    @classmethod
+    def from_row(cls, row) -> "StoredMessage":
+        (id_, message_id, chat_type, chat_id, user_id, nickname, ts, plain, segments, is_command, is_self) = row
+        return cls(
+            chat_type=chat_type, chat_id=chat_id, user_id=user_id, nickname=nickname or str(user_id),
+            time=ts, plain=plain or "", segments=json.loads(segments) if segments else [],
+            message_id=message_id, is_command=bool(is_command), is_self=bool(is_self), id=id_,
+        )
+
+    def to_onebot(self) -> Dict[str, Any]:
+        """转为与 get_group_msg_history 返回值相同结构的字典，便于替换原有调用"""
+        return {
+            "message_id": self.message_id,
+            "time": self.time,
+            "user_id": self.user_id,
+            "group_id": self.group_id,
+            "sender": {"user_id": self.user_id, "nickname": self.nickname},
+            "message": self.segments,
+        }
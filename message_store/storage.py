@@ -0,0 +1,250 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import aiosqlite
+from nonebot import logger
+
+from .models import StoredMessage
+
+COLUMNS = "id, message_id, chat_type, chat_id, user_id, nickname, time, plain, segments, is_command, is_self"
+
+
+class SharedMessageStore:
+    """所有插件共用的消息库：一个长连接、后台批量写入、FTS5 全文索引"""
+
+    def __init__(self, db_path: Path, batch_size: int = 200, flush_interval_ms: int = 1000, queue_max: int = 10000):
+        self.db_path = db_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_max)
+        self.db: Optional[aiosqlite.Connection] = None
+        self.fts_tokenizer: Optional[str] = None
+        self.dropped = 0
+        self._writer_task: Optional[asyncio.Task] = None
+        # 写入批次与清理共用一个连接，逐个事务执行，避免一方提交另一方做了一半的修改
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = await aiosqlite.connect(self.db_path)
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.execute("PRAGMA synchronous=NORMAL")
+        await self._create_schema()
+        await self.db.commit()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+
+    async def _create_schema(self):
+        await self.db.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id INTEGER,
+                chat_type TEXT NOT NULL,
+                chat_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                nickname TEXT,
+                time INTEGER NOT NULL,
+                plain TEXT,
+                segments TEXT,
+                is_command INTEGER NOT NULL DEFAULT 0,
+                is_self INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        await self.db.execute("CREATE INDEX IF NOT EXISTS idx_messages_chat ON messages (chat_type, chat_id, id)")
+        await self.db.execute("CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, id)")
+        await self.db.execute("CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (time)")
+
+        # 中文没有空格分词，优先使用 trigram（SQLite 3.34+），否则退回 unicode61
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                await self.db.execute(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                        plain, content='messages', content_rowid='id', tokenize='{tokenizer}'
+                    )
+                """)
+                break
+            except aiosqlite.OperationalError:
+                continue
+        cursor = await self.db.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'")
+        row = await cursor.fetchone()
+        self.fts_tokenizer = "trigram" if row and "trigram" in row[0] else "unicode61"
+
+        await self.db.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, plain) VALUES (new.id, new.plain);
+            END
+        """)
+        await self.db.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, plain) VALUES ('delete', old.id, old.plain);
+            END
+        """)
+
+    async def stop(self):
+        if self._writer_task:
+            # 用哨兵通知写入任务写完手头这一批后退出
+            await self.queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+        rest: List[StoredMessage] = []
+        while not self.queue.empty():
+            msg = self.queue.get_nowait()
+            if msg is not None:
+                rest.append(msg)
+        if rest and self.db:
+            await self._flush(rest)
+        if self.db:
+            await self.db.close()
+            self.db = None
+
+    def put(self, msg: StoredMessage):
+        """不等待的写入，队列满时丢弃并计数，避免拖慢消息处理"""
+        try:
+            self.queue.put_nowait(msg)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"消息库：写入队列已满，已丢弃 {self.dropped} 条消息")
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            msg = await self.queue.get()
+            if msg is None:
+                break
+            batch: List[StoredMessage] = [msg]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    msg = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if msg is None:
+                    stopping = True
+                    break
+                batch.append(msg)
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"消息库：批量写入 {len(batch)} 条消息失败: {e}")
+
+    async def _flush(self, batch: List[StoredMessage]):
+        # 消息与 FTS 索引（由触发器写入）在同一事务中，失败时整体回滚
+        async with self._lock:
+            await self.db.execute("BEGIN")
+            try:
+                await self.db.executemany(
+                    "INSERT INTO messages (message_id, chat_type, chat_id, user_id, nickname, time, plain, segments, is_command, is_self)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [m.to_row() for m in batch],
+                )
+                await self.db.commit()
+            except BaseException:
+                await self.db.rollback()
+                raise
+
+    async def _select(self, where: str, params: tuple, limit: int, order: str = "DESC") -> List[StoredMessage]:
+        cursor = await self.db.execute(
+            f"SELECT {COLUMNS} FROM messages WHERE {where} ORDER BY id {order} LIMIT ?",
+            (*params, limit),
+        )
+        rows = [StoredMessage.from_row(r) for r in await cursor.fetchall()]
+        if order == "DESC":
+            rows.reverse()
+        return rows
+
+    async def recent(
+        self,
+        chat_type: str,
+        chat_id: int,
+        limit: int = 100,
+        before_id: Optional[int] = None,
+        include_self: bool = True,
+    ) -> List[StoredMessage]:
+        """会话中最近的 limit 条消息，按时间正序返回"""
+        where = "chat_type = ? AND chat_id = ?"
+        params: tuple = (chat_type, chat_id)
+        if before_id is not None:
+            where += " AND id < ?"
+            params += (before_id,)
+        if not include_self:
+            where += " AND is_self = 0"
+        return await self._select(where, params, limit)
+
+    async def after(self, chat_type: str, chat_id: int, after_id: int, limit: int = 1000) -> List[StoredMessage]:
+        """会话中行号大于 after_id 的消息（按时间正序），用于增量处理"""
+        return await self._select(
+            "chat_type = ? AND chat_id = ? AND id > ?", (chat_type, chat_id, after_id), limit, order="ASC"
+        )
+
+    async def by_user(
+        self,
+        user_id: int,
+        limit: int = 100,
+        group_id: Optional[int] = None,
+        include_commands: bool = False,
+    ) -> List[StoredMessage]:
+        """某个用户最近的 limit 条有文字的消息，按时间正序返回"""
+        where = "user_id = ? AND is_self = 0 AND plain != ''"
+        params: tuple = (user_id,)
+        if group_id is not None:
+            where += " AND chat_type = 'group' AND chat_id = ?"
+            params += (group_id,)
+        if not include_commands:
+            where += " AND is_command = 0"
+        return await self._select(where, params, limit)
+
+    async def search(
+        self,
+        keyword: str,
+        chat_type: Optional[str] = None,
+        chat_id: Optional[int] = None,
+        limit: int = 50,
+    ) -> List[StoredMessage]:
+        """全文搜索，结果按时间倒序"""
+        keyword = keyword.strip()
+        if not keyword:
+            return []
+        filters = ""
+        params: list = []
+        if chat_type is not None and chat_id is not None:
+            filters = " AND m.chat_type = ? AND m.chat_id = ?"
+            params = [chat_type, chat_id]
+        # trigram 要求至少 3 个字符，更短的关键词退回 LIKE
+        if self.fts_tokenizer == "trigram" and len(keyword) < 3:
+            sql = f"SELECT {COLUMNS} FROM messages m WHERE m.plain LIKE ?{filters} ORDER BY m.id DESC LIMIT ?"
+            args = [f"%{keyword}%", *params, limit]
+        else:
+            cols = ", ".join(f"m.{c.strip()}" for c in COLUMNS.split(","))
+            sql = (
+                f"SELECT {cols} FROM messages_fts f JOIN messages m ON m.id = f.rowid"
+                f" WHERE messages_fts MATCH ?{filters} ORDER BY m.id DESC LIMIT ?"
+            )
+            # 整体作为短语匹配，避免用户输入被解析成 FTS 语法
+            args = ['"' + keyword.replace('"', '""') + '"', *params, limit]
+        cursor = await self.db.execute(sql, args)
+        return [StoredMessage.from_row(r) for r in await cursor.fetchall()]
+
+    async def purge(self, retention_days: int, chunk: int = 5000) -> int:
+        if retention_days <= 0:
+            return 0
+        cutoff = int(time.time()) - retention_days * 86400
+        deleted = 0
+        while True:
+            # 每块单独加锁，写入任务可以在块与块之间插入
+            async with self._lock:
+                cursor = await self.db.execute(
+                    "DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE time < ? LIMIT ?)",
+                    (cutoff, chunk),
+                )
+                await self.db.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < chunk:
+                break
+            await asyncio.sleep(0)
+        return deleted
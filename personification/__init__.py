@@ -42,6 +42,28 @@ try:
 except ImportError:
     md_to_pic = None
 
+# 尝试导入共享消息库，周记素材优先读本地记录
+try:
+    try:
+        from plugin.message_store import group_history
+    except ImportError:
+        from ..message_store import group_history
+except ImportError:
+    group_history = None
+
+# 工具调用参数偶尔不是合法 JSON，有修复插件时先修复再解析
+try:
+    try:
+        from plugin.json_repair import loads_json
+    except ImportError:
+        from ..json_repair import loads_json
+except ImportError:
+    def loads_json(text: str, default=None, start_chars: str = "{"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return default
+
 # 尝试导入签到插件的工具函数
 try:
     try:
@@ -349,7 +371,7 @@ async def call_ai_api(messages: List[Dict], tools: Optional[List[Dict]] = None,
                     current_messages.append(msg)
                     for tool_call in msg.tool_calls:
                         tool_name = tool_call.function.name
-                        tool_args = json.loads(tool_call.function.arguments)
+                        tool_args = loads_json(tool_call.function.arguments, default={})
                         
                         logger.info(f"拟人插件：AI 正在调用工具 {tool_name} 参数: {tool_args}")
                         
@@ -1245,7 +1267,10 @@ async def get_recent_chat_context(bot: Bot) -> str:
             
             try:
                 # 获取最近 50 条消息
-                messages = await bot.get_group_msg_history(group_id=group_id, count=50)
+                if group_history:
+                    messages = {"messages": await group_history(bot, group_id, 50)}
+                else:
+                    messages = await bot.get_group_msg_history(group_id=group_id, count=50)
                 if messages and "messages" in messages:
                     msg_list = messages["messages"]
                     chat_text = ""
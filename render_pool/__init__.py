@@ -0,0 +1,204 @@
+import asyncio
+from pathlib import Path
+from typing import Dict, Optional
+
+from jinja2 import Environment, FileSystemLoader
+from nonebot import on_command, get_driver, get_plugin_config, logger, require
+from nonebot.adapters.onebot.v11 import Message
+from nonebot.params import CommandArg
+from nonebot.permission import SUPERUSER
+from nonebot.plugin import PluginMetadata
+
+require("nonebot_plugin_htmlrender")
+from nonebot_plugin_htmlrender import md_to_pic as _htmlrender_md_to_pic
+
+from .bench import run_benchmark
+from .card import CardRow, RankCard, fetch_avatars, find_font, render_card, set_font_path
+from .config import Config
+from .pool import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    RenderPool,
+    RenderQueueFull,
+    wait_ready,
+)
+
+__plugin_meta__ = PluginMetadata(
+    name="渲染服务",
+    description="为各插件提供共享的 htmlrender 页面池、优先级队列与渲染耗时统计",
+    usage="渲染统计：查看各类渲染的耗时与排队情况（仅限超级用户）\n渲染对比 [轮数]：同一张排行卡片分别用 Pillow 和浏览器渲染并对比耗时（仅限超级用户）",
+    config=Config,
+)
+
+plugin_config = get_plugin_config(Config)
+pool = RenderPool(plugin_config)
+driver = get_driver()
+
+_template_envs: Dict[str, Environment] = {}
+set_font_path(plugin_config.render_pool_font_path)
+
+
+@driver.on_startup
+async def _warm_up():
+    # 放到后台，避免浏览器启动拖慢 Bot 启动
+    asyncio.create_task(pool.warm_up())
+
+
+@driver.on_shutdown
+async def _close():
+    await pool.close()
+
+
+async def html_to_pic(
+    html: str,
+    wait: int = 0,
+    template_path: Optional[str] = None,
+    type: str = "png",
+    quality: Optional[int] = None,
+    viewport: Optional[Dict] = None,
+    wait_until: str = "load",
+    priority: int = PRIORITY_NORMAL,
+    kind: str = "html",
+    **kwargs,
+) -> bytes:
+    """与 htmlrender.html_to_pic 参数兼容，使用池内页面渲染
+
+    template_path 为资源根目录的 file:// 地址，用于解析 HTML 中的相对路径，
+    默认与 htmlrender 相同为当前工作目录；viewport 默认也与 htmlrender 相同。
+    """
+    base_url = template_path or Path.cwd().as_uri()
+
+    async def _render() -> bytes:
+        async with pool.page(kind, viewport, priority) as page:
+            # 池内页面停留在上一次渲染的地址，必须先回到资源根目录，否则相对路径会指向别处
+            await page.goto(base_url)
+            await page.set_content(html, wait_until=wait_until)
+            await wait_ready(page)
+            if wait:
+                await page.wait_for_timeout(wait)
+            return await page.screenshot(full_page=True, type=type, quality=quality)
+
+    return await asyncio.wait_for(_render(), plugin_config.render_pool_timeout)
+
+
+async def template_to_pic(
+    template_path: str,
+    template_name: str,
+    templates: Dict,
+    pages: Optional[Dict] = None,
+    wait: int = 0,
+    type: str = "png",
+    quality: Optional[int] = None,
+    priority: int = PRIORITY_NORMAL,
+    **kwargs,
+) -> bytes:
+    """与 htmlrender.template_to_pic 参数兼容"""
+    pages = pages or {}
+    env = _template_envs.get(template_path)
+    if env is None:
+        env = Environment(loader=FileSystemLoader(template_path), enable_async=True)
+        _template_envs[template_path] = env
+    html = await env.get_template(template_name).render_async(**templates)
+    return await html_to_pic(
+        html,
+        wait=wait,
+        template_path=pages.get("base_url") or Path(template_path).absolute().as_uri(),
+        type=type,
+        quality=quality,
+        viewport=pages.get("viewport"),
+        priority=priority,
+        kind="template",
+    )
+
+
+async def md_to_pic(md: str = "", width: int = 500, priority: int = PRIORITY_NORMAL, **kwargs) -> bytes:
+    """Markdown 样式与排版沿用 htmlrender，这里只负责排队与计时"""
+    async with pool.slot("markdown", priority):
+        return await asyncio.wait_for(
+            _htmlrender_md_to_pic(md=md, width=width, **kwargs),
+            plugin_config.render_pool_timeout,
+        )
+
+
+def pillow_available() -> bool:
+    """Pillow 绘制已启用且找到了中文字体；调用方可据此跳过下载头像等准备工作"""
+    return plugin_config.render_pool_pillow and bool(find_font())
+
+
+async def rank_card_to_pic(card: RankCard) -> Optional[bytes]:
+    """用 Pillow 绘制排行卡片，未启用或缺少中文字体时返回 None，由调用方回退到 HTML"""
+    if not pillow_available():
+        return None
+    try:
+        pic, elapsed = await render_card(card)
+    except Exception as e:
+        logger.warning(f"渲染服务：Pillow 绘制失败，回退到 HTML: {e}")
+        pool.record("pillow", 0, 0, False)
+        return None
+    # 与浏览器渲染的耗时记录在一起，便于通过 渲染统计 对比两条路径
+    pool.record("pillow", 0, elapsed, True)
+    return pic
+
+
+async def url_to_pic(
+    url: str,
+    viewport: Optional[Dict] = None,
+    timeout: int = 60,
+    idle_timeout: int = 10,
+    priority: int = PRIORITY_NORMAL,
+) -> bytes:
+    """打开外部网页并截图，先等 load，再尽量等到网络空闲
+
+    外部网页使用独立的临时上下文，不会把 Cookie、localStorage 和缓存带给池内页面或下一次调用。
+    """
+    async with pool.isolated_page("url", viewport, priority) as page:
+        await page.goto(url, wait_until="load", timeout=timeout * 1000)
+        try:
+            await page.wait_for_load_state("networkidle", timeout=idle_timeout * 1000)
+        except Exception:
+            # 有长连接或轮询的页面永远不会空闲，load 之后直接截图
+            pass
+        await wait_ready(page)
+        return await page.screenshot(full_page=True)
+
+
+render_stats = on_command("渲染统计", permission=SUPERUSER, priority=5, block=True)
+
+
+@render_stats.handle()
+async def handle_render_stats():
+    summary = pool.summary()
+    if not summary:
+        await render_stats.finish("暂无渲染记录")
+    lines = [f"【渲染服务】页面 {len(pool._slots)} 个，排队 {pool.gate.waiting} 个"]
+    for kind, s in summary.items():
+        lines.append(
+            f"{kind}: {s['count']} 次 (失败 {s['errors']})，"
+            f"耗时 p50 {s['render_p50']:.0f}ms / p95 {s['render_p95']:.0f}ms，排队 p95 {s['wait_p95']:.0f}ms"
+        )
+    await render_stats.finish("\n".join(lines))
+
+
+render_bench = on_command("渲染对比", permission=SUPERUSER, priority=5, block=True)
+
+
+@render_bench.handle()
+async def handle_render_bench(args: Message = CommandArg()):
+    text = args.extract_plain_text().strip()
+    rounds = min(50, max(1, int(text))) if text.isdigit() else 10
+    if not pillow_available():
+        await render_bench.finish("Pillow 绘制未启用或未找到中文字体，无法对比")
+    await render_bench.send(f"正在用同一张排行卡片对比两种渲染方式，各 {rounds} 轮...")
+    try:
+        result = await run_benchmark(html_to_pic, rounds)
+    except Exception as e:
+        logger.error(f"渲染服务：渲染对比失败: {e}")
+        await render_bench.finish(f"渲染对比失败: {e}")
+    lines = ["【渲染对比】10 行排行卡片，不含头像"]
+    for name, label in (("pillow", "Pillow"), ("html", "浏览器")):
+        r = result[name]
+        lines.append(f"{label}: p50 {r['p50_ms']:.1f}ms / 平均 {r['mean_ms']:.1f}ms / 最慢 {r['max_ms']:.1f}ms")
+    ratio = result["html"]["p50_ms"] / max(result["pillow"]["p50_ms"], 0.01)
+    lines.append(f"浏览器 / Pillow 中位耗时比: {ratio:.1f}")
+    await render_bench.finish("\n".join(lines))
@@ -0,0 +1,114 @@
+"""Pillow 与 HTML 两条排行卡片渲染路径的耗时对比
+
+同一张示例卡片（不含头像，避免网络波动影响结果）分别用 Pillow 绘制和用浏览器渲染等价的 HTML，
+各跑若干轮后报告中位数与平均耗时。由 渲染对比 指令调用，也可以在 Bot 运行时手动调用 run_benchmark。
+"""
+import html
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from .card import THEMES, CardRow, CardTheme, RankCard, render_card
+
+
+def sample_card(rows: int = 10) -> RankCard:
+    return RankCard(
+        title="渲染对比示例",
+        subtitle="近 30 天",
+        rows=[
+            CardRow(
+                title=f"测试用户{i}",
+                subtitle=str(10000 + i),
+                value=str(1000 - i * 37),
+                value_unit="条",
+                badge="活跃" if i % 3 == 0 else "",
+                ratio=(1000 - i * 37) / 1000,
+            )
+            for i in range(rows)
+        ],
+        footer="仅用于耗时对比",
+    )
+
+
+def _rgb(color) -> str:
+    return "rgb({},{},{})".format(*color)
+
+
+def rank_card_html(card: RankCard) -> str:
+    """与 draw_rank_card 布局和配色相同的 HTML，仅用于对比耗时"""
+    theme: CardTheme = THEMES.get(card.theme, THEMES["blue"])
+    rows = []
+    for rank, row in enumerate(card.rows, 1):
+        bar = ""
+        if row.ratio is not None:
+            bar = (
+                f'<div class="bar"><div class="fill" style="width:{max(0.05, row.ratio) * 100:.1f}%"></div></div>'
+            )
+        badge = f'<span class="badge">{html.escape(row.badge)}</span>' if row.badge else ""
+        rows.append(
+            f'<div class="row"><div class="line"><span class="rank">{rank}</span>'
+            f'<div class="name"><b>{html.escape(row.title)}</b><small>{html.escape(row.subtitle)}</small></div>'
+            f'<div class="value">{html.escape(row.value)}<small>{html.escape(row.value_unit)}</small>{badge}</div>'
+            f"</div>{bar}</div>"
+        )
+    return f"""<html><head><meta charset="UTF-8"><style>
+        body {{ margin: 0; padding: 15px; background: {_rgb(theme.background)}; font-family: 'PingFang SC', 'Microsoft YaHei', sans-serif; }}
+        .card {{ width: {card.width - 60}px; padding: 15px; background: {_rgb(theme.card)}; border: 2px solid {_rgb(theme.border)}; border-radius: 20px; }}
+        h1 {{ margin: 10px 0 4px; text-align: center; font-size: 26px; color: {_rgb(theme.title)}; }}
+        .sub {{ text-align: center; font-size: 15px; color: {_rgb(theme.muted)}; margin-bottom: 16px; }}
+        .row {{ background: {_rgb(theme.row)}; border-radius: 14px; padding: 10px 14px; margin-bottom: 10px; }}
+        .line {{ display: flex; align-items: center; }}
+        .rank {{ width: 30px; height: 30px; line-height: 30px; text-align: center; border-radius: 50%; color: {_rgb(theme.muted)}; margin-right: 10px; }}
+        .name {{ flex: 1; color: {_rgb(theme.text)}; font-size: 16px; }}
+        .name small {{ display: block; font-size: 12px; color: {_rgb(theme.muted)}; }}
+        .value {{ font-size: 18px; color: {_rgb(theme.accent)}; text-align: right; }}
+        .value small {{ font-size: 12px; color: {_rgb(theme.muted)}; margin-left: 2px; }}
+        .badge {{ display: block; font-size: 12px; padding: 0 6px; border-radius: 9px; background: {_rgb(theme.bar_bg)}; }}
+        .bar {{ height: 10px; border-radius: 5px; background: {_rgb(theme.bar_bg)}; margin-top: 6px; }}
+        .fill {{ height: 10px; border-radius: 5px; background: {_rgb(theme.bar_fill)}; }}
+        .footer {{ border-top: 1px solid {_rgb(theme.border)}; margin-top: 8px; padding-top: 12px; text-align: center; font-size: 12px; color: {_rgb(theme.muted)}; }}
+    </style></head><body><div class="card">
+        <h1>{html.escape(card.title)}</h1><div class="sub">{html.escape(card.subtitle)}</div>
+        {"".join(rows)}
+        <div class="footer">{html.escape(card.footer)}</div>
+    </div></body></html>"""
+
+
+async def _time(func: Callable[[], Awaitable], rounds: int) -> List[float]:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _summarize(timings: List[float]) -> Dict[str, float]:
+    return {
+        "rounds": len(timings),
+        "p50_ms": statistics.median(timings),
+        "mean_ms": statistics.fmean(timings),
+        "max_ms": max(timings),
+    }
+
+
+async def run_benchmark(html_to_pic: Callable[..., Awaitable[bytes]], rounds: int = 10, rows: int = 10) -> Dict[str, Dict[str, float]]:
+    """对同一张卡片分别计时，html_to_pic 为本插件的池内渲染函数
+
+    两条路径各先跑一轮预热（字体加载、页面创建），不计入结果。
+    """
+    card = sample_card(rows)
+    page_html = rank_card_html(card)
+
+    async def pillow():
+        await render_card(card)
+
+    async def browser():
+        await html_to_pic(page_html, viewport={"width": card.width, "height": 10}, kind="bench")
+
+    await pillow()
+    await browser()
+    return {
+        "pillow": _summarize(await _time(pillow, rounds)),
+        "html": _summarize(await _time(browser, rounds)),
+    }
@@ -0,0 +1,268 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from PIL import Image, ImageDraw, ImageFont
+from nonebot import logger
+
+Color = Tuple[int, int, int]
+
+# 常见系统中的中文字体，按顺序尝试
+FONT_CANDIDATES = [
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+]
+
+# 与 htmlrender 的 device_scale_factor 保持一致，输出同样清晰度的图片
+SCALE = 2
+
+_font_path: Optional[str] = None
+_avatar_cache: Dict[str, Image.Image] = {}
+AVATAR_CACHE_SIZE = 256
+
+
+@dataclass
+class CardTheme:
+    background: Color
+    card: Color
+    border: Color
+    title: Color
+    text: Color
+    muted: Color
+    accent: Color
+    row: Color
+    bar_bg: Color
+    bar_fill: Color
+
+
+THEMES: Dict[str, CardTheme] = {
+    "blue": CardTheme(
+        background=(241, 245, 249), card=(255, 255, 255), border=(226, 232, 240),
+        title=(30, 41, 59), text=(30, 41, 59), muted=(148, 163, 184), accent=(37, 99, 235),
+        row=(255, 255, 255), bar_bg=(241, 245, 249), bar_fill=(59, 130, 246),
+    ),
+    "pink": CardTheme(
+        background=(255, 240, 245), card=(255, 255, 255), border=(255, 182, 193),
+        title=(255, 105, 180), text=(209, 71, 163), muted=(153, 153, 153), accent=(255, 105, 180),
+        row=(255, 245, 248), bar_bg=(255, 228, 225), bar_fill=(255, 105, 180),
+    ),
+}
+
+MEDAL_COLORS: Dict[int, Color] = {1: (251, 191, 36), 2: (192, 192, 192), 3: (205, 127, 50)}
+
+
+@dataclass
+class CardRow:
+    title: str
+    subtitle: str = ""
+    value: str = ""
+    value_unit: str = ""
+    badge: str = ""
+    # 0~1，为 None 时不画进度条
+    ratio: Optional[float] = None
+    avatar_id: Optional[str] = None
+
+
+@dataclass
+class RankCard:
+    title: str
+    rows: List[CardRow]
+    subtitle: str = ""
+    footer: str = ""
+    theme: str = "blue"
+    width: int = 600
+    avatars: Dict[str, Image.Image] = field(default_factory=dict)
+
+
+def set_font_path(path: str):
+    global _font_path
+    _font_path = path or None
+    get_font.cache_clear()
+
+
+def find_font() -> Optional[str]:
+    if _font_path and Path(_font_path).exists():
+        return _font_path
+    for path in FONT_CANDIDATES:
+        if Path(path).exists():
+            return path
+    return None
+
+
+@lru_cache(maxsize=32)
+def get_font(size: int) -> ImageFont.FreeTypeFont:
+    path = find_font()
+    if not path:
+        raise FileNotFoundError("未找到可用的中文字体")
+    return ImageFont.truetype(path, size * SCALE)
+
+
+def _fit_text(text: str, font: ImageFont.FreeTypeFont, max_width: float) -> str:
+    if font.getlength(text) <= max_width:
+        return text
+    while text and font.getlength(text + "…") > max_width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _circle_avatar(img: Image.Image, size: int) -> Image.Image:
+    img = img.convert("RGB").resize((size, size), Image.LANCZOS)
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, size - 1, size - 1), fill=255)
+    out = Image.new("RGBA", (size, size))
+    out.paste(img, (0, 0), mask)
+    return out
+
+
+def draw_medal(draw: ImageDraw.ImageDraw, x: int, y: int, rank: int, theme: CardTheme):
+    """前三名画实心奖牌，其余只写名次"""
+    r = 15 * SCALE
+    font = get_font(15)
+    color = MEDAL_COLORS.get(rank)
+    if color:
+        draw.ellipse((x, y, x + 2 * r, y + 2 * r), fill=color)
+        draw.text((x + r, y + r), str(rank), font=font, fill=(255, 255, 255), anchor="mm")
+    else:
+        draw.text((x + r, y + r), str(rank), font=font, fill=theme.muted, anchor="mm")
+
+
+def draw_bar(draw: ImageDraw.ImageDraw, box: Tuple[int, int, int, int], ratio: float, theme: CardTheme):
+    x0, y0, x1, y1 = box
+    radius = (y1 - y0) // 2
+    draw.rounded_rectangle(box, radius=radius, fill=theme.bar_bg)
+    fill_w = max(y1 - y0, int((x1 - x0) * max(0.0, min(1.0, ratio))))
+    draw.rounded_rectangle((x0, y0, x0 + fill_w, y1), radius=radius, fill=theme.bar_fill)
+
+
+def draw_rank_card(card: RankCard) -> bytes:
+    """绘制排行类卡片，返回 PNG 字节"""
+    theme = THEMES.get(card.theme, THEMES["blue"])
+    s = SCALE
+    pad = 30 * s
+    inner_w = card.width * s - 2 * pad
+    row_h = (72 if any(r.ratio is not None for r in card.rows) else 64) * s
+    gap = 10 * s
+    header_h = (70 if card.subtitle else 48) * s
+    footer_h = 50 * s if card.footer else 10 * s
+    height = pad * 2 + header_h + len(card.rows) * (row_h + gap) + footer_h
+
+    img = Image.new("RGB", (card.width * s, height), theme.background)
+    draw = ImageDraw.Draw(img)
+    draw.rounded_rectangle(
+        (pad // 2, pad // 2, card.width * s - pad // 2, height - pad // 2),
+        radius=20 * s, fill=theme.card, outline=theme.border, width=2 * s,
+    )
+
+    cx = card.width * s // 2
+    y = pad + 10 * s
+    draw.text((cx, y), card.title, font=get_font(26), fill=theme.title, anchor="mt")
+    if card.subtitle:
+        draw.text((cx, y + 40 * s), card.subtitle, font=get_font(15), fill=theme.muted, anchor="mt")
+    y = pad + header_h
+
+    name_font = get_font(16)
+    sub_font = get_font(12)
+    value_font = get_font(18)
+    unit_font = get_font(12)
+    badge_font = get_font(12)
+    avatar_size = 44 * s
+
+    for rank, row in enumerate(card.rows, 1):
+        x = pad
+        if theme.row != theme.card:
+            draw.rounded_rectangle((x, y, x + inner_w, y + row_h), radius=14 * s, fill=theme.row)
+        x += 10 * s
+        top = y + (row_h - (8 * s if row.ratio is not None else 0)) // 2
+        draw_medal(draw, x, top - 15 * s - (6 * s if row.ratio is not None else 0), rank, theme)
+        x += 40 * s
+
+        avatar = card.avatars.get(row.avatar_id) if row.avatar_id else None
+        if avatar:
+            ay = y + (row_h - avatar_size) // 2
+            img.paste(avatar, (x, ay), avatar)
+            x += avatar_size + 12 * s
+
+        # 右侧数值与徽章
+        right = pad + inner_w - 14 * s
+        value_w = value_font.getlength(row.value) + (unit_font.getlength(row.value_unit) + 2 * s if row.value_unit else 0)
+        name_top = top - 20 * s - (6 * s if row.ratio is not None else 0)
+        vx = right - value_w
+        draw.text((vx, name_top + 2 * s), row.value, font=value_font, fill=theme.accent)
+        if row.value_unit:
+            draw.text((vx + value_font.getlength(row.value) + 2 * s, name_top + 8 * s), row.value_unit, font=unit_font, fill=theme.muted)
+        text_right = vx - 12 * s
+        if row.badge:
+            bw = badge_font.getlength(row.badge) + 12 * s
+            by = name_top + 26 * s
+            draw.rounded_rectangle((right - bw, by, right, by + 18 * s), radius=9 * s, fill=theme.bar_bg)
+            draw.text((right - bw / 2, by + 9 * s), row.badge, font=badge_font, fill=theme.accent, anchor="mm")
+            text_right = min(text_right, right - bw - 12 * s)
+
+        draw.text((x, name_top), _fit_text(row.title, name_font, text_right - x), font=name_font, fill=theme.text)
+        if row.subtitle:
+            draw.text((x, name_top + 24 * s), row.subtitle, font=sub_font, fill=theme.muted)
+
+        if row.ratio is not None:
+            bar_y = y + row_h - 16 * s
+            draw_bar(draw, (pad + 10 * s, bar_y, pad + inner_w - 14 * s, bar_y + 10 * s), max(0.05, row.ratio), theme)
+        y += row_h + gap
+
+    if card.footer:
+        draw.line((pad, y + 4 * s, pad + inner_w, y + 4 * s), fill=theme.border, width=s)
+        draw.text((cx, y + 20 * s), card.footer, font=get_font(12), fill=theme.muted, anchor="mt")
+
+    buf = BytesIO()
+    img.save(buf, format="PNG", optimize=False, compress_level=3)
+    return buf.getvalue()
+
+
+async def fetch_avatars(user_ids: Iterable[str], client: Optional[httpx.AsyncClient] = None) -> Dict[str, Image.Image]:
+    """并发下载 QQ 头像并裁成圆形，结果在内存中缓存"""
+    size = 44 * SCALE
+    result: Dict[str, Image.Image] = {}
+    missing = []
+    for uid in user_ids:
+        if uid in _avatar_cache:
+            result[uid] = _avatar_cache[uid]
+        else:
+            missing.append(uid)
+    if not missing:
+        return result
+
+    async def _one(c: httpx.AsyncClient, uid: str):
+        try:
+            resp = await c.get(f"http://q.qlogo.cn/headimg_dl?dst_uin={uid}&spec=100", timeout=5.0)
+            if resp.status_code == 200:
+                avatar = _circle_avatar(Image.open(BytesIO(resp.content)), size)
+                if len(_avatar_cache) >= AVATAR_CACHE_SIZE:
+                    _avatar_cache.pop(next(iter(_avatar_cache)))
+                _avatar_cache[uid] = avatar
+                result[uid] = avatar
+        except Exception as e:
+            logger.debug(f"渲染服务：获取头像 {uid} 失败: {e}")
+
+    if client:
+        await asyncio.gather(*(_one(client, uid) for uid in missing))
+    else:
+        async with httpx.AsyncClient() as c:
+            await asyncio.gather(*(_one(c, uid) for uid in missing))
+    return result
+
+
+async def render_card(card: RankCard) -> Tuple[bytes, float]:
+    """在线程中绘制卡片，返回 (PNG, 耗时秒)"""
+    start = time.perf_counter()
+    data = await asyncio.to_thread(draw_rank_card, card)
+    return data, time.perf_counter() - start
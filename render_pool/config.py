@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+
+class Config(BaseModel):
+    # 常驻页面数量，同时也是最大并发渲染数
+    render_pool_size: int = 3
+    # 排队中的渲染请求上限，超出后直接拒绝
+    render_pool_max_queue: int = 30
+    # 单个页面复用多少次后重建，防止长期运行内存膨胀
+    render_pool_page_max_uses: int = 100
+    # 单次渲染超时（秒）
+    render_pool_timeout: int = 30
+    render_pool_device_scale_factor: float = 2
+    # 简单排行卡片使用 Pillow 直接绘制，不经过浏览器
+    render_pool_pillow: bool = True
+    # Pillow 使用的中文字体路径，留空则自动查找系统字体
+    render_pool_font_path: str = ""
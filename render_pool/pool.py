@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional
+
+from nonebot import logger
+from nonebot_plugin_htmlrender import get_browser
+
+from .config import Config
+
+PRIORITY_HIGH = 0    # 用户主动触发、需要立即回复的渲染
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10    # 定时推送等可以稍后完成的渲染
+
+# 未指定视口时使用的尺寸，与 htmlrender 新建页面时 Playwright 的默认值一致
+DEFAULT_VIEWPORT = {"width": 1280, "height": 720}
+
+# 等待字体和图片全部就绪，替代固定的 sleep
+READY_JS = """async () => {
+    await document.fonts.ready;
+    await Promise.all(Array.from(document.images)
+        .filter(img => !img.complete)
+        .map(img => new Promise(resolve => { img.onload = img.onerror = resolve; })));
+}"""
+
+
+class RenderQueueFull(Exception):
+    """排队中的渲染请求已达上限"""
+
+
+class PriorityGate:
+    """按优先级放行的信号量，同优先级先到先得"""
+
+    def __init__(self, concurrency: int, max_waiting: int):
+        self._free = concurrency
+        self._max_waiting = max_waiting
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for *_, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int):
+        if self._free > 0 and not self.waiting:
+            self._free -= 1
+            return
+        if self.waiting >= self._max_waiting:
+            raise RenderQueueFull("渲染队列已满，请稍后再试")
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # 已经被放行但调用方取消了，把名额还回去
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            *_, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._free += 1
+
+
+class _Slot:
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.uses = 0
+
+
+class RenderPool:
+    """在 htmlrender 的浏览器上维护一组常驻页面，统一排队和计时"""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.gate = PriorityGate(max(1, config.render_pool_size), config.render_pool_max_queue)
+        self._idle: List[_Slot] = []
+        self._slots: List[_Slot] = []
+        self.metrics: Deque[dict] = deque(maxlen=500)
+
+    async def _new_slot(self) -> _Slot:
+        browser = await get_browser()
+        context = await browser.new_context(device_scale_factor=self.config.render_pool_device_scale_factor)
+        page = await context.new_page()
+        slot = _Slot(context, page)
+        self._slots.append(slot)
+        return slot
+
+    async def _discard(self, slot: _Slot):
+        if slot in self._slots:
+            self._slots.remove(slot)
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+
+    async def warm_up(self):
+        while len(self._slots) < self.config.render_pool_size:
+            try:
+                self._idle.append(await self._new_slot())
+            except Exception as e:
+                logger.warning(f"渲染服务：预热页面失败: {e}")
+                return
+        logger.info(f"渲染服务：已预热 {len(self._slots)} 个页面")
+
+    async def close(self):
+        for slot in list(self._slots):
+            await self._discard(slot)
+        self._idle.clear()
+
+    def record(self, kind: str, wait: float, render: float, ok: bool):
+        self.metrics.append({
+            "kind": kind,
+            "time": int(time.time()),
+            "wait_ms": round(wait * 1000, 1),
+            "render_ms": round(render * 1000, 1),
+            "ok": ok,
+        })
+
+    @asynccontextmanager
+    async def slot(self, kind: str, priority: int = PRIORITY_NORMAL):
+        """只占用并发名额与计时，不分配池内页面（用于 md_to_pic 等自带页面的调用）"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await self.gate.acquire(priority)
+        acquired = loop.time()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(kind, acquired - start, loop.time() - acquired, ok)
+            self.gate.release()
+
+    @asynccontextmanager
+    async def page(self, kind: str, viewport: Optional[Dict] = None, priority: int = PRIORITY_NORMAL):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await self.gate.acquire(priority)
+        acquired = loop.time()
+        slot: Optional[_Slot] = None
+        ok = False
+        try:
+            slot = self._idle.pop() if self._idle else await self._new_slot()
+            if slot.page.is_closed():
+                await self._discard(slot)
+                slot = await self._new_slot()
+            # 页面被上一次调用改过视口，每次都要重新设置
+            await slot.page.set_viewport_size(viewport or DEFAULT_VIEWPORT)
+            yield slot.page
+            ok = True
+        finally:
+            self.record(kind, acquired - start, loop.time() - acquired, ok)
+            if slot:
+                slot.uses += 1
+                # 出错的页面可能处于未知状态，直接重建
+                if not ok or slot.uses >= self.config.render_pool_page_max_uses or slot.page.is_closed():
+                    await self._discard(slot)
+                else:
+                    self._idle.append(slot)
+            self.gate.release()
+
+    @asynccontextmanager
+    async def isolated_page(self, kind: str, viewport: Optional[Dict] = None, priority: int = PRIORITY_NORMAL):
+        """占用并发名额，但使用用完即关的独立上下文（用于外部网页，Cookie、缓存等不与池内页面共享）"""
+        async with self.slot(kind, priority):
+            browser = await get_browser()
+            context = await browser.new_context(
+                device_scale_factor=self.config.render_pool_device_scale_factor,
+                viewport=viewport or DEFAULT_VIEWPORT,
+            )
+            try:
+                yield await context.new_page()
+            finally:
+                await context.close()
+
+    def summary(self) -> Dict[str, dict]:
+        result: Dict[str, dict] = {}
+        by_kind: Dict[str, List[dict]] = {}
+        for m in self.metrics:
+            by_kind.setdefault(m["kind"], []).append(m)
+        for kind, items in by_kind.items():
+            renders = sorted(m["render_ms"] for m in items)
+            waits = sorted(m["wait_ms"] for m in items)
+            result[kind] = {
+                "count": len(items),
+                "errors": sum(1 for m in items if not m["ok"]),
+                "render_p50": renders[len(renders) // 2],
+                "render_p95": renders[min(len(renders) - 1, int(len(renders) * 0.95))],
+                "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+            }
+        return result
+
+
+async def wait_ready(page, timeout: float = 10):
+    try:
+        await asyncio.wait_for(page.evaluate(READY_JS), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("渲染服务：等待字体/图片加载超时，直接截图")
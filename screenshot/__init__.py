@@ -3,6 +3,10 @@ from nonebot import on_command, logger
 from nonebot.adapters.onebot.v11 import MessageSegment, Message
 from nonebot.params import CommandArg
 from nonebot_plugin_htmlrender import get_new_page
+try:
+    from ..render_pool import url_to_pic, PRIORITY_HIGH
+except ImportError:
+    url_to_pic = None
 from nonebot.plugin import PluginMetadata
 from nonebot.exception import FinishedException
 
@@ -28,14 +32,18 @@ async def handle_screenshot(arg: Message = CommandArg()):
     await screenshot.send(f"正在抓取网页: {url}，请稍候...")
     
     try:
-        # 使用 htmlrender 的 get_new_page 手动截图
-        async with get_new_page(viewport={"width": 1280, "height": 720}) as page:
-            # 修改为 wait_until="load" 提高稳定性，并保留 60s 超时
-            await page.goto(url, wait_until="load", timeout=60000)
-            # 等待一小会儿确保 JS 渲染（可选，但通常 load 已经足够）
-            import asyncio
-            await asyncio.sleep(1) 
-            pic = await page.screenshot(full_page=True)
+        if url_to_pic:
+            # 渲染服务的常驻页面，load 后等待网络空闲与字体图片就绪
+            pic = await url_to_pic(url, viewport={"width": 1280, "height": 720}, timeout=60, priority=PRIORITY_HIGH)
+        else:
+            # 使用 htmlrender 的 get_new_page 手动截图
+            async with get_new_page(viewport={"width": 1280, "height": 720}) as page:
+                # 修改为 wait_until="load" 提高稳定性，并保留 60s 超时
+                await page.goto(url, wait_until="load", timeout=60000)
+                # 等待一小会儿确保 JS 渲染（可选，但通常 load 已经足够）
+                import asyncio
+                await asyncio.sleep(1) 
+                pic = await page.screenshot(full_page=True)
         
         await screenshot.finish(MessageSegment.image(pic))
     except FinishedException:
@@ -5,7 +5,14 @@ from nonebot.adapters.onebot.v11 import Bot, MessageEvent, GroupMessageEvent, Pr
 from nonebot.params import CommandArg
 from nonebot.plugin import PluginMetadata
 
-from nonebot_plugin_htmlrender import html_to_pic
+try:
+    from ..render_pool import html_to_pic
+except ImportError:
+    from nonebot_plugin_htmlrender import html_to_pic
+try:
+    from ..render_pool import CardRow, RankCard, fetch_avatars, pillow_available, rank_card_to_pic
+except ImportError:
+    rank_card_to_pic = None
 from pathlib import Path
 
 from .config import Config, get_level_name, get_coin_level_name
@@ -245,7 +252,31 @@ async def render_sign_card(
     return await html_to_pic(html_content, viewport={"width": 500, "height": 650})
 
 async def render_rank_card(rank_data: list) -> bytes:
-    """渲染排行榜卡片"""
+    """渲染排行榜卡片，优先使用 Pillow 绘制，不可用时回退到 HTML"""
+    # Pillow 不可用时不必下载头像，直接走 HTML
+    if rank_card_to_pic and pillow_available():
+        avatars = await fetch_avatars([str(user["user_id"]) for user in rank_data])
+        card = RankCard(
+            title="好感度排行榜",
+            rows=[
+                CardRow(
+                    title=str(user["nickname"]),
+                    subtitle=f"ID: {user['user_id']}",
+                    value=f"{user['favorability']:.1f}",
+                    badge=user["level_name"],
+                    avatar_id=str(user["user_id"]),
+                )
+                for user in rank_data
+            ],
+            footer=f"更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            theme="pink",
+            width=500,
+            avatars=avatars,
+        )
+        pic = await rank_card_to_pic(card)
+        if pic:
+            return pic
+
     template_path = TEMPLATES_PATH / "rank_card.html"
     with open(template_path, 'r', encoding='utf-8') as f:
         html_content = f.read()
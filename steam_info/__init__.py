@@ -10,7 +10,10 @@ from nonebot.exception import FinishedException
 from openai import AsyncOpenAI
 from .config import Config
 from pathlib import Path
-from nonebot_plugin_htmlrender import template_to_pic
+try:
+    from ..render_pool import template_to_pic
+except ImportError:
+    from nonebot_plugin_htmlrender import template_to_pic
 
 __plugin_metadata__ = PluginMetadata(
     name="Steam信息",
@@ -0,0 +1,46 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("nonebot")
+
+# 直接按文件加载，避免导入插件包时初始化整个 user_analysis 插件
+_spec = importlib.util.spec_from_file_location(
+    "user_analysis_cache", Path(__file__).resolve().parents[1] / "user_analysis" / "cache.py"
+)
+cache = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(cache)
+
+
+def _messages(*texts):
+    return [{"time": i, "content": text} for i, text in enumerate(texts)]
+
+
+def test_put_replaces_stale_entry_for_same_target_scope_model(tmp_path):
+    store = cache.AnalysisCache(tmp_path)
+    store.load()
+    first = cache.make_key("10001", _messages("a"), "gpt-4o-mini", "123")
+    second = cache.make_key("10001", _messages("a", "b"), "gpt-4o-mini", "123")
+
+    store.put(first, "old", None)
+    store.put(second, "new", None)
+
+    assert list(store.entries) == [second]
+    assert store.get(second) == ("new", None)
+
+
+def test_put_keeps_other_scopes_and_models(tmp_path):
+    store = cache.AnalysisCache(tmp_path)
+    store.load()
+    msgs = _messages("a")
+    keys = [
+        cache.make_key("10001", msgs, "qwen:7b", "123"),
+        cache.make_key("10001", msgs, "qwen:7b", "456"),
+        cache.make_key("10001", msgs, "qwen:14b", "123"),
+        cache.make_key("10001", msgs, "qwen:7b", "private"),
+    ]
+    for key in keys:
+        store.put(key, key, None)
+
+    assert list(store.entries) == keys
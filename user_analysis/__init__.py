@@ -1,9 +1,9 @@
+import asyncio
 import json
 import os
 import time
-import re
 import httpx
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
 from nonebot import on_message, on_command, get_plugin_config, logger, get_driver, require
@@ -15,6 +15,30 @@ from nonebot.exception import FinishedException
 from openai import AsyncOpenAI
 
 from .config import Config
+from .cache import AnalysisCache, make_key
+from .history import HistoryStore
+
+try:
+    from ..message_store import user_messages
+except ImportError:
+    user_messages = None
+
+try:
+    from ..web_console import register_memory_store
+except ImportError:
+    register_memory_store = None
+
+# AI 返回的 JSON 偶尔被截断或夹杂说明文字，有修复插件时先修复
+try:
+    try:
+        from plugin.json_repair import repair_json
+    except ImportError:
+        from ..json_repair import repair_json
+except ImportError:
+    def repair_json(text: str, start_chars: str = "{") -> str:
+        # 没有修复插件时只截取最外层的花括号，交给 json.loads 解析
+        start, end = text.find("{"), text.rfind("}")
+        return text[start:end + 1] if 0 <= start < end else ""
 
 # 尝试加载拟人插件的配置作为默认值
 try:
@@ -25,7 +49,10 @@ except Exception:
 
 require("nonebot_plugin_htmlrender")
 try:
-    from nonebot_plugin_htmlrender import md_to_pic, template_to_pic
+    try:
+        from ..render_pool import md_to_pic, template_to_pic
+    except ImportError:
+        from nonebot_plugin_htmlrender import md_to_pic, template_to_pic
 except ImportError:
     md_to_pic = None
     template_to_pic = None
@@ -42,145 +69,94 @@ driver_config = get_driver().config
 history_path = Path(plugin_config.user_analysis_history_path)
 history_path.parent.mkdir(parents=True, exist_ok=True)
 
+# 追加式消息日志，旧版的 history.json 会在首次启动时迁移过来
+store = HistoryStore(
+    history_path.with_suffix(".jsonl"),
+    plugin_config.user_analysis_history_max,
+    plugin_config.user_analysis_compact_ratio,
+)
 # 内存中的消息记录缓存
-# 格式: { "user_id": [{"role": "user", "content": "...", "time": 123456789}] }
-message_histories: Dict[str, List[Dict]] = {}
+# 格式: { "user_id": deque([{"content": "...", "time": 123456789}]) }
+message_histories = store.histories
+_flush_task: Optional[asyncio.Task] = None
+
+# 分析结果缓存，键为 (目标, 所在会话, 最近发言的哈希, 模型)
+analysis_cache = AnalysisCache(
+    Path(plugin_config.user_analysis_cache_dir),
+    ttl=plugin_config.user_analysis_cache_ttl,
+    max_entries=plugin_config.user_analysis_cache_max_entries,
+    max_bytes=plugin_config.user_analysis_cache_max_mb * 1024 * 1024,
+)
+# 正在进行的分析，相同键的请求共用一次调用
+_inflight: Dict[str, asyncio.Future] = {}
 
-def load_histories():
-    global message_histories
-    if history_path.exists():
-        try:
-            with open(history_path, "r", encoding="utf-8") as f:
-                message_histories = json.load(f)
-        except Exception as e:
-            logger.error(f"加载消息历史失败: {e}")
+
+class AnalysisError(Exception):
+    """可以直接回复给用户的分析失败原因"""
 
 def fix_truncated_json(json_str: str) -> str:
     """尝试修复被截断或格式不规范的 JSON 字符串"""
-    json_str = json_str.strip()
-    if not json_str:
-        return ""
-    
-    # 1. 尝试提取第一个 { 和最后一个 } 之间的内容
-    start_idx = json_str.find('{')
-    if start_idx == -1:
-        return ""
-    
-    # 2. 状态机解析
-    clean_json = ""
-    stack = []
-    in_string = False
-    escaped = False
-    
-    # 从第一个 { 开始处理
-    for i in range(start_idx, len(json_str)):
-        char = json_str[i]
-        
-        if escaped:
-            clean_json += char
-            escaped = False
-            continue
-            
-        if char == '\\':
-            clean_json += char
-            escaped = True
-            continue
-            
-        if char == '"':
-            in_string = not in_string
-            clean_json += char
-            continue
-            
-        if not in_string:
-            if char == '{':
-                stack.append('}')
-            elif char == '[':
-                stack.append(']')
-            elif char == '}':
-                if stack and stack[-1] == '}':
-                    stack.pop()
-                else:
-                    # 不匹配的闭合括号，跳过
-                    continue
-            elif char == ']':
-                if stack and stack[-1] == ']':
-                    stack.pop()
-                else:
-                    # 不匹配的闭合括号，跳过
-                    continue
-        
-        clean_json += char
-        
-        # 如果栈空了且不在字符串中，说明已经到了一个完整的 JSON 对象结尾
-        if not stack and not in_string and clean_json.endswith('}'):
-            return clean_json
-
-    # 3. 处理截断情况
-    if in_string:
-        clean_json += '"'  # 补全未闭合的字符串
-    
-    # 移除末尾多余的逗号
-    clean_json = clean_json.rstrip().rstrip(',')
-    
-    # 按相反顺序闭合所有括号
-    while stack:
-        clean_json += stack.pop()
-    
-    return clean_json
+    return repair_json(json_str or "")
 
 def extract_json_from_text(text: str) -> str:
     """从可能包含杂质的文本中提取 JSON"""
-    # 移除 markdown 代码块标记
-    text = re.sub(r'```json\s*', '', text)
-    text = re.sub(r'```\s*', '', text)
-    
-    # 查找第一个 {
-    start = text.find('{')
-    if start == -1:
-        return text
-    
-    return fix_truncated_json(text[start:])
-
-def save_histories():
-    try:
-        with open(history_path, "w", encoding="utf-8") as f:
-            json.dump(message_histories, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"保存消息历史失败: {e}")
-
-load_histories()
-
-# 消息记录器
-message_recorder = on_message(priority=99, block=False)
+    return repair_json(text or "") or text
+
+store.load(legacy_path=history_path)
+analysis_cache.load()
+if register_memory_store:
+    register_memory_store("user_analysis.analysis_cache", lambda: analysis_cache.entries)
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(plugin_config.user_analysis_flush_interval)
+        store.flush()
+        if store.needs_compaction():
+            await store.compact()
+
+
+@get_driver().on_startup
+async def _start_flush():
+    global _flush_task
+    # 接入共享消息库后不再记录新发言，旧日志只读，无需定时落盘和压缩
+    if user_messages is None:
+        _flush_task = asyncio.create_task(_flush_loop())
+
+
+@get_driver().on_shutdown
+async def _close_store():
+    if _flush_task:
+        _flush_task.cancel()
+    await store.close()
+
+async def get_user_messages(user_id: str, limit: int = 100) -> List[Dict]:
+    """优先从共享消息库读取，没有记录时再读本插件旧的消息日志"""
+    if user_messages:
+        msgs = await user_messages(int(user_id), limit)
+        if msgs:
+            return [{"content": m.plain, "time": m.time} for m in msgs]
+    return store.get(user_id)[-limit:]
+
+# 消息记录器：有共享消息库时由其统一记录，本地日志只作为旧数据保留
+if user_messages is None:
+    message_recorder = on_message(priority=99, block=False)
+
+    @message_recorder.handle()
+    async def handle_message(event: MessageEvent):
+        user_id = str(event.user_id)
+        content = event.get_plaintext().strip()
+        
+        if not content:
+            return
 
-@message_recorder.handle()
-async def handle_message(event: MessageEvent):
-    user_id = str(event.user_id)
-    content = event.get_plaintext().strip()
-    
-    if not content:
-        return
+        # 简单过滤命令 (以 / 或 . 开头的通常是命令)
+        command_starts = getattr(driver_config, "command_start", {"/", ""})
+        if any(content.startswith(start) for start in command_starts if start):
+            return
 
-    # 简单过滤命令 (以 / 或 . 开头的通常是命令)
-    command_starts = getattr(driver_config, "command_start", {"/", ""})
-    if any(content.startswith(start) for start in command_starts if start):
-        return
-
-    if user_id not in message_histories:
-        message_histories[user_id] = []
-    
-    # 记录消息
-    message_histories[user_id].append({
-        "content": content,
-        "time": int(time.time())
-    })
-    
-    # 限制长度
-    if len(message_histories[user_id]) > plugin_config.user_analysis_history_max:
-        message_histories[user_id] = message_histories[user_id][-plugin_config.user_analysis_history_max:]
-    
-    # 定期保存 (这里简单处理，每收到消息就保存)
-    save_histories()
+        # 只追加一行日志，超出上限的旧消息由内存队列挤出，定期压缩时从文件中清除
+        store.append(user_id, content, int(time.time()))
 
 # 分析命令
 analysis_cmd = on_command("成分分析", aliases={"查成分", "分析用户"}, priority=5, block=True)
@@ -205,41 +181,10 @@ async def handle_analysis(bot: Bot, event: MessageEvent, args: Message = Command
     if not target_id:
         target_id = str(event.user_id)
 
-    # 尝试通过 NapCat 获取历史记录
-    history_msgs = []
-    if isinstance(event, GroupMessageEvent):
-        try:
-            # NapCat 扩展 API: get_group_msg_history
-            res = await bot.call_api("get_group_msg_history", group_id=event.group_id)
-            if res and isinstance(res, list):
-                # 过滤出目标用户的文本消息
-                for m in res:
-                    if str(m.get("user_id")) == target_id:
-                        raw_msg = m.get("message", [])
-                        msg_text = ""
-                        if isinstance(raw_msg, list):
-                            for seg in raw_msg:
-                                if seg.get("type") == "text":
-                                    msg_text += seg.get("data", {}).get("text", "")
-                        elif isinstance(raw_msg, str):
-                            # 有些实现可能直接返回字符串
-                            msg_text = raw_msg
-                        
-                        if msg_text.strip():
-                            history_msgs.append({"content": msg_text.strip()})
-        except Exception as e:
-            logger.warning(f"通过 NapCat 获取历史记录失败: {e}")
-
-    # 获取最近 100 条消息
-    user_msgs = message_histories.get(target_id, [])
-    if not user_msgs:
+    # 获取最近 100 条消息（本地库读取，不再向协议端拉取历史）
+    final_msgs = await get_user_messages(target_id, 100)
+    if not final_msgs:
         await analysis_cmd.finish(f"由于真寻酱刚刚醒来（或者该用户还没说话），目前还没有用户 {target_id} 的聊天记录呢。")
-    
-    # 取最近 100 条
-    final_msgs = user_msgs[-100:]
-    msgs_text = "\n".join([f"- {m['content']}" for m in final_msgs])
-    
-    await analysis_cmd.send(f"正在分析用户 {target_id} 的 {len(final_msgs)} 条最近发言，请稍候...")
 
     # 准备 AI 调用 - 优先级: 插件配置 > 拟人插件配置 > 环境变量
     api_url = plugin_config.user_analysis_api_url or \
@@ -254,9 +199,61 @@ async def handle_analysis(bot: Bot, event: MessageEvent, args: Message = Command
             (person_config.personification_model if person_config else None) or \
             getattr(driver_config, "ai_model", "gpt-4o-mini")
 
+    # 发言没有变化时直接返回上次的结果
+    scope = str(event.group_id) if isinstance(event, GroupMessageEvent) else "private"
+    key = make_key(target_id, final_msgs, model, scope)
+    cached = analysis_cache.get(key)
+    if cached:
+        await _finish_result(*cached)
+
     if not api_key:
         await analysis_cmd.finish("未配置 AI API Key，无法进行分析。")
 
+    # 同一目标正在分析时等待那一次的结果，不重复调用
+    task = _inflight.get(key)
+    if task is None:
+        await analysis_cmd.send(f"正在分析用户 {target_id} 的 {len(final_msgs)} 条最近发言，请稍候...")
+        task = asyncio.ensure_future(_analyse_and_cache(key, bot, event, target_id, final_msgs, api_url, api_key, model))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    try:
+        render_md, pic = await asyncio.shield(task)
+    except AnalysisError as e:
+        await analysis_cmd.finish(str(e))
+    except Exception as e:
+        import traceback
+        logger.error(f"分析过程中发生错误: {e}\n{traceback.format_exc()}")
+        await analysis_cmd.finish(f"分析过程中发生错误: {str(e)}")
+    await _finish_result(render_md, pic)
+
+
+async def _analyse_and_cache(key: str, *args) -> Tuple[str, Optional[bytes]]:
+    render_md, pic = await run_analysis(*args)
+    # 渲染失败的结果不缓存，下次重新渲染
+    if pic is not None or not md_to_pic:
+        analysis_cache.put(key, render_md, pic)
+    return render_md, pic
+
+
+async def _finish_result(render_md: str, pic: Optional[bytes]):
+    # finish 会抛出 FinishedException，不能放在 try 块内被 Exception 捕获
+    if pic is not None:
+        await analysis_cmd.finish(MessageSegment.image(pic))
+    await analysis_cmd.finish(render_md)
+
+
+async def run_analysis(
+    bot: Bot,
+    event: MessageEvent,
+    target_id: str,
+    final_msgs: List[Dict],
+    api_url: str,
+    api_key: str,
+    model: str,
+) -> Tuple[str, Optional[bytes]]:
+    """调用 AI 分析并渲染，返回 (渲染用 Markdown, 图片)，渲染失败时图片为 None"""
+    msgs_text = "\n".join([f"- {m['content']}" for m in final_msgs])
+
     is_gemini = "gemini" in model.lower()
     base_url = api_url.rstrip("/")
     
@@ -315,41 +312,40 @@ async def handle_analysis(bot: Bot, event: MessageEvent, args: Message = Command
             "max_tokens": 1500
         }
 
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        response = await client.post(
+            url,
+            headers=headers,
+            json=payload
+        )
+        response.raise_for_status()
+        result = response.json()
+        
+        if is_gemini:
+            try:
+                analysis_md = result["candidates"][0]["content"]["parts"][0]["text"].strip()
+            except (KeyError, IndexError):
+                logger.error(f"Gemini 响应解析失败: {result}")
+                raise AnalysisError("AI 分析失败，响应格式异常。")
+        else:
+            analysis_md = result["choices"][0]["message"]["content"].strip()
+    
+    # 获取用户信息
+    nickname = target_id
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                url,
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            if is_gemini:
-                try:
-                    analysis_md = result["candidates"][0]["content"]["parts"][0]["text"].strip()
-                except (KeyError, IndexError):
-                    logger.error(f"Gemini 响应解析失败: {result}")
-                    await analysis_cmd.finish("AI 分析失败，响应格式异常。")
-            else:
-                analysis_md = result["choices"][0]["message"]["content"].strip()
+        if isinstance(event, GroupMessageEvent):
+            user_info = await bot.get_group_member_info(group_id=event.group_id, user_id=int(target_id))
+            nickname = user_info.get("card") or user_info.get("nickname") or target_id
+        else:
+            user_info = await bot.get_stranger_info(user_id=int(target_id))
+            nickname = user_info.get("nickname", target_id)
+    except Exception:
+        pass
         
-        # 获取用户信息
-        nickname = target_id
-        try:
-            if isinstance(event, GroupMessageEvent):
-                user_info = await bot.get_group_member_info(group_id=event.group_id, user_id=int(target_id))
-                nickname = user_info.get("card") or user_info.get("nickname") or target_id
-            else:
-                user_info = await bot.get_stranger_info(user_id=int(target_id))
-                nickname = user_info.get("nickname", target_id)
-        except Exception:
-            pass
-            
-        avatar = f"https://q1.qlogo.cn/g?b=qq&nk={target_id}&s=640"
-
-        # 构造最终用于渲染的 Markdown (嵌入 CSS)
-        render_md = f"""
+    avatar = f"https://q1.qlogo.cn/g?b=qq&nk={target_id}&s=640"
+
+    # 构造最终用于渲染的 Markdown (嵌入 CSS)
+    render_md = f"""
 <style>
     body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; padding: 30px; background-color: #f8fafc; }}
     h3 {{ color: #4a5568; border-left: 4px solid #667eea; padding-left: 10px; margin-top: 25px; }}
@@ -374,24 +370,13 @@ async def handle_analysis(bot: Bot, event: MessageEvent, args: Message = Command
 </div>
 """
 
-        if md_to_pic:
-            try:
-                pic = await md_to_pic(
-                    md=render_md,
-                    width=600
-                )
-            except Exception as e:
-                logger.error(f"Markdown 渲染图片失败: {e}")
-                await analysis_cmd.finish(render_md)
-            
-            # 发送图片并结束（finish 会抛出 FinishedException，不能放在 try 块内被 Exception 捕获）
-            await analysis_cmd.finish(MessageSegment.image(pic))
-        else:
-            await analysis_cmd.finish(render_md)
-
-    except FinishedException:
-        raise
-    except Exception as e:
-        import traceback
-        logger.error(f"分析过程中发生错误: {e}\n{traceback.format_exc()}")
-        await analysis_cmd.finish(f"分析过程中发生错误: {str(e)}")
+    pic = None
+    if md_to_pic:
+        try:
+            pic = await md_to_pic(
+                md=render_md,
+                width=600
+            )
+        except Exception as e:
+            logger.error(f"Markdown 渲染图片失败: {e}")
+    return render_md, pic
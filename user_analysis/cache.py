@@ -0,0 +1,143 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from nonebot import logger
+
+
+def _atomic_write(path: Path, data: bytes):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    tmp.replace(path)
+
+
+def make_key(target_id: str, messages: List[Dict], model: str, scope: str = "private") -> str:
+    """(目标, 所在会话, 最近发言的哈希, 模型) 组成的缓存键，发言有任何变化都会换键
+
+    报告里的昵称取自查询所在的群（群名片），不同群的结果不能共用，scope 为群号或 private。
+    """
+    digest = hashlib.sha1()
+    for m in messages:
+        digest.update(f"{m.get('time', 0)}\t{m['content']}\n".encode("utf-8"))
+    return f"{target_id}:{scope}:{digest.hexdigest()}:{model}"
+
+
+def _key_scope(key: str) -> Tuple[str, ...]:
+    """从缓存键中取出 (目标, 会话, 模型)；模型名本身可能含有冒号，所以最多切三次"""
+    parts = key.split(":", 3)
+    if len(parts) < 4:
+        # 旧版本的键没有会话字段，不与任何新键冲突
+        return tuple(parts)
+    target, scope, _, model = parts
+    return target, scope, model
+
+
+class AnalysisCache:
+    """成分分析结果缓存：Markdown 与渲染好的图片
+
+    索引保存在 index.json，图片按键的哈希存为单独的 PNG。
+    条目超过 ttl 秒视为过期；条数或图片总大小超限时按最近最少使用淘汰。
+    """
+
+    def __init__(self, cache_dir: Path, ttl: int = 3600, max_entries: int = 200, max_bytes: int = 50 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.index_path = cache_dir / "index.json"
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        # key -> {"md": 渲染用 Markdown, "png": 文件名或 None, "size": 图片字节数, "time": 写入时间}
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.total_bytes = 0
+
+    def load(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    for key, entry in json.load(f):
+                        if entry.get("png") and not (self.cache_dir / entry["png"]).exists():
+                            continue
+                        self.entries[key] = entry
+                        self.total_bytes += entry.get("size", 0)
+            except Exception as e:
+                logger.error(f"成分分析：加载结果缓存失败: {e}")
+                self.entries.clear()
+                self.total_bytes = 0
+        self._expire()
+        self._remove_stray_files()
+
+    def save(self):
+        try:
+            data = json.dumps(list(self.entries.items()), ensure_ascii=False).encode("utf-8")
+            _atomic_write(self.index_path, data)
+        except Exception as e:
+            logger.error(f"成分分析：保存结果缓存索引失败: {e}")
+
+    def _remove_stray_files(self):
+        # 崩溃或索引损坏后残留的图片
+        known = {e["png"] for e in self.entries.values() if e.get("png")}
+        for path in self.cache_dir.glob("*.png"):
+            if path.name not in known:
+                path.unlink(missing_ok=True)
+
+    def _drop(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.get("size", 0)
+        if entry.get("png"):
+            (self.cache_dir / entry["png"]).unlink(missing_ok=True)
+
+    def _expire(self) -> bool:
+        if self.ttl <= 0:
+            return False
+        deadline = time.time() - self.ttl
+        expired = [k for k, e in self.entries.items() if e["time"] < deadline]
+        for key in expired:
+            self._drop(key)
+        return bool(expired)
+
+    def get(self, key: str) -> Optional[Tuple[str, Optional[bytes]]]:
+        """命中时返回 (Markdown, 图片)，过期或图片丢失视为未命中"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl > 0 and time.time() - entry["time"] > self.ttl:
+            self._drop(key)
+            self.save()
+            return None
+        pic = None
+        if entry.get("png"):
+            try:
+                pic = (self.cache_dir / entry["png"]).read_bytes()
+            except OSError:
+                self._drop(key)
+                self.save()
+                return None
+        self.entries.move_to_end(key)
+        return entry["md"], pic
+
+    def put(self, key: str, md: str, pic: Optional[bytes]):
+        # 同一目标、同一会话、同一模型的旧结果对应的发言已经过时，不会再命中
+        scope = _key_scope(key)
+        for old in [k for k in self.entries if _key_scope(k) == scope]:
+            self._drop(old)
+        entry = {"md": md, "png": None, "size": 0, "time": time.time()}
+        if pic:
+            name = hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png"
+            try:
+                _atomic_write(self.cache_dir / name, pic)
+                entry.update(png=name, size=len(pic))
+            except OSError as e:
+                logger.error(f"成分分析：缓存图片写入失败: {e}")
+                return
+        self.entries[key] = entry
+        self.total_bytes += entry["size"]
+        self._expire()
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            self._drop(next(iter(self.entries)))
+        self.save()
@@ -10,3 +10,13 @@ class Config(BaseModel):
     # 消息记录配置
     user_analysis_history_max: int = 200  # 每个用户最多记录的消息数
     user_analysis_history_path: str = "data/user_analysis/history.json"
+    # 追加日志写盘间隔（秒）
+    user_analysis_flush_interval: float = 2.0
+    # 日志行数超过有效记录的多少倍时压缩
+    user_analysis_compact_ratio: float = 2.0
+
+    # 分析结果缓存（发言没有变化时直接返回上次的图片）
+    user_analysis_cache_dir: str = "data/user_analysis/cache"
+    user_analysis_cache_ttl: int = 86400  # 秒，0 表示不过期
+    user_analysis_cache_max_entries: int = 500
+    user_analysis_cache_max_mb: int = 100
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, TextIO
+
+from nonebot import logger
+
+
+class HistoryStore:
+    """按用户保存最近发言的追加式日志
+
+    每条消息只在日志末尾追加一行 JSON（{"u": 用户, "c": 内容, "t": 时间}），
+    写入耗时与已有数据量无关。内存中每个用户只保留最近 max_len 条；日志行数
+    超过有效记录的 compact_ratio 倍时在后台重写为快照，丢弃被挤出的旧消息。
+    """
+
+    def __init__(self, path: Path, max_len: int = 200, compact_ratio: float = 2.0, compact_min_lines: int = 10000):
+        self.path = path
+        self.max_len = max(1, max_len)
+        self.compact_ratio = max(1.0, compact_ratio)
+        self.compact_min_lines = compact_min_lines
+        self.histories: Dict[str, Deque[Dict]] = {}
+        self._fh: Optional[TextIO] = None
+        self._lines = 0
+        # 压缩期间新到的消息，压缩完成后补写到新日志
+        self._pending: Optional[List[str]] = None
+        self._compacting: Optional[asyncio.Task] = None
+
+    @property
+    def live_records(self) -> int:
+        return sum(len(q) for q in self.histories.values())
+
+    def load(self, legacy_path: Optional[Path] = None):
+        """读取日志；首次启动时从旧版 history.json 导入"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists() and legacy_path and legacy_path.exists():
+            self._import_legacy(legacy_path)
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                        self._remember(str(item["u"]), item["c"], int(item["t"]))
+                    except (ValueError, KeyError, TypeError):
+                        # 崩溃时最后一行可能只写了一半
+                        continue
+                    self._lines += 1
+        self._fh = open(self.path, "a", encoding="utf-8")
+
+    def _import_legacy(self, legacy_path: Path):
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"导入旧版消息历史失败: {e}")
+            return
+        for user_id, msgs in data.items():
+            for m in msgs:
+                self._remember(str(user_id), m.get("content", ""), int(m.get("time", 0)))
+        self._write_snapshot(self.path, self._snapshot())
+        self.histories.clear()
+        legacy_path.replace(legacy_path.with_suffix(legacy_path.suffix + ".bak"))
+        logger.info(f"已将旧版消息历史迁移到 {self.path}")
+
+    def _remember(self, user_id: str, content: str, ts: int):
+        q = self.histories.get(user_id)
+        if q is None:
+            q = self.histories[user_id] = deque(maxlen=self.max_len)
+        q.append({"content": content, "time": ts})
+
+    def append(self, user_id: str, content: str, ts: int):
+        self._remember(user_id, content, ts)
+        line = json.dumps({"u": user_id, "c": content, "t": ts}, ensure_ascii=False) + "\n"
+        if self._fh:
+            self._fh.write(line)
+        if self._pending is not None:
+            self._pending.append(line)
+        self._lines += 1
+
+    def get(self, user_id: str) -> List[Dict]:
+        return list(self.histories.get(user_id, ()))
+
+    def flush(self):
+        if self._fh:
+            self._fh.flush()
+
+    def needs_compaction(self) -> bool:
+        return self._lines > max(self.compact_min_lines, self.live_records * self.compact_ratio)
+
+    def _snapshot(self) -> List[str]:
+        return [
+            json.dumps({"u": user_id, "c": m["content"], "t": m["time"]}, ensure_ascii=False) + "\n"
+            for user_id, q in self.histories.items()
+            for m in q
+        ]
+
+    @staticmethod
+    def _write_snapshot(path: Path, lines: List[str]):
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(path)
+
+    async def compact(self):
+        """把日志重写为当前内存中的快照"""
+        if self._compacting:
+            return await self._compacting
+        self._compacting = asyncio.create_task(self._compact())
+        try:
+            await self._compacting
+        finally:
+            self._compacting = None
+
+    async def _compact(self):
+        lines = self._snapshot()
+        self._pending = []
+        try:
+            await asyncio.to_thread(self._write_snapshot, self.path, lines)
+        except Exception as e:
+            logger.error(f"压缩消息历史失败: {e}")
+            self._pending = None
+            return
+        # 快照已替换日志文件，旧句柄指向被替换掉的文件，改为追加到新文件
+        if self._fh:
+            self._fh.close()
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._fh.writelines(self._pending)
+        self._lines = len(lines) + len(self._pending)
+        self._pending = None
+        logger.debug(f"消息历史已压缩为 {self._lines} 行")
+
+    async def close(self):
+        if self._compacting:
+            await self._compacting
+        if self.needs_compaction():
+            await self.compact()
+        if self._fh:
+            self._fh.close()
+            self._fh = None
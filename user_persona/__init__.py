@@ -13,6 +13,25 @@ from openai import AsyncOpenAI
 import httpx
 
 from .config import Config
+from .store import GenerationQueue, MessageBuffer
+
+# 模型输出偶尔不是合法 JSON，有修复插件时先修复再解析
+try:
+    try:
+        from plugin.json_repair import loads_json
+    except ImportError:
+        from ..json_repair import loads_json
+except ImportError:
+    def loads_json(text: str, default=None, start_chars: str = "{"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return default
+
+try:
+    from ..message_store import subscribe
+except ImportError:
+    subscribe = None
 
 __plugin_meta__ = PluginMetadata(
     name="用户画像",
@@ -35,32 +54,46 @@ except Exception:
 data_path = Path(plugin_config.user_persona_data_path)
 data_path.parent.mkdir(parents=True, exist_ok=True)
 
+# 待生成的消息缓冲（追加日志）与生成任务队列和画像数据分开存放
+buffer = MessageBuffer(data_path.with_name("buffer.jsonl"), plugin_config.user_persona_flush_batch)
+
 # 内存中的数据缓存
 # 格式: { "histories": { "user_id": [msg1, msg2, ...] }, "personas": { "user_id": { "data": "...", "time": 123 } } }
-user_data: Dict = {"histories": {}, "personas": {}}
+user_data: Dict = {"histories": buffer.histories, "personas": {}}
+_flush_task: Optional[asyncio.Task] = None
 
 def load_data():
-    global user_data
+    legacy_histories = {}
     if data_path.exists():
         try:
             with open(data_path, "r", encoding="utf-8") as f:
                 loaded = json.load(f)
-                user_data["histories"] = loaded.get("histories", {})
+                # 旧版把消息缓冲也存在 data.json 中，首次启动时导入到追加日志
+                legacy_histories = loaded.get("histories", {})
                 user_data["personas"] = loaded.get("personas", {})
         except Exception as e:
             logger.error(f"加载画像数据失败: {e}")
+    buffer.load(legacy_histories)
 
 def save_data():
+    """只保存画像结果，仅在画像生成后调用"""
     try:
         with open(data_path, "w", encoding="utf-8") as f:
-            json.dump(user_data, f, ensure_ascii=False, indent=2)
+            json.dump({"personas": user_data["personas"]}, f, ensure_ascii=False, indent=2)
     except Exception as e:
         logger.error(f"保存画像数据失败: {e}")
 
 load_data()
 
 # AI 调用函数
-async def call_ai_persona(messages: List[str]) -> Optional[str]:
+PERSONA_FORMAT = (
+    "【职业推测】：...\n"
+    "【年龄推测】：...\n"
+    "【性别推测】：...\n"
+    "【人物描述】：（此处要求 150-200 字左右，详细描述性格、语言风格、兴趣爱好等特征）"
+)
+
+async def _chat(prompt: str, json_mode: bool = False) -> Optional[str]:
     api_key = plugin_config.user_persona_api_key or (person_config.personification_api_key if person_config else None)
     api_url = plugin_config.user_persona_api_url or (person_config.personification_api_url if person_config else "https://api.openai.com/v1")
     model = plugin_config.user_persona_model or (person_config.personification_model if person_config else "gpt-4o-mini")
@@ -72,19 +105,9 @@ async def call_ai_persona(messages: List[str]) -> Optional[str]:
     if not api_url.endswith(("/v1", "/v1/")):
         api_url = api_url.rstrip("/") + "/v1"
 
-    prompt = (
-        "你是一个专业的人格分析师和用户画像专家。\n"
-        "请根据以下用户最近的 30 条聊天记录，分析该用户的特征。\n"
-        "要求输出格式严格如下：\n"
-        "【职业推测】：...\n"
-        "【年龄推测】：...\n"
-        "【性别推测】：...\n"
-        "【人物描述】：（此处要求 150-200 字左右，详细描述性格、语言风格、兴趣爱好等特征）\n\n"
-        "用户聊天记录如下：\n" + "\n".join([f"- {m}" for m in messages])
-    )
-
+    kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
     try:
-        async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0)) as http_client:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(120.0 if json_mode else 60.0, connect=10.0)) as http_client:
             client = AsyncOpenAI(
                 api_key=api_key,
                 base_url=api_url,
@@ -93,59 +116,172 @@ async def call_ai_persona(messages: List[str]) -> Optional[str]:
             response = await client.chat.completions.create(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
+                temperature=0.7,
+                **kwargs
             )
             return response.choices[0].message.content.strip()
     except Exception as e:
         logger.error(f"画像生成 AI 调用失败: {e}")
         return None
 
-# 消息记录器
-message_recorder = on_message(priority=99, block=False)
+def _previous_persona(user_id: str) -> Optional[str]:
+    if not plugin_config.user_persona_incremental:
+        return None
+    persona = user_data["personas"].get(user_id)
+    return persona["data"] if persona else None
 
-@message_recorder.handle()
-async def handle_message(event: MessageEvent):
-    user_id = str(event.user_id)
-    content = event.get_plaintext().strip()
-    
-    if not content:
-        return
+async def call_ai_persona(messages: List[str], previous: Optional[str] = None) -> Optional[str]:
+    """生成画像；提供 previous 时只发送新消息，让模型在旧画像基础上修订"""
+    history = "\n".join([f"- {m}" for m in messages])
+    if previous:
+        prompt = (
+            "你是一个专业的人格分析师和用户画像专家。\n"
+            "下面是该用户已有的画像，以及之后新产生的聊天记录。\n"
+            "请以已有画像为基础，结合新记录修正或补充其中的判断：新记录支持的保留，"
+            "与之矛盾的调整，新出现的兴趣和特征补充进去。\n"
+            "要求输出完整的新画像，格式严格如下：\n"
+            f"{PERSONA_FORMAT}\n\n"
+            f"已有画像：\n{previous}\n\n"
+            f"新的 {len(messages)} 条聊天记录如下：\n{history}"
+        )
+    else:
+        prompt = (
+            "你是一个专业的人格分析师和用户画像专家。\n"
+            f"请根据以下用户最近的 {len(messages)} 条聊天记录，分析该用户的特征。\n"
+            "要求输出格式严格如下：\n"
+            f"{PERSONA_FORMAT}\n\n"
+            f"用户聊天记录如下：\n{history}"
+        )
+    return await _chat(prompt)
 
-    # 简单过滤命令
-    command_starts = getattr(driver_config, "command_start", {"/", ""})
-    if any(content.startswith(start) for start in command_starts if start):
-        return
+async def call_ai_persona_batch(batch: Dict[str, List[str]]) -> Dict[str, str]:
+    """一次请求为多个用户生成画像，返回 {用户: 画像}，解析失败的用户不在结果中"""
+    sections = []
+    for user_id, messages in batch.items():
+        section = f"## 用户 {user_id}\n"
+        previous = _previous_persona(user_id)
+        if previous:
+            section += f"已有画像：\n{previous}\n新的聊天记录：\n"
+        else:
+            section += "聊天记录：\n"
+        section += "\n".join([f"- {m}" for m in messages])
+        sections.append(section)
 
-    if user_id not in user_data["histories"]:
-        user_data["histories"][user_id] = []
-    
-    # 记录消息
-    user_data["histories"][user_id].append(content)
+    prompt = (
+        "你是一个专业的人格分析师和用户画像专家。\n"
+        f"下面是 {len(batch)} 个用户各自的聊天记录，请分别分析每个用户的特征，不同用户之间互不相关。\n"
+        "带有已有画像的用户，请以已有画像为基础结合新记录修订，输出完整的新画像。\n"
+        "每个画像的格式严格如下：\n"
+        f"{PERSONA_FORMAT}\n\n"
+        '只返回一个 JSON 对象，格式为 {"personas": {"用户QQ号": "画像文本", ...}}，不要包含其他内容。\n\n'
+        + "\n\n".join(sections)
+    )
+    content = await _chat(prompt, json_mode=True)
+    if not content:
+        return {}
+    # 输出过长被截断时也尽量保留已完整的画像
+    result = loads_json(content)
+    personas = result.get("personas") if isinstance(result, dict) else None
+    if not isinstance(personas, dict):
+        logger.warning("用户画像：批量结果解析失败")
+        return {}
+    return {
+        str(uid): text.strip() for uid, text in personas.items()
+        if str(uid) in batch and isinstance(text, str) and text.strip()
+    }
+
+def record_message(user_id: str, content: str):
+    buffer.append(user_id, content)
     
     # 检查是否达到上限
-    if len(user_data["histories"][user_id]) >= plugin_config.user_persona_history_max:
-        # 触发异步生成
-        history = user_data["histories"][user_id].copy()
-        # 清空记录
-        user_data["histories"][user_id] = []
-        save_data()
+    if buffer.count(user_id) >= plugin_config.user_persona_history_max:
+        # 队列已满时保留缓冲，下一条消息再尝试提交
+        if generation_queue.submit(user_id, buffer.get(user_id)):
+            buffer.clear(user_id)
+            logger.info(f"用户 {user_id} 消息达到 {plugin_config.user_persona_history_max} 条，已加入画像生成队列")
+
+# 消息记录器
+if subscribe:
+    # 由消息库统一解析并过滤命令后分发
+    @subscribe
+    async def handle_ingested(bot: Bot, msg):
+        if msg.plain and not msg.is_command:
+            record_message(str(msg.user_id), msg.plain)
+else:
+    message_recorder = on_message(priority=99, block=False)
+
+    @message_recorder.handle()
+    async def handle_message(event: MessageEvent):
+        user_id = str(event.user_id)
+        content = event.get_plaintext().strip()
         
-        logger.info(f"用户 {user_id} 消息达到 {plugin_config.user_persona_history_max} 条，开始生成画像...")
-        asyncio.create_task(trigger_generation(user_id, history))
-    else:
-        save_data()
+        if not content:
+            return
 
-async def trigger_generation(user_id: str, history: List[str]):
-    persona_text = await call_ai_persona(history)
+        # 简单过滤命令
+        command_starts = getattr(driver_config, "command_start", {"/", ""})
+        if any(content.startswith(start) for start in command_starts if start):
+            return
+
+        record_message(user_id, content)
+
+def _save_persona(user_id: str, persona_text: str, samples: int):
+    previous = user_data["personas"].get(user_id) if plugin_config.user_persona_incremental else None
+    user_data["personas"][user_id] = {
+        "data": persona_text,
+        "time": int(time.time()),
+        # 增量模式下画像累计参考过的发言数
+        "samples": (previous or {}).get("samples", 0) + samples,
+    }
+
+async def trigger_generation(user_id: str, history: List[str]) -> bool:
+    persona_text = await call_ai_persona(history, _previous_persona(user_id))
     if persona_text:
-        user_data["personas"][user_id] = {
-            "data": persona_text,
-            "time": int(time.time())
-        }
+        _save_persona(user_id, persona_text, len(history))
         save_data()
         logger.info(f"用户 {user_id} 画像生成成功")
-    else:
-        logger.error(f"用户 {user_id} 画像生成失败")
+        return True
+    return False
+
+async def trigger_batch_generation(batch: Dict[str, List[str]]) -> Dict[str, bool]:
+    personas = await call_ai_persona_batch(batch)
+    for user_id, persona_text in personas.items():
+        _save_persona(user_id, persona_text, len(batch[user_id]))
+    if personas:
+        save_data()
+        logger.info(f"批量生成 {len(personas)}/{len(batch)} 个用户画像成功")
+    # 批量结果中缺失的用户单独再请求一次，仍失败的交给队列重试
+    results = {user_id: True for user_id in personas}
+    for user_id, history in batch.items():
+        if user_id not in results:
+            results[user_id] = await trigger_generation(user_id, history)
+    return results
+
+generation_queue = GenerationQueue(
+    data_path.with_name("jobs.json"),
+    trigger_generation,
+    workers=plugin_config.user_persona_workers,
+    max_pending=plugin_config.user_persona_queue_max,
+    max_messages=plugin_config.user_persona_history_max * 2,
+    max_retries=plugin_config.user_persona_max_retries,
+    retry_base=plugin_config.user_persona_retry_base,
+    batch_handler=trigger_batch_generation,
+    batch_size=plugin_config.user_persona_batch_size,
+)
+generation_queue.load()
+
+@get_driver().on_startup
+async def _start_queue():
+    global _flush_task
+    _flush_task = asyncio.create_task(buffer.run(plugin_config.user_persona_flush_interval))
+    generation_queue.start()
+
+@get_driver().on_shutdown
+async def _stop_queue():
+    if _flush_task:
+        _flush_task.cancel()
+    await generation_queue.stop()
+    await buffer.flush()
 
 # 命令处理器
 view_persona_cmd = on_command("查看画像", priority=5, block=True)
@@ -170,13 +306,16 @@ async def handle_view_persona(bot: Bot, event: MessageEvent, args: Message = Com
         
     if target_id not in user_data["personas"]:
         # 检查是否有正在记录的历史
-        count = len(user_data["histories"].get(target_id, []))
+        count = buffer.count(target_id)
+        if target_id in generation_queue.pending or target_id in generation_queue.running:
+            await view_persona_cmd.finish("该用户的画像正在生成中，请稍后再查看。")
         await view_persona_cmd.finish(f"该用户暂无画像。当前已记录 {count}/{plugin_config.user_persona_history_max} 条消息。")
     
     persona = user_data["personas"][target_id]
     update_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(persona["time"]))
     
-    msg = f"用户 {target_id} 的画像分析 (更新时间: {update_time})：\n\n{persona['data']}"
+    samples = f"，累计参考 {persona['samples']} 条发言" if persona.get("samples") else ""
+    msg = f"用户 {target_id} 的画像分析 (更新时间: {update_time}{samples})：\n\n{persona['data']}"
     await view_persona_cmd.finish(msg)
 
 @refresh_persona_cmd.handle()
@@ -196,20 +335,19 @@ async def handle_refresh_persona(bot: Bot, event: MessageEvent, args: Message =
     if not target_id:
         target_id = str(event.user_id)
 
-    history = user_data["histories"].get(target_id, [])
+    history = buffer.get(target_id)
     if not history:
         await refresh_persona_cmd.finish("当前没有任何聊天记录，无法刷新画像。")
     
     await refresh_persona_cmd.send(f"正在根据当前 {len(history)} 条记录生成画像，请稍候...")
     
     # 强制生成并清空
-    persona_text = await call_ai_persona(history)
+    persona_text = await call_ai_persona(history, _previous_persona(target_id))
     if persona_text:
-        user_data["personas"][target_id] = {
-            "data": persona_text,
-            "time": int(time.time())
-        }
-        user_data["histories"][target_id] = []
+        _save_persona(target_id, persona_text, len(history))
+        buffer.clear(target_id)
+        # 队列中尚未执行的旧任务基于更早的消息，不再需要
+        generation_queue.discard(target_id)
         save_data()
         await refresh_persona_cmd.finish(f"画像刷新成功！\n\n{persona_text}")
     else:
@@ -11,3 +11,18 @@ class Config(BaseModel):
     # 消息记录配置
     user_persona_history_max: int = 70  # 满 70 条自动生成
     user_persona_data_path: str = "data/user_persona/data.json"
+    
+    # 生成队列配置
+    user_persona_workers: int = 2  # 同时进行的画像生成数
+    user_persona_queue_max: int = 100  # 待生成任务上限，超出后暂缓提交
+    user_persona_max_retries: int = 3
+    user_persona_retry_base: float = 30.0  # 首次重试等待秒数，之后每次翻倍
+    
+    # 在已有画像基础上只发送新消息进行修订
+    user_persona_incremental: bool = True
+    # 队列积压时一次请求最多为几个用户生成画像，1 为关闭批量模式
+    user_persona_batch_size: int = 1
+    
+    # 消息缓冲写盘配置
+    user_persona_flush_interval: float = 2.0
+    user_persona_flush_batch: int = 200
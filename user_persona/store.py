@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from nonebot import logger
+
+
+def _atomic_write(path: Path, text: str):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(path)
+
+
+class MessageBuffer:
+    """画像生成前的消息缓冲，以追加日志的形式批量落盘
+
+    日志每行是 {"u": 用户, "c": 内容} 或清空标记 {"u": 用户, "clear": 1}。
+    写入先进入内存队列，由后台任务按时间或条数批量追加；日志行数超过
+    有效记录的 compact_ratio 倍时改为写入一份快照。
+    """
+
+    def __init__(self, path: Path, batch_size: int = 200, compact_ratio: float = 2.0, compact_min_lines: int = 5000):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.compact_ratio = max(1.0, compact_ratio)
+        self.compact_min_lines = compact_min_lines
+        self.histories: Dict[str, List[str]] = {}
+        self._pending: List[str] = []
+        self._lines = 0
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def load(self, legacy: Optional[Dict[str, List[str]]] = None):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists():
+            if legacy:
+                self.histories.update({uid: list(msgs) for uid, msgs in legacy.items() if msgs})
+                _atomic_write(self.path, "".join(self._snapshot()))
+                self._lines = sum(len(msgs) for msgs in self.histories.values())
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                    uid = str(item["u"])
+                    if item.get("clear"):
+                        self.histories.pop(uid, None)
+                    else:
+                        self.histories.setdefault(uid, []).append(item["c"])
+                except (ValueError, KeyError, TypeError):
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+                self._lines += 1
+
+    @property
+    def live_records(self) -> int:
+        return sum(len(msgs) for msgs in self.histories.values())
+
+    def count(self, user_id: str) -> int:
+        return len(self.histories.get(user_id, ()))
+
+    def get(self, user_id: str) -> List[str]:
+        return list(self.histories.get(user_id, ()))
+
+    def append(self, user_id: str, content: str):
+        self.histories.setdefault(user_id, []).append(content)
+        self._push({"u": user_id, "c": content})
+
+    def clear(self, user_id: str):
+        if self.histories.pop(user_id, None) is not None:
+            self._push({"u": user_id, "clear": 1})
+
+    def _push(self, item: Dict):
+        self._pending.append(json.dumps(item, ensure_ascii=False) + "\n")
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _snapshot(self) -> List[str]:
+        return [
+            json.dumps({"u": uid, "c": content}, ensure_ascii=False) + "\n"
+            for uid, msgs in self.histories.items()
+            for content in msgs
+        ]
+
+    async def flush(self):
+        """把积攒的记录追加到日志，必要时压缩为快照"""
+        async with self._lock:
+            if not self._pending:
+                return
+            lines, self._pending = self._pending, []
+            self._lines += len(lines)
+            try:
+                if self._lines > max(self.compact_min_lines, self.live_records * self.compact_ratio):
+                    # 快照已包含这一批，直接替换整个日志
+                    snapshot = self._snapshot()
+                    await asyncio.to_thread(_atomic_write, self.path, "".join(snapshot))
+                    self._lines = len(snapshot)
+                else:
+                    await asyncio.to_thread(self._append_lines, lines)
+            except Exception as e:
+                logger.error(f"用户画像：写入消息缓冲失败: {e}")
+                self._pending = lines + self._pending
+                self._lines -= len(lines)
+
+    def _append_lines(self, lines: List[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    async def run(self, interval: float):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+# 生成任务的处理函数：(用户, 消息) -> 是否成功
+Handler = Callable[[str, List[str]], Awaitable[bool]]
+# 批量处理函数：{用户: 消息} -> {用户: 是否成功}，结果中缺少的用户按失败处理
+BatchHandler = Callable[[Dict[str, List[str]]], Awaitable[Dict[str, bool]]]
+
+
+class GenerationQueue:
+    """画像生成队列：固定数量的 worker、按用户去重、失败退避重试、待处理任务持久化
+
+    同一用户同时最多有一个待处理任务和一个执行中任务，重复提交时合并消息。
+    提供 batch_handler 且 batch_size > 1 时，worker 会把已就绪的多个任务合并成一次调用。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        handler: Handler,
+        workers: int = 2,
+        max_pending: int = 100,
+        max_messages: int = 140,
+        max_retries: int = 3,
+        retry_base: float = 30.0,
+        batch_handler: Optional[BatchHandler] = None,
+        batch_size: int = 1,
+    ):
+        self.path = path
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_messages = max_messages
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.batch_handler = batch_handler
+        self.batch_size = max(1, batch_size) if batch_handler else 1
+        self.pending: Dict[str, Dict] = {}
+        self.running: Dict[str, Dict] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._scheduled: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for job in json.load(f):
+                    self.pending[str(job["user_id"])] = job
+        except Exception as e:
+            logger.error(f"用户画像：加载生成队列失败: {e}")
+
+    def save(self):
+        jobs = []
+        for uid, job in self.running.items():
+            # 同一用户既在执行又有新任务时合并保存，避免崩溃后丢失其中一份
+            if uid in self.pending:
+                job = {**job, "messages": job["messages"] + self.pending[uid]["messages"]}
+            jobs.append(job)
+        jobs.extend(job for uid, job in self.pending.items() if uid not in self.running)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            _atomic_write(self.path, json.dumps(jobs, ensure_ascii=False))
+        except Exception as e:
+            logger.error(f"用户画像：保存生成队列失败: {e}")
+
+    def start(self):
+        now = time.time()
+        for uid, job in self.pending.items():
+            self._schedule(uid, job.get("not_before", 0) - now)
+        if self.pending:
+            logger.info(f"用户画像：恢复 {len(self.pending)} 个未完成的生成任务")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # 执行到一半的任务放回待处理，下次启动重新生成
+        for uid, job in self.running.items():
+            self._merge(uid, job, front=True)
+        self.running.clear()
+        self.save()
+
+    @property
+    def size(self) -> int:
+        return len(self.pending) + len(self.running)
+
+    def submit(self, user_id: str, messages: List[str]) -> bool:
+        """提交生成任务，队列已满时返回 False"""
+        if user_id not in self.pending and self.size >= self.max_pending:
+            return False
+        self._merge(user_id, {"user_id": user_id, "messages": messages, "attempts": 0, "not_before": 0})
+        self.save()
+        # 执行中的用户等本次完成后再调度
+        if user_id not in self.running:
+            self._schedule(user_id, 0)
+        return True
+
+    def discard(self, user_id: str):
+        if self.pending.pop(user_id, None) is not None:
+            self.save()
+
+    def _merge(self, user_id: str, job: Dict, front: bool = False):
+        existing = self.pending.get(user_id)
+        if existing is None:
+            self.pending[user_id] = job
+            return
+        if front:
+            existing["messages"] = job["messages"] + existing["messages"]
+            # 放回的是失败或中断的任务，保留其重试次数和退避时间，否则新消息会把重试计数清零
+            existing["attempts"] = max(existing.get("attempts", 0), job.get("attempts", 0))
+            existing["not_before"] = max(existing.get("not_before", 0), job.get("not_before", 0))
+        else:
+            existing["messages"] = existing["messages"] + job["messages"]
+        # 积压过多时只保留最新的消息
+        existing["messages"] = existing["messages"][-self.max_messages:]
+
+    def _schedule(self, user_id: str, delay: float):
+        if user_id in self._scheduled:
+            return
+        self._scheduled.add(user_id)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, user_id)
+        else:
+            self._queue.put_nowait(user_id)
+
+    def _take(self, user_id: str) -> Optional[Dict]:
+        self._scheduled.discard(user_id)
+        job = self.pending.pop(user_id, None)
+        if job is not None:
+            self.running[user_id] = job
+        return job
+
+    async def _worker(self):
+        while True:
+            user_id = await self._queue.get()
+            job = self._take(user_id)
+            if job is None:
+                continue
+            jobs = {user_id: job}
+            # 队列积压时顺带取走其他已就绪的任务
+            while len(jobs) < self.batch_size and not self._queue.empty():
+                other = self._queue.get_nowait()
+                other_job = self._take(other)
+                if other_job is not None:
+                    jobs[other] = other_job
+
+            try:
+                if len(jobs) == 1:
+                    results = {user_id: await self.handler(user_id, job["messages"])}
+                else:
+                    results = await self.batch_handler({uid: j["messages"] for uid, j in jobs.items()})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"用户画像：生成任务异常: {e}")
+                results = {}
+
+            for uid, j in jobs.items():
+                self.running.pop(uid, None)
+                self._finish(uid, j, bool(results.get(uid)))
+            self.save()
+
+    def _finish(self, user_id: str, job: Dict, ok: bool):
+        if not ok:
+            job["attempts"] = job.get("attempts", 0) + 1
+            if job["attempts"] <= self.max_retries:
+                delay = self.retry_base * 2 ** (job["attempts"] - 1)
+                job["not_before"] = time.time() + delay
+                self._merge(user_id, job, front=True)
+                logger.warning(f"用户 {user_id} 画像生成失败，{delay:.0f} 秒后第 {job['attempts']} 次重试")
+                self._schedule(user_id, delay)
+                return
+            logger.error(f"用户 {user_id} 画像生成失败，已达最大重试次数")
+        if user_id in self.pending:
+            # 执行期间又攒满了一批（成功或放弃重试后都要调度）
+            self._schedule(user_id, 0)
@@ -18,6 +18,14 @@ from nonebot.permission import SUPERUSER
 from nonebot.adapters.onebot.v11 import Bot, MessageEvent, GroupMessageEvent, PrivateMessageEvent, MessageSegment
 from nonebot.plugin import PluginMetadata
 
+from . import memory
+from .memory import register_memory_store
+
+try:
+    from ..message_store import subscribe, recent_messages, search_messages
+except ImportError:
+    subscribe = None
+
 __plugin_meta__ = PluginMetadata(
     name="Web 控制台",
     description="通过浏览器查看和发送消息",
@@ -254,30 +262,9 @@ async def handle_login_cmd(bot: Bot, event: MessageEvent):
             first_url = f"http://{public_ips[0]}:{port}/web_console" if public_ips else f"http://127.0.0.1:{port}/web_console"
             await login_cmd.finish(f"私聊发送失败，请确保您已添加机器人为好友。\n(当前环境访问地址提示：{first_url})")
 
-# 监听所有消息
-msg_matcher = on_message(priority=1, block=False)
-
-@msg_matcher.handle()
-async def handle_all_messages(bot: Bot, event: MessageEvent):
-    chat_id = get_chat_id(event)
-    
-    # 尝试通过 get_msg 获取更详细的消息内容（尤其是 NapCat 等框架提供的 URL）
-    sender_name = event.sender.nickname or str(event.user_id)
-    try:
-        msg_details = await bot.get_msg(message_id=event.message_id)
-        message = msg_details["message"]
-        # 如果 get_msg 返回了 sender 信息，则优先使用
-        if "sender" in msg_details:
-            sender_name = msg_details["sender"].get("nickname") or msg_details["sender"].get("card") or sender_name
-    except Exception as e:
-        logger.warning(f"获取消息详情失败: {e}，将使用事件自带消息内容")
-        message = event.get_message()
-
-    # 消息内容解析
+def parse_elements(message) -> List[dict]:
+    """把消息段解析为前端使用的元素列表"""
     elements = []
-    # 消息唯一 ID：使用适配器提供的原始 ID，以便前端去重
-    msg_id = str(event.message_id)
-    
     # 如果 message 是列表（get_msg 返回格式），直接遍历；如果是 Message 对象，也可以遍历
     for seg in message:
         # 处理 get_msg 返回的字典格式或 MessageSegment 对象
@@ -318,21 +305,25 @@ async def handle_all_messages(bot: Bot, event: MessageEvent):
             elements.append({"type": "at", "data": seg_data.get("qq")})
         elif seg_type == "reply":
             elements.append({"type": "reply", "data": seg_data.get("id")})
-    
-    msg_data = {
-        "id": event.message_id,
-        "chat_id": chat_id,
-        "time": event.time,
-        "type": "group" if isinstance(event, GroupMessageEvent) else "private",
-        "sender_id": event.user_id,
-        "sender_name": sender_name,
-        "sender_avatar": f"https://q1.qlogo.cn/g?b=qq&nk={event.user_id}&s=640",
-        "elements": elements,
-        "content": event.get_plaintext(),
-        "self_id": bot.self_id,
-        "is_self": False
+    return elements
+
+def stored_to_msg_data(msg, self_id: str) -> dict:
+    """把消息库中的记录转为前端消息格式"""
+    return {
+        "id": msg.message_id or 0,
+        "chat_id": f"{msg.chat_type}_{msg.chat_id}",
+        "time": msg.time,
+        "type": msg.chat_type,
+        "sender_id": msg.user_id,
+        "sender_name": "我" if msg.is_self else msg.nickname,
+        "sender_avatar": f"https://q1.qlogo.cn/g?b=qq&nk={msg.user_id}&s=640",
+        "elements": parse_elements(msg.segments),
+        "content": msg.plain,
+        "self_id": self_id,
+        "is_self": msg.is_self
     }
-    
+
+async def push_message(chat_id: str, msg_data: dict):
     # 存入缓存
     if chat_id not in message_cache:
         message_cache[chat_id] = []
@@ -347,6 +338,55 @@ async def handle_all_messages(bot: Bot, event: MessageEvent):
         "data": msg_data
     })
 
+if subscribe:
+    # 由消息库统一解析后分发
+    @subscribe
+    async def handle_ingested(bot: Bot, msg):
+        segments = msg.segments
+        # 事件里的图片缺少地址时才调用 get_msg 补全，避免每条消息都多一次 API 调用
+        if any(s["type"] == "image" and not (s["data"].get("url") or s["data"].get("file") or s["data"].get("path")) for s in segments) and msg.message_id:
+            try:
+                segments = (await bot.get_msg(message_id=msg.message_id))["message"]
+            except Exception as e:
+                logger.warning(f"获取消息详情失败: {e}，将使用事件自带消息内容")
+        msg_data = stored_to_msg_data(msg, bot.self_id)
+        msg_data["elements"] = parse_elements(segments)
+        await push_message(msg_data["chat_id"], msg_data)
+else:
+    # 监听所有消息
+    msg_matcher = on_message(priority=1, block=False)
+
+    @msg_matcher.handle()
+    async def handle_all_messages(bot: Bot, event: MessageEvent):
+        chat_id = get_chat_id(event)
+        
+        # 尝试通过 get_msg 获取更详细的消息内容（尤其是 NapCat 等框架提供的 URL）
+        sender_name = event.sender.nickname or str(event.user_id)
+        try:
+            msg_details = await bot.get_msg(message_id=event.message_id)
+            message = msg_details["message"]
+            # 如果 get_msg 返回了 sender 信息，则优先使用
+            if "sender" in msg_details:
+                sender_name = msg_details["sender"].get("nickname") or msg_details["sender"].get("card") or sender_name
+        except Exception as e:
+            logger.warning(f"获取消息详情失败: {e}，将使用事件自带消息内容")
+            message = event.get_message()
+
+        msg_data = {
+            "id": event.message_id,
+            "chat_id": chat_id,
+            "time": event.time,
+            "type": "group" if isinstance(event, GroupMessageEvent) else "private",
+            "sender_id": event.user_id,
+            "sender_name": sender_name,
+            "sender_avatar": f"https://q1.qlogo.cn/g?b=qq&nk={event.user_id}&s=640",
+            "elements": parse_elements(message),
+            "content": event.get_plaintext(),
+            "self_id": bot.self_id,
+            "is_self": False
+        }
+        await push_message(chat_id, msg_data)
+
 async def broadcast_message(data: dict):
     if not active_connections:
         return
@@ -460,6 +500,66 @@ async def get_system_status():
 async def get_logs():
     return list(log_buffer)
 
+# --- 内存诊断相关 API ---
+
+@driver.on_startup
+async def _start_memory_sampler():
+    interval = float(getattr(driver.config, "web_console_memory_sample_interval", 300))
+    if interval > 0:
+        memory.start_sampler(interval)
+
+@driver.on_shutdown
+async def _stop_memory_sampler():
+    await memory.stop_sampler()
+
+@app.get("/web_console/api/memory/stores", dependencies=[Depends(check_auth)])
+async def get_memory_stores():
+    return {"stores": await memory.collect_store_sizes()}
+
+@app.get("/web_console/api/memory/rss", dependencies=[Depends(check_auth)])
+async def get_memory_rss():
+    return memory.rss_growth()
+
+@app.post("/web_console/api/memory/tracemalloc", dependencies=[Depends(check_auth)])
+async def tracemalloc_action(request: Request):
+    data = await request.json()
+    action = data.get("action")
+
+    if action == "start":
+        started = memory.start_tracing(int(data.get("frames", 1)))
+        return {"msg": "tracemalloc 已启动" if started else "tracemalloc 已在运行"}
+    elif action == "stop":
+        stopped = memory.stop_tracing()
+        return {"msg": "tracemalloc 已停止" if stopped else "tracemalloc 未在运行"}
+    elif action == "snapshot":
+        try:
+            return memory.take_snapshot()
+        except RuntimeError as e:
+            return {"error": str(e)}
+    return {"error": "无效操作"}
+
+@app.get("/web_console/api/memory/snapshots", dependencies=[Depends(check_auth)])
+async def get_memory_snapshots():
+    return {"tracing": memory.tracemalloc.is_tracing(), "snapshots": memory.list_snapshots()}
+
+@app.get("/web_console/api/memory/snapshots/{snapshot_id}", dependencies=[Depends(check_auth)])
+async def get_memory_snapshot(snapshot_id: int, key_type: str = "lineno", limit: int = 30):
+    if key_type not in ("lineno", "filename", "traceback"):
+        return {"error": "无效的统计方式"}
+    try:
+        return {"stats": memory.snapshot_stats(snapshot_id, key_type, limit)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
+@app.get("/web_console/api/memory/diff", dependencies=[Depends(check_auth)])
+async def diff_memory_snapshots(base: int, target: int, key_type: str = "lineno", limit: int = 30):
+    if key_type not in ("lineno", "filename", "traceback"):
+        return {"error": "无效的统计方式"}
+    try:
+        return {"stats": memory.diff_snapshots(base, target, key_type, limit)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+
 @app.get("/web_console/api/plugins", dependencies=[Depends(check_auth)])
 async def get_plugins():
     from nonebot import get_loaded_plugins
@@ -718,8 +818,32 @@ async def get_chats():
 
 @app.get("/web_console/api/history/{chat_id}", dependencies=[Depends(check_auth)])
 async def get_history(chat_id: str):
+    # 重启后内存缓存为空，从消息库补上最近的记录
+    if not message_cache.get(chat_id) and subscribe:
+        chat_type, _, raw_id = chat_id.partition("_")
+        if raw_id.isdigit():
+            stored = await recent_messages(chat_type, int(raw_id), CACHE_SIZE)
+            if stored:
+                self_id = next(iter(get_driver().bots), "")
+                message_cache[chat_id] = [stored_to_msg_data(m, self_id) for m in stored]
     return message_cache.get(chat_id, [])
 
+@app.get("/web_console/api/messages/search", dependencies=[Depends(check_auth)])
+async def search_history(q: str, chat_id: Optional[str] = None, limit: int = 50):
+    if not subscribe:
+        return {"error": "未加载消息库插件"}
+    chat_type, raw_id = None, None
+    if chat_id:
+        chat_type, _, raw_id = chat_id.partition("_")
+    results = await search_messages(
+        q,
+        chat_type,
+        int(raw_id) if raw_id and raw_id.isdigit() else None,
+        min(max(1, limit), 200),
+    )
+    self_id = next(iter(get_driver().bots), "")
+    return [stored_to_msg_data(m, self_id) for m in results]
+
 @app.get("/web_console/proxy/image", dependencies=[Depends(check_auth)])
 async def proxy_image(url: str):
     url = unquote(url)
@@ -0,0 +1,286 @@
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from nonebot import get_loaded_plugins, logger
+
+# 已知的常驻内存数据 {显示名: (插件名, 属性路径)}
+# 属性路径按 "." 逐级 getattr，在查询时才解析，避免插件加载顺序问题
+KNOWN_STORES: Dict[str, Tuple[str, str]] = {
+    "personification.chat_histories": ("personification", "chat_histories"),
+    "user_analysis.message_histories": ("user_analysis", "message_histories"),
+    "user_persona.user_data": ("user_persona", "user_data"),
+    "web_console.message_cache": ("web_console", "message_cache"),
+    "web_console.image_cache": ("web_console", "image_cache"),
+    "daily_waifu.cache": ("daily_waifu", "source.cache"),
+}
+
+# 其他插件手动注册的数据 {显示名: 返回对象的函数}
+_custom_stores: Dict[str, Callable[[], Any]] = {}
+
+# 单个对象的遍历上限；遍历在线程中进行，不会阻塞事件循环，但仍会占用 GIL
+MAX_WALK_OBJECTS = 200_000
+
+# tracemalloc 快照 {快照 ID: (时间戳, 快照)}
+MAX_SNAPSHOTS = 5
+_snapshots: Dict[int, Tuple[float, tracemalloc.Snapshot]] = {}
+_snapshot_seq = 0
+
+# RSS 采样记录，默认每 5 分钟一次，保留约 7 天
+rss_history: deque = deque(maxlen=2016)
+_sampler_task: Optional[asyncio.Task] = None
+
+
+def register_memory_store(name: str, getter: Callable[[], Any]):
+    """注册一个需要统计大小的内存数据，getter 返回当前对象"""
+    _custom_stores[name] = getter
+
+
+def _resolve_store(plugin_name: str, attr_path: str) -> Any:
+    for plugin in get_loaded_plugins():
+        if plugin.name != plugin_name:
+            continue
+        obj: Any = plugin.module
+        for attr in attr_path.split("."):
+            obj = getattr(obj, attr, None)
+            if obj is None:
+                return None
+        return obj
+    return None
+
+
+def deep_sizeof(obj: Any, limit: int = MAX_WALK_OBJECTS) -> Tuple[int, int, bool]:
+    """近似计算对象及其引用的容器总大小
+
+    返回 (字节数, 遍历对象数, 是否因达到上限而截断)
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    count = 0
+    while stack:
+        if count >= limit:
+            return total, count, True
+        cur = stack.pop()
+        if id(cur) in seen:
+            continue
+        seen.add(id(cur))
+        count += 1
+        try:
+            total += sys.getsizeof(cur)
+        except TypeError:
+            continue
+        # 在线程中运行时事件循环可能同时修改这些容器：先一次性拷贝成列表，
+        # 拷贝期间仍被改动（deque 等）时跳过该对象的内容，结果本来就是近似值
+        try:
+            if isinstance(cur, dict):
+                items = list(cur.items())
+                stack.extend(k for k, _ in items)
+                stack.extend(v for _, v in items)
+            elif isinstance(cur, (list, tuple, set, frozenset, deque)):
+                stack.extend(list(cur))
+            elif hasattr(cur, "__dict__") and not isinstance(cur, type):
+                stack.append(vars(cur))
+        except RuntimeError:
+            continue
+    return total, count, False
+
+
+def _top_level_len(obj: Any) -> Optional[int]:
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+async def collect_store_sizes() -> List[dict]:
+    stores: Dict[str, Callable[[], Any]] = {
+        name: (lambda p=plugin, a=attr: _resolve_store(p, a))
+        for name, (plugin, attr) in KNOWN_STORES.items()
+    }
+    stores.update(_custom_stores)
+
+    result = []
+    for name, getter in stores.items():
+        try:
+            obj = getter()
+        except Exception as e:
+            result.append({"name": name, "loaded": False, "error": str(e)})
+            continue
+        if obj is None:
+            result.append({"name": name, "loaded": False})
+            continue
+        size, objects, truncated = await asyncio.to_thread(deep_sizeof, obj)
+        result.append({
+            "name": name,
+            "loaded": True,
+            "type": type(obj).__name__,
+            "entries": _top_level_len(obj),
+            "bytes": size,
+            "objects": objects,
+            "truncated": truncated,
+        })
+    result.sort(key=lambda x: x.get("bytes", 0), reverse=True)
+    return result
+
+
+# --- tracemalloc ---
+
+def start_tracing(frames: int = 1) -> bool:
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    logger.info(f"Web 控制台：tracemalloc 已启动 (frames={frames})")
+    return True
+
+
+def stop_tracing() -> bool:
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    _snapshots.clear()
+    logger.info("Web 控制台：tracemalloc 已停止")
+    return True
+
+
+def take_snapshot() -> dict:
+    global _snapshot_seq
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc 未启动")
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    _snapshot_seq += 1
+    _snapshots[_snapshot_seq] = (time.time(), snapshot)
+    while len(_snapshots) > MAX_SNAPSHOTS:
+        _snapshots.pop(next(iter(_snapshots)))
+    current, peak = tracemalloc.get_traced_memory()
+    return {"id": _snapshot_seq, "time": int(time.time()), "traced": current, "peak": peak}
+
+
+def list_snapshots() -> List[dict]:
+    return [{"id": sid, "time": int(ts)} for sid, (ts, _) in _snapshots.items()]
+
+
+def _format_stat(stat) -> dict:
+    frame = stat.traceback[0]
+    data = {
+        "file": frame.filename,
+        "line": frame.lineno,
+        "size": stat.size,
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        data["size_diff"] = stat.size_diff
+        data["count_diff"] = stat.count_diff
+    return data
+
+
+def snapshot_stats(snapshot_id: int, key_type: str = "lineno", limit: int = 30) -> List[dict]:
+    if snapshot_id not in _snapshots:
+        raise KeyError(snapshot_id)
+    stats = _snapshots[snapshot_id][1].statistics(key_type)
+    return [_format_stat(s) for s in stats[:limit]]
+
+
+def diff_snapshots(base_id: int, target_id: int, key_type: str = "lineno", limit: int = 30) -> List[dict]:
+    if base_id not in _snapshots or target_id not in _snapshots:
+        raise KeyError(base_id if base_id not in _snapshots else target_id)
+    base = _snapshots[base_id][1]
+    target = _snapshots[target_id][1]
+    stats = target.compare_to(base, key_type)
+    return [_format_stat(s) for s in stats[:limit]]
+
+
+# --- 按插件归属的内存 ---
+
+def _plugin_dirs() -> List[Tuple[str, str]]:
+    dirs = []
+    for plugin in get_loaded_plugins():
+        file = getattr(plugin.module, "__file__", None)
+        if not file:
+            continue
+        path = Path(file)
+        # 包插件以目录为单位，单文件插件以文件为单位
+        root = path.parent if path.name == "__init__.py" else path
+        dirs.append((plugin.name, str(root)))
+    # 长路径优先，保证嵌套插件匹配到最具体的那个
+    dirs.sort(key=lambda x: len(x[1]), reverse=True)
+    return dirs
+
+
+def traced_by_plugin(snapshot: Optional[tracemalloc.Snapshot] = None) -> Dict[str, int]:
+    """按插件目录汇总 tracemalloc 记录的分配大小，需要 tracemalloc 已启动"""
+    if snapshot is None:
+        if not tracemalloc.is_tracing():
+            return {}
+        snapshot = tracemalloc.take_snapshot()
+    dirs = _plugin_dirs()
+    result: Dict[str, int] = {}
+    for stat in snapshot.statistics("filename"):
+        filename = stat.traceback[0].filename
+        owner = "other"
+        for name, root in dirs:
+            if filename.startswith(root):
+                owner = name
+                break
+        result[owner] = result.get(owner, 0) + stat.size
+    return result
+
+
+def sample_rss() -> dict:
+    import psutil
+
+    rss = psutil.Process(os.getpid()).memory_info().rss
+    sample = {"time": int(time.time()), "rss": rss, "plugins": traced_by_plugin()}
+    rss_history.append(sample)
+    return sample
+
+
+def rss_growth() -> dict:
+    """返回 RSS 采样序列及首尾之间各插件的增长量"""
+    samples = list(rss_history)
+    growth: Dict[str, int] = {}
+    if len(samples) >= 2:
+        first, last = samples[0]["plugins"], samples[-1]["plugins"]
+        for name in set(first) | set(last):
+            growth[name] = last.get(name, 0) - first.get(name, 0)
+    return {
+        "samples": samples,
+        "rss_growth": samples[-1]["rss"] - samples[0]["rss"] if len(samples) >= 2 else 0,
+        "plugin_growth": dict(sorted(growth.items(), key=lambda x: x[1], reverse=True)),
+    }
+
+
+async def _sampler_loop(interval: float):
+    while True:
+        try:
+            sample_rss()
+        except Exception as e:
+            logger.warning(f"Web 控制台：RSS 采样失败: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_sampler(interval: float):
+    global _sampler_task
+    if _sampler_task and not _sampler_task.done():
+        return
+    _sampler_task = asyncio.create_task(_sampler_loop(interval))
+
+
+async def stop_sampler():
+    global _sampler_task
+    if _sampler_task:
+        _sampler_task.cancel()
+        try:
+            await _sampler_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _sampler_task = None
@@ -1,27 +1,68 @@
+import asyncio
 import httpx
 import json
+import time
+from collections import defaultdict
+from pathlib import Path
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
-from nonebot import on_command, get_plugin_config, logger
+from nonebot import on_command, get_driver, get_plugin_config, logger
 from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, Message, MessageSegment
 from nonebot.params import CommandArg
 from nonebot.plugin import PluginMetadata
-from nonebot_plugin_htmlrender import md_to_pic
+try:
+    from ..render_pool import md_to_pic
+except ImportError:
+    from nonebot_plugin_htmlrender import md_to_pic
 
+from .cache import SummaryCache
+from .chunks import estimate_tokens, split_chunks
 from .config import Config
 
+try:
+    from ..message_store import group_history
+except ImportError:
+    group_history = None
+
 __plugin_meta__ = PluginMetadata(
     name="群聊总结",
     description="获取最近150条聊天记录并生成总结 (OpenAI/柏拉图格式)",
-    usage="总结 / zongjie",
+    usage="总结 [数量/今天] [模型] / zongjie",
     config=Config,
 )
 
 plugin_config = get_plugin_config(Config)
 
+# 每个群上次的总结，用于增量更新和重复请求
+summary_cache = SummaryCache(Path(plugin_config.zongjie_cache_path))
+summary_cache.load()
+# 同一个群的总结请求依次处理，后来的请求可以直接用前一个的结果
+_group_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+TODAY_ARGS = {"今天", "今日", "today"}
+_ZONGJIE_COMMANDS = {"总结", "zongjie", "群总结", "总结模型", "list_models"}
+_COMMAND_STARTS = get_driver().config.command_start or {""}
+
+SUMMARY_SYSTEM_PROMPT = "你是一个群聊总结助手。请根据提供的聊天记录，使用标准 Markdown 格式进行总结，包括主要内容、关键结论和重要事项。请确保输出仅包含 Markdown 内容，不要有任何开场白或解释性文字。"
+SUMMARY_INTRO = "以下是最近的群聊记录，请进行总结："
+MERGE_SYSTEM_PROMPT = "你是一个群聊总结助手。下面给出之前的群聊总结和此后新增的聊天记录，请把新增内容合并进总结，输出一份完整的、更新后的标准 Markdown 总结，包括主要内容、关键结论和重要事项。已有内容可以精简，但不要丢失重要信息。请确保输出仅包含 Markdown 内容，不要有任何开场白或解释性文字。"
+MERGE_INTRO = "请根据新增的聊天记录更新以下总结："
+CHUNK_SYSTEM_PROMPT = "你是一个群聊总结助手。下面是一段较长群聊记录中的一部分，请提炼这一部分的主要话题、关键结论和重要事项，保留参与者的昵称，使用简洁的 Markdown 列表输出。请确保输出仅包含 Markdown 内容，不要有任何开场白或解释性文字。"
+CHUNK_INTRO = "以下是群聊记录的第 {index}/{total} 段，请提炼要点："
+REDUCE_SYSTEM_PROMPT = "你是一个群聊总结助手。下面是同一段群聊按时间顺序分段提炼出的要点，请合并去重，整理成一份完整的标准 Markdown 总结，包括主要内容、关键结论和重要事项。请确保输出仅包含 Markdown 内容，不要有任何开场白或解释性文字。"
+REDUCE_INTRO = "以下是按时间顺序排列的各段要点，请合并为最终总结："
+# call_ai_api 返回的这些文本不是总结，不能缓存
+_FAILED_SUMMARIES = {"Gemini 响应格式异常", "未能生成总结"}
+
+
+def _is_failed(summary: str) -> bool:
+    return summary.startswith("AI API") or summary in _FAILED_SUMMARIES
+
 async def get_group_history(bot: Bot, group_id: int, count: int = 150) -> List[Dict[str, Any]]:
-    """获取群聊天记录"""
+    """获取群聊天记录，优先使用共享消息库中的本地记录"""
+    if group_history:
+        return await group_history(bot, group_id, count)
     try:
         res = await bot.call_api("get_group_msg_history", group_id=group_id, count=count)
         if isinstance(res, dict) and "messages" in res:
@@ -33,8 +74,34 @@ async def get_group_history(bot: Bot, group_id: int, count: int = 150) -> List[D
         logger.error(f"获取群聊天记录失败: {e}")
         return []
 
-def format_messages(messages: List[Dict[str, Any]]) -> str:
-    """格式化聊天记录为文本"""
+def _plain_text(msg: Dict[str, Any]) -> str:
+    raw_msg = msg.get("message", "")
+    if isinstance(raw_msg, str):
+        return raw_msg.strip()
+    return "".join(
+        seg.get("data", {}).get("text", "") for seg in raw_msg if isinstance(seg, dict) and seg.get("type") == "text"
+    ).strip()
+
+def _is_noise(msg: Dict[str, Any], self_id: str) -> bool:
+    """机器人自己发的消息（“正在获取…”、总结图片等）和指令消息不参与总结"""
+    if str(msg.get("user_id")) == self_id:
+        return True
+    text = _plain_text(msg)
+    if not text:
+        return False
+    for start in _COMMAND_STARTS:
+        if not text.startswith(start):
+            continue
+        # 带前缀的一律视为指令；空前缀时只认本插件的指令
+        if start or text.split(maxsplit=1)[0] in _ZONGJIE_COMMANDS:
+            return True
+    return False
+
+def filter_messages(messages: List[Dict[str, Any]], self_id: str) -> List[Dict[str, Any]]:
+    return [m for m in messages if not _is_noise(m, self_id)]
+
+def format_lines(messages: List[Dict[str, Any]]) -> List[str]:
+    """格式化聊天记录，每条消息一行"""
     formatted = []
     for msg in messages:
         user_id = msg.get("user_id", "未知")
@@ -58,9 +125,18 @@ def format_messages(messages: List[Dict[str, Any]]) -> str:
         if content.strip():
             formatted.append(f"{nickname}({user_id}): {content}")
             
-    return "\n".join(formatted)
+    return formatted
 
-async def call_ai_api(prompt: str, model: Optional[str] = None) -> str:
+def format_messages(messages: List[Dict[str, Any]]) -> str:
+    """格式化聊天记录为文本"""
+    return "\n".join(format_lines(messages))
+
+async def call_ai_api(
+    prompt: str,
+    model: Optional[str] = None,
+    system_prompt: str = SUMMARY_SYSTEM_PROMPT,
+    intro: str = SUMMARY_INTRO,
+) -> str:
     """调用 AI API (支持 OpenAI 兼容格式和 Gemini 官方格式)"""
     base_url = plugin_config.zongjie_base_url.strip().rstrip('/')
     api_key = plugin_config.zongjie_api_key.strip()
@@ -87,7 +163,7 @@ async def call_ai_api(prompt: str, model: Optional[str] = None) -> str:
                 {
                     "parts": [
                         {
-                            "text": f"你是一个群聊总结助手。请根据提供的聊天记录，使用标准 Markdown 格式进行总结，包括主要内容、关键结论和重要事项。请确保输出仅包含 Markdown 内容，不要有任何开场白或解释性文字。\n\n以下是最近的群聊记录：\n\n{prompt}"
+                            "text": f"{system_prompt}\n\n{intro}\n\n{prompt}"
                         }
                     ]
                 }
@@ -114,11 +190,11 @@ async def call_ai_api(prompt: str, model: Optional[str] = None) -> str:
             "messages": [
                 {
                     "role": "system",
-                    "content": "你是一个群聊总结助手。请根据提供的聊天记录，使用标准 Markdown 格式进行总结，包括主要内容、关键结论和重要事项。请确保输出仅包含 Markdown 内容，不要有任何开场白或解释性文字。"
+                    "content": system_prompt
                 },
                 {
                     "role": "user",
-                    "content": f"以下是最近的群聊记录，请进行总结：\n\n{prompt}"
+                    "content": f"{intro}\n\n{prompt}"
                 }
             ]
         }
@@ -175,6 +251,42 @@ async def call_ai_api(prompt: str, model: Optional[str] = None) -> str:
             logger.error(f"AI API 调用异常: {e}")
             return f"AI API 调用失败: {e}"
 
+async def summarise_lines(lines: List[str], model: Optional[str] = None) -> str:
+    """总结聊天记录；超出单次上下文预算时分段并发提炼，再合并为最终总结"""
+    budget = plugin_config.zongjie_chunk_tokens
+    text = "\n".join(lines)
+    if estimate_tokens(text) <= budget:
+        return await call_ai_api(text, model=model)
+
+    chunks = split_chunks(lines, budget)
+    logger.info(f"群聊总结：{len(lines)} 条记录分为 {len(chunks)} 段并发总结")
+    semaphore = asyncio.Semaphore(max(1, plugin_config.zongjie_chunk_concurrency))
+
+    async def run(system_prompt: str, intro: str, prompt: str) -> str:
+        async with semaphore:
+            return await call_ai_api(prompt, model=model, system_prompt=system_prompt, intro=intro)
+
+    results = await asyncio.gather(*(
+        run(CHUNK_SYSTEM_PROMPT, CHUNK_INTRO.format(index=i, total=len(chunks)), "\n".join(chunk))
+        for i, chunk in enumerate(chunks, 1)
+    ))
+    partials = [r for r in results if not _is_failed(r)]
+    if not partials:
+        return results[0]
+    if len(partials) < len(results):
+        logger.warning(f"群聊总结：{len(results) - len(partials)} 段总结失败，已跳过")
+
+    # 要点本身仍然过长时逐层合并，直到能放进一次请求
+    while len(partials) > 1 and estimate_tokens("\n\n".join(partials)) > budget:
+        groups = split_chunks(partials, budget)
+        if len(groups) == len(partials):
+            # 每段要点都接近预算，无法再分组合并
+            break
+        merged = await asyncio.gather(*(run(REDUCE_SYSTEM_PROMPT, REDUCE_INTRO, "\n\n".join(g)) for g in groups))
+        partials = [m for m in merged if not _is_failed(m)] or partials
+
+    return await call_ai_api("\n\n".join(partials), model=model, system_prompt=REDUCE_SYSTEM_PROMPT, intro=REDUCE_INTRO)
+
 zongjie = on_command("总结", aliases={"zongjie", "群总结"}, priority=5, block=True)
 zongjie_models = on_command("总结模型", aliases={"list_models"}, priority=5, block=True)
 
@@ -182,12 +294,17 @@ zongjie_models = on_command("总结模型", aliases={"list_models"}, priority=5,
 async def handle_zongjie(bot: Bot, event: GroupMessageEvent, arg: Message = CommandArg()):
     count = plugin_config.zongjie_history_count
     model = None
+    today = False
     
     args = arg.extract_plain_text().strip().split()
     if args:
-        # 第一个参数尝试解析为数量
-        if args[0].isdigit():
-            count = min(int(args[0]), 500)
+        # 第一个参数尝试解析为数量或“今天”
+        if args[0].isdigit() or args[0] in TODAY_ARGS:
+            if args[0] in TODAY_ARGS:
+                today = True
+                count = plugin_config.zongjie_max_count
+            else:
+                count = min(int(args[0]), plugin_config.zongjie_max_count)
             # 如果还有第二个参数，解析为模型
             if len(args) > 1:
                 model = args[1]
@@ -195,40 +312,81 @@ async def handle_zongjie(bot: Bot, event: GroupMessageEvent, arg: Message = Comm
             # 如果第一个参数不是数字，直接视为模型名
             model = args[0]
     
-    msg = f"正在获取最近 {count} 条聊天记录"
-    if model:
-        msg += f"并使用模型 {model} 生成总结..."
-    else:
-        msg += f"并使用默认模型生成总结..."
-    
-    await zongjie.send(msg)
-    
     # 1. 获取聊天记录
-    messages = await get_group_history(bot, event.group_id, count)
+    messages = filter_messages(await get_group_history(bot, event.group_id, count), bot.self_id)
+    if today:
+        midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        messages = [m for m in messages if m.get("time", 0) >= midnight]
     if not messages:
         await zongjie.finish("未能获取到足够的聊天记录，可能当前环境不支持获取历史记录。")
-    
-    # 2. 格式化记录
-    formatted_text = format_messages(messages)
-    if not formatted_text:
-        await zongjie.finish("聊天记录为空，无法生成总结。")
-    
-    # 3. 调用 AI
-    summary = await call_ai_api(formatted_text, model=model)
-    
-    # 如果 summary 以 "AI API 错误" 开头，说明调用失败，直接发送文本
-    if summary.startswith("AI API"):
-        await zongjie.finish(summary)
-    
-    # 4. 渲染 Markdown 为图片
-    pic = None
-    try:
-        # 为总结添加一个标题
-        md_content = f"# 群聊总结 ({datetime.now().strftime('%Y-%m-%d %H:%M')})\n\n{summary}"
-        pic = await md_to_pic(md_content, width=800)
-    except Exception as e:
-        logger.error(f"渲染图片失败: {e}")
-    
+    scope = "today" if today else count
+
+    model_name = model or plugin_config.zongjie_model
+    async with _group_locks[event.group_id]:
+        # 2. 与上次的总结比较，只处理之后的新消息
+        entry = summary_cache.get(event.group_id, model_name)
+        if entry and today and entry["time"] < midnight:
+            # 昨天的总结不能作为今天的基础
+            entry = None
+        new_messages = summary_cache.new_messages(entry, messages) if entry else None
+        age = time.time() - entry["time"] if entry else 0
+        if new_messages == [] and entry["count"] == scope and age <= plugin_config.zongjie_repeat_window:
+            pic = summary_cache.picture(event.group_id)
+            await zongjie.finish(MessageSegment.image(pic) if pic else entry["summary"])
+        # 只有范围相同的总结才能增量更新，否则（如 总结 50 之后 总结 500）重新总结
+        incremental = bool(new_messages) and entry["count"] == scope and age <= plugin_config.zongjie_incremental_window
+
+        if incremental:
+            await zongjie.send(f"距上次总结有 {len(new_messages)} 条新消息，正在更新总结...")
+        else:
+            msg = f"正在获取今天的 {len(messages)} 条聊天记录" if today else f"正在获取最近 {count} 条聊天记录"
+            if model:
+                msg += f"并使用模型 {model} 生成总结..."
+            else:
+                msg += f"并使用默认模型生成总结..."
+            await zongjie.send(msg)
+
+        # 3. 格式化记录并调用 AI
+        if incremental:
+            new_lines = format_lines(new_messages)
+            formatted_text = "\n".join(new_lines)
+            if formatted_text and estimate_tokens(formatted_text) > plugin_config.zongjie_chunk_tokens:
+                # 新消息太多时先单独总结，再与上次的总结合并
+                formatted_text = await summarise_lines(new_lines, model=model)
+                if _is_failed(formatted_text):
+                    await zongjie.finish(formatted_text)
+            if formatted_text:
+                summary = await call_ai_api(
+                    f"## 之前的总结\n\n{entry['summary']}\n\n## 新增聊天记录\n\n{formatted_text}",
+                    model=model,
+                    system_prompt=MERGE_SYSTEM_PROMPT,
+                    intro=MERGE_INTRO,
+                )
+            else:
+                # 新消息里没有可总结的内容
+                summary = entry["summary"]
+        else:
+            lines = format_lines(messages)
+            if not lines:
+                await zongjie.finish("聊天记录为空，无法生成总结。")
+            summary = await summarise_lines(lines, model=model)
+
+        # 如果 summary 以 "AI API 错误" 开头，说明调用失败，直接发送文本
+        if summary.startswith("AI API"):
+            await zongjie.finish(summary)
+
+        # 4. 渲染 Markdown 为图片
+        pic = None
+        try:
+            # 为总结添加一个标题
+            md_content = f"# 群聊总结 ({datetime.now().strftime('%Y-%m-%d %H:%M')})\n\n{summary}"
+            pic = await md_to_pic(md_content, width=800)
+        except Exception as e:
+            logger.error(f"渲染图片失败: {e}")
+
+        if summary not in _FAILED_SUMMARIES:
+            summary_cache.put(event.group_id, messages, scope, model_name, summary, pic)
+
     if pic:
         await zongjie.finish(MessageSegment.image(pic))
     else:
@@ -0,0 +1,76 @@
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from nonebot import logger
+
+
+def message_seq(msg: Dict[str, Any]) -> List[Any]:
+    """消息在群内的位置标识，本地库与协议端返回的记录都能用"""
+    return [msg.get("time", 0), msg.get("message_seq") or msg.get("message_id"), msg.get("user_id")]
+
+
+class SummaryCache:
+    """每个群最近一次总结：总结到的最后一条消息、总结文本和渲染好的图片
+
+    文本部分保存在 JSON 文件中，重启后仍可增量总结；图片只保存在内存里。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        # 群号 -> {"cursor": message_seq, "count": 条数或 "today", "model": 模型, "summary": 文本, "time": 生成时间}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.pictures: Dict[str, bytes] = {}
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            logger.error(f"群聊总结：加载总结缓存失败: {e}")
+
+    def save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            tmp.replace(self.path)
+        except Exception as e:
+            logger.error(f"群聊总结：保存总结缓存失败: {e}")
+
+    def get(self, group_id: int, model: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(str(group_id))
+        if entry is None or entry.get("model") != model:
+            return None
+        return entry
+
+    def picture(self, group_id: int) -> Optional[bytes]:
+        return self.pictures.get(str(group_id))
+
+    @staticmethod
+    def new_messages(entry: Dict[str, Any], messages: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """取出上次总结之后的消息；上次总结到的消息已不在本次记录中时返回 None"""
+        cursor = entry.get("cursor")
+        for i in range(len(messages) - 1, -1, -1):
+            if message_seq(messages[i]) == cursor:
+                return messages[i + 1:]
+        return None
+
+    def put(self, group_id: int, messages: List[Dict[str, Any]], count: Union[int, str], model: str, summary: str, pic: Optional[bytes]):
+        key = str(group_id)
+        self.entries[key] = {
+            "cursor": message_seq(messages[-1]),
+            "count": count,
+            "model": model,
+            "summary": summary,
+            "time": time.time(),
+        }
+        if pic:
+            self.pictures[key] = pic
+        else:
+            self.pictures.pop(key, None)
+        self.save()
@@ -0,0 +1,30 @@
+import re
+from typing import List
+
+# 中日韩文字大约一字一个 token，其余字符大约四个一个 token
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def split_chunks(lines: List[str], max_tokens: int) -> List[List[str]]:
+    """按顺序把行打包成若干块，每块估算的 token 数不超过 max_tokens
+
+    单独一行就超过上限时自成一块，不做截断。
+    """
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for line in lines:
+        tokens = estimate_tokens(line) + 1
+        if current and size + tokens > max_tokens:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += tokens
+    if current:
+        chunks.append(current)
+    return chunks
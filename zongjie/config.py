@@ -6,3 +6,13 @@ class Config(BaseModel):
     zongjie_model: str = "gpt-4o-mini"
     zongjie_api_type: str = "openai"  # openai 或 gemini
     zongjie_history_count: int = 150
+    # 单次最多总结的消息条数（“总结 今天” 也受此限制）
+    zongjie_max_count: int = 5000
+    # 超过这个估算 token 数时分段并发总结，再合并
+    zongjie_chunk_tokens: int = 6000
+    zongjie_chunk_concurrency: int = 8
+    # 总结缓存：相同请求在 repeat_window 秒内直接返回上次的图片，
+    # 上次总结在 incremental_window 秒内时只总结新消息并与之合并
+    zongjie_cache_path: str = "data/zongjie/cache.json"
+    zongjie_repeat_window: int = 300
+    zongjie_incremental_window: int = 21600